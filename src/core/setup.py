@@ -79,5 +79,10 @@ setup(
         "matplotlib",
         "pyLDAvis",
     ],
+    extras_require={
+        "zstd": ["zstandard"],  # zstd compressed sinklog segments and archives
+        "fastjsonschema": ["fastjsonschema"],  # yaada.schema.fast_validation
+        "parquet": ["pyarrow>=14"],  # parquet export/import
+    },
     include_package_data=True,
 )
@@ -22,6 +22,7 @@ import logging
 import re
 
 import chardet
+import chardet.universaldetector
 import tika
 from tika import parser
 
@@ -33,6 +34,16 @@ logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
 
 
+def detect_encoding(f, chunk_size=64 * 1024):
+    # feed the detector incrementally, it usually settles well before the end
+    detector = chardet.universaldetector.UniversalDetector()
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        detector.feed(chunk)
+        if detector.done:
+            break
+    return detector.close()
+
+
 class ArtifactExtractTextContent(YAADAPipelineProcessor):
     def process(self, context, parameters, doc):
         target = parameters["target"]
@@ -55,23 +66,22 @@ class ArtifactExtractTextContent(YAADAPipelineProcessor):
                 ) or any(
                     (re.match(regex, blob["filename"]) for regex in accept_regexes)
                 ):
-                    tf = context.ob_service.fetch_file_to_temp(blob["remote_file_path"])
                     try:
-                        if encoding:
-                            # rawdata = tf.read()
-                            # content = rawdata.decode(encoding)
-                            content = io.TextIOWrapper(tf, encoding=encoding).read()
-                        else:
-                            rawdata = tf.read()
-                            detected_encoding = chardet.detect(rawdata)
-                            context.status["detected_encoding"] = detected_encoding
-                            tf.seek(0)
-                            content = io.TextIOWrapper(
-                                tf,
-                                encoding=detected_encoding["encoding"],
-                                errors="ignore",
-                            ).read()
-                            blob["content"] = content
+                        with context.ob_service.open_artifact(
+                            blob["remote_file_path"]
+                        ) as f:
+                            if encoding:
+                                content = io.TextIOWrapper(f, encoding=encoding).read()
+                            else:
+                                detected_encoding = detect_encoding(f)
+                                context.status["detected_encoding"] = detected_encoding
+                                f.seek(0)
+                                content = io.TextIOWrapper(
+                                    f,
+                                    encoding=detected_encoding["encoding"],
+                                    errors="ignore",
+                                ).read()
+                        blob["content"] = content
                         if len(doc["artifacts"][artifact_type]) == 1:
                             doc[target] = blob["content"]
 
@@ -112,9 +122,12 @@ class ArtifactExtractWithTika(YAADAPipelineProcessor):
                 ) or any(
                     (re.match(regex, blob["filename"]) for regex in accept_regexes)
                 ):
-                    tf = context.ob_service.fetch_file_to_temp(blob["remote_file_path"])
                     try:
-                        parsed = parser.from_file(tf.name, tika_endpoint)
+                        # the artifact is streamed straight through to tika
+                        with context.ob_service.open_artifact(
+                            blob["remote_file_path"]
+                        ) as f:
+                            parsed = parser.from_buffer(f, tika_endpoint)
                         blob["tika"] = parsed
                         c = parsed.get("content", "")
                         if c:
@@ -18,6 +18,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import logging
+import threading
 import time
 import uuid as _uuid
 from datetime import datetime
@@ -28,8 +29,10 @@ from yaada.core import analytic, default_log_level, utility
 from yaada.core.analytic.execution import async_exec_analytic, sync_exec_analytic
 from yaada.core.analytic.pipeline import make_pipeline
 from yaada.core.analytic.plugin import register_context_plugins
+from yaada.core.analytic.preload import preload as preload_context
 from yaada.core.config import YAADAConfig
-from yaada.core.infrastructure import modelservice
+from yaada.core.infrastructure import changefeed, modelservice
+from yaada.core.infrastructure.modelmanager import publish_model_updated
 from yaada.core.infrastructure.providers import (
     make_document_service,
     make_external_mqtt_service,
@@ -38,6 +41,7 @@ from yaada.core.infrastructure.providers import (
     make_objectstorage_service,
 )
 from yaada.core.infrastructure.providers.mqtt import BufferedStream
+from yaada.core.infrastructure.providers.objectstorage import artifact_ref
 from yaada.core.schema import SchemaManager
 from yaada.core.utility import prepare_doc_for_insert
 
@@ -108,6 +112,10 @@ class AnalyticContext:
         self.results_in_status = False
         self.migration = None
         self._connect_to_services = connect_to_services
+        # set once configured models are preloaded and the pipelines warmed up
+        self.ready = threading.Event()
+        # while the pipelines are warmed up, results and deletes are dropped
+        self.warming_up = False
 
         if self._connect_to_services:
             if self.msg_service is None:
@@ -199,6 +207,7 @@ class AnalyticContext:
             connect_to_services=self._connect_to_services,
             overrides=self.overrides,
         )
+        c.ready = self.ready
         c.status["parent"] = dict(
             analytic_name=self.analytic_name,
             analytic_session_id=self.analytic_session_id,
@@ -245,6 +254,7 @@ class AnalyticContext:
             # each batch is fully realized and has sentinel applied if necessary
             doc_dict = {}
             batch_to_store = []
+            prepared = []
             for doc in batch:
                 doc = prepare_doc_for_insert(
                     doc,
@@ -255,16 +265,19 @@ class AnalyticContext:
                 )
                 if process:
                     doc = self.document_pipeline.process_document(doc)
-                if validate:
-                    try:
-                        self.schema_manager.validate_document(doc)
-                    except jsonschema.exceptions.ValidationError as e:
-                        self.doc_service.write_ingest_error(
-                            "jsonschema", dict(doc=doc, error=str(e))
-                        )
-                        if raise_ingest_error:
-                            raise e
-                        continue
+                prepared.append(doc)
+            if validate:
+                errors = self.schema_manager.validate_documents(prepared)
+            else:
+                errors = [None] * len(prepared)
+            for doc, error in zip(prepared, errors):
+                if error is not None:
+                    self.doc_service.write_ingest_error(
+                        "jsonschema", dict(doc=doc, error=str(error))
+                    )
+                    if raise_ingest_error:
+                        raise error
+                    continue
 
                 batch_to_store.append(doc)
                 doc_dict[(doc["doc_type"], doc["_id"])] = doc
@@ -274,13 +287,15 @@ class AnalyticContext:
             docs_flushed = self.doc_service.store_batch(
                 batch_to_store, raise_ingest_error=raise_ingest_error, refresh=refresh
             )
+            sinklog_batch = []
             for doc_type, _id in docs_flushed:
                 if (doc_type, _id) in doc_dict:
-                    self.msg_service.publish_sinklog(doc_dict[(doc_type, _id)])
+                    sinklog_batch.append(doc_dict[(doc_type, _id)])
                 else:
                     logger.error(
                         f"{(doc_type,_id)} not found in doc_dict {doc_dict.keys()}"
                     )
+            self.msg_service.publish_sinklog_batch(sinklog_batch)
 
             if barrier:
                 for doc_type, _id in docs_flushed:
@@ -316,7 +331,6 @@ class AnalyticContext:
                 doc, self.analytic_name, self.analytic_session_id, upsert
             )
             if validate:
-                self.schema_manager.validate_document(doc)
                 try:
                     self.schema_manager.validate_document(doc)
                 except jsonschema.exceptions.ValidationError as e:
@@ -325,6 +339,7 @@ class AnalyticContext:
                     )
                     if raise_ingest_error:
                         raise e
+                    continue
             if barrier:
                 docs_to_wait_for.append((doc["doc_type"], doc["_id"]))
             if process:
@@ -353,7 +368,7 @@ class AnalyticContext:
         raise_ingest_error=True,
         validate=True,
     ):
-        if docs is None:
+        if docs is None or self.warming_up:
             return
         if utility.isiterable(docs):
             _docs = docs
@@ -616,6 +631,93 @@ class AnalyticContext:
             yield d
         self.report_status()
 
+    def changes(
+        self,
+        doc_types,
+        since=None,
+        consumer=None,
+        batch_size=1000,
+        settle_seconds=5,
+        source=None,
+        overlap_seconds=None,
+    ):
+        """
+        Returns a generator of batches of documents that changed, in the order they were written, so that
+        downstream systems can be kept in sync incrementally instead of re-querying everything.
+
+        Changes are tracked through the ``@updated`` stamp applied when documents are ingested. Each batch is a
+        list of documents of a single doc_type with an ``offset`` attribute that can be passed back as ``since``
+        to resume right after that batch.
+
+        ``@updated`` is stamped by the writer before a document goes through the ingest pipeline, so documents can
+        become visible out of stamp order. Resuming from an offset re-reads the last ``overlap_seconds`` before
+        it and skips the documents already delivered, so that late documents are still picked up. Documents
+        written with ``archive=True`` keep the ``@updated`` they were exported with (or none at all), so a
+        restored archive only shows up as changes to consumers whose offsets are older than those stamps.
+
+        Parameters:
+
+          * **doc_types: str or list**
+
+            The doc_type(s) to follow.
+
+          * **since: dict, datetime or str, default=None**
+
+            optional
+
+            Where to start. Either the ``offset`` of a previous batch, or a datetime/ISO timestamp to read all
+            changes at or after. If omitted, reading resumes from the persisted offsets of ``consumer``, or starts
+            from the beginning.
+
+          * **consumer: str, default=None**
+
+            optional
+
+            A name for the consumer. When given, offsets are persisted in OpenSearch every time the next batch
+            is requested, so a later call resumes where this one left off.
+
+          * **batch_size: int, default=1000**
+
+            optional
+
+          * **settle_seconds: int, default=5**
+
+            optional
+
+            Changes newer than this are left for the next call since they may still be making their way
+            through the ingest pipeline.
+
+          * **source: list, default=None**
+
+            optional
+
+            A list of fields to return for each document.
+
+          * **overlap_seconds: float, default=None**
+
+            optional
+
+            How far back before an offset to re-read when resuming. Defaults to the
+            ``yaada.opensearch.changefeed.overlap_seconds`` setting.
+
+        """
+        if overlap_seconds is None:
+            overlap_seconds = self.config.changefeed_overlap_seconds
+        for batch in changefeed.changes(
+            self.doc_service,
+            doc_types,
+            since=since,
+            consumer=consumer,
+            batch_size=batch_size,
+            settle_seconds=settle_seconds,
+            source=source,
+            overlap_seconds=overlap_seconds,
+        ):
+            for doc in batch:
+                self._count_input(batch.doc_type)
+            yield batch
+        self.report_status()
+
     def paged_query(
         self,
         doc_type,
@@ -848,7 +950,7 @@ class AnalyticContext:
             query = {"query": {"match_all": {}}}
         self.doc_service.delete_by_query(doc_type, query)
 
-    def delete(self, doc_type, id):
+    def delete(self, doc_type, id, missing_ok=False):
         """
         Delete a single document in OpenSearch.
 
@@ -862,6 +964,10 @@ class AnalyticContext:
 
             Identifier of document in OpenSearch.
 
+          * **missing_ok: bool, default=False**
+
+            When ``True``, deleting a document that doesn't exist is not an error.
+
         Example:
 
         .. code-block:: python
@@ -869,7 +975,9 @@ class AnalyticContext:
             context.delete("Publication", "b0e062ac-0e84-40db-8ecd-36e1aa0e264b")
 
         """
-        self.doc_service.delete(doc_type, id)
+        if self.warming_up:
+            return
+        self.doc_service.delete(doc_type, id, missing_ok=missing_ok)
 
     def delete_index(self, doc_type, initialize_index=True):
         """
@@ -891,6 +999,10 @@ class AnalyticContext:
 
     def save_model_instance(self, model):
         modelservice.save_model_instance(self.ob_service, model)
+        if self.msg_service is not None:
+            publish_model_updated(
+                self.msg_service, model.model_name, model.model_instance_id
+            )
         self.status["model_name"] = model.model_name
         self.status["model_instance_id"] = model.model_instance_id
 
@@ -1280,6 +1392,9 @@ class AnalyticContext:
     def fetch_file_to_temp(self, remote_file_path):
         return self.ob_service.fetch_file_to_temp(remote_file_path)
 
+    def open_artifact(self, remote_file_path, read_ahead=None):
+        return self.ob_service.open_artifact(remote_file_path, read_ahead)
+
     def fetch_file_to_directory(self, remote_file_path, local_dir, filename):
         return self.ob_service.fetch_file_to_directory(
             remote_file_path, local_dir, filename
@@ -1292,6 +1407,21 @@ class AnalyticContext:
             doc, artifact_type, cache_dir
         )
 
+    def artifact_directory(self, doc, artifact_type):
+        """
+        Context manager yielding a temporary directory with the files of an artifact, served from the
+        artifact cache, or None if ``doc`` has no such artifact. The files are read only and the
+        directory is removed on exit. Unlike ``fetch_artifact_to_directory`` nothing is kept around.
+
+        Example:
+
+        .. code-block:: python
+
+            with context.artifact_directory(doc, "model") as local_dir:
+                model = load(local_dir)
+        """
+        return self.ob_service.artifact_directory(doc, artifact_type)
+
     def save_artifact(self, doc, artifact_type, filename, file):
         return self.ob_service.save_artifact(doc, artifact_type, filename, file)
 
@@ -1300,6 +1430,59 @@ class AnalyticContext:
             doc, artifact_type, local_dir, re_skip_matches
         )
 
+    def rebuild_blob_refs(self, doc_type="*"):
+        """
+        Record the references of every content-addressed artifact of ``doc_type`` on its blob. Only needed
+        once for artifacts saved before references were recorded, ahead of the first ``collect_blob_garbage``.
+        Returns the number of references written.
+        """
+        count = 0
+        query = {"query": {"exists": {"field": "artifacts"}}}
+        for doc in self.query(doc_type, query, source=["doc_type", "id", "artifacts"]):
+            for artifact_type, blobs in doc["artifacts"].items():
+                for blob in blobs:
+                    if "sha256" in blob:
+                        ref = artifact_ref(doc, artifact_type, blob["filename"])
+                        self.ob_service.add_blob_ref(blob["sha256"], ref)
+                        count += 1
+        return count
+
+    def collect_blob_garbage(self, min_age_seconds=3600, dry_run=False):
+        """
+        Delete content-addressed artifact blobs that no document references anymore. A recorded reference
+        is live while its document still lists a blob with that filename and sha256 under that artifact
+        type; references to deleted or changed documents are removed along the way.
+
+        Parameters:
+
+          * **min_age_seconds: int, default=3600**
+
+            Blobs and references recorded more recently than this are kept even without a live reference,
+            since references are recorded before their document is saved. Should comfortably exceed the
+            time it takes a saved document to become searchable.
+
+          * **dry_run: bool, default=False**
+
+            Only count what would be deleted.
+
+        Returns a dict with the number of ``blobs`` seen, the blobs ``deleted`` and the ``stale_refs``.
+        """
+
+        def is_live(ref, digest):
+            doc = self.doc_service.get(
+                ref["doc_type"], ref["_id"], _source_include=["artifacts"]
+            )
+            if doc is None:
+                return False
+            return any(
+                blob.get("filename") == ref["filename"] and blob.get("sha256") == digest
+                for blob in doc.get("artifacts", {}).get(ref["artifact_type"], [])
+            )
+
+        return self.ob_service.collect_blob_garbage(
+            is_live, min_age_seconds=min_age_seconds, dry_run=dry_run
+        )
+
     def finalize(self):
         self.msg_service.disconnect()
 
@@ -1352,6 +1535,7 @@ def make_analytic_context(
     schema_manager=None,
     connect_to_services=True,
     overrides={},
+    preload=False,
 ):
     """
     Return an instance of the context object. A context object is needed to
@@ -1412,6 +1596,13 @@ def make_analytic_context(
       optional
 
       Allows an override to environment variables and settings in a service.
+    * **preload=False**
+
+      optional
+
+      When ``True``, the models listed under ``yaada.models.preload`` are loaded and a warm-up document is run
+      through each pipeline before returning. ``context.ready`` is set once that completes.
+      Long-running services opt in by passing the ``yaada.models.preload.enabled`` setting.
 
     Here is an example of what is needed to get started using the ``context object``
 
@@ -1446,6 +1637,11 @@ def make_analytic_context(
     if init_pipelines:
         context.init_pipeline()
 
+    if preload:
+        preload_context(context, warmup=init_pipelines)
+    else:
+        context.ready.set()
+
     end_t = time.time()
     logger.info(f"##context creation took {end_t-start_t} seconds")
     return context
@@ -44,6 +44,8 @@ class ModelBase(ABC):
         self.artifacts["Manifest"] = "Manifest/manifest.json"
         self.subscribed_events = []
         self.subscribe_events(subscribe_events)
+        # mmap mode for load_artifacts to memory map large arrays with, eg "r"
+        self.mmap = None
 
     @abstractmethod
     def save_artifacts(self, path):
@@ -54,8 +56,9 @@ class ModelBase(ABC):
         pass
 
     @classmethod
-    def load(cls, path, instance_id):
+    def load(cls, path, instance_id, mmap=None):
         instance = cls(instance_id)
+        instance.mmap = mmap
         path = os.path.join(path, f"{instance.name}/{instance.instance_id}")
         instance._load_manifest(path)
         instance._load_events(path)
@@ -70,6 +73,13 @@ class ModelBase(ABC):
         self._save_manifest(path)
         return path
 
+    def memory_footprint(self):
+        # Override to report the approximate number of bytes this model holds in
+        # memory. The ModelManager uses it to charge the model against the model
+        # cache's byte budget, and falls back to measuring the process RSS
+        # growth while loading when this returns None.
+        return None
+
     def on_event(self, event: Event):
         logger.warning(
             f"Received event {event.name} in ModelBase. Implement the on_event() method in child class to handle events.",
@@ -0,0 +1,110 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import logging
+import os
+import time
+
+from yaada.core import default_log_level
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+WARMUP_ID = "_warmup"
+
+
+def preload_models(context):
+    """Load the models listed under ``yaada.models.preload`` into the context's
+    model manager, and the listed spaCy packages into yaada.nlp's cache."""
+    config = context.config
+    model_manager = context.get_model_manager()
+    if model_manager is not None:
+        for m in config.yaada_models_preload_models:
+            start = time.time()
+            model = model_manager.load_model_instance(m["name"], m["instance_id"])
+            if model is None:
+                logger.warning(f"preload: no model {m['name']}/{m['instance_id']}")
+                continue
+            if m.get("unevictable", False):
+                model_manager.mark_model_unevictable(model.__class__, m["instance_id"])
+            logger.info(
+                f"preload: loaded {m['name']}/{m['instance_id']} in {time.time() - start:.1f} seconds"
+            )
+
+    if len(config.yaada_models_preload_spacy) > 0:
+        try:
+            from yaada.nlp.spacy import spacy_nlp
+        except ImportError:
+            logger.warning("preload: spaCy packages listed but yaada-nlp not installed")
+            return
+        for package in config.yaada_models_preload_spacy:
+            start = time.time()
+            spacy_nlp(package)
+            logger.info(
+                f"preload: loaded spaCy {package} in {time.time() - start:.1f} seconds"
+            )
+
+
+def warmup_document(doc_type, steps, text):
+    # fill the source field of every processing step with the warm-up text
+    doc = dict(doc_type=doc_type, _id=WARMUP_ID, id=WARMUP_ID)
+    for step in steps:
+        source = step.parameters.get("source", None)
+        if isinstance(source, str) and source not in doc:
+            doc[source] = text
+    return doc
+
+
+def warmup_pipelines(context):
+    """Run a throwaway document through each pipeline so that lazily initialized
+    state is built before real documents arrive. While ``context.warming_up`` is
+    set, the documents and deletes processors send through the context are
+    dropped. Processors that write anywhere else, like object storage, must
+    check it themselves. The context's analytic name, session id and status are
+    restored afterwards."""
+    pipeline = context.document_pipeline
+    saved = (context.analytic_name, context.analytic_session_id, context.status)
+    context.warming_up = True
+    try:
+        for doc_type, steps in pipeline.document_pipelines.items():
+            start = time.time()
+            text = context.config.yaada_models_warmup_text
+            pipeline.process_document(warmup_document(doc_type, steps, text))
+            logger.info(
+                f"preload: warmed up {doc_type} pipeline in {time.time() - start:.1f} seconds"
+            )
+    finally:
+        context.warming_up = False
+        context.analytic_name, context.analytic_session_id, context.status = saved
+
+
+def preload(context, warmup=True):
+    """Preload models, warm up the pipelines, then flag the context as ready."""
+    ready_file = context.config.yaada_models_ready_file
+    if ready_file is not None and os.path.exists(ready_file):
+        # left over from a previous run, it must not signal readiness too early
+        os.remove(ready_file)
+    preload_models(context)
+    if warmup and context.config.yaada_models_warmup:
+        warmup_pipelines(context)
+    context.ready.set()
+    if ready_file is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(ready_file)), exist_ok=True)
+        with open(ready_file, "w") as f:
+            f.write(f"{time.time()}\n")
@@ -40,7 +40,7 @@ from yaada.core.cli.project import Project
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
 def save_tar(destination, doc_type, query, scroll, scroll_size, skip_artifacts, env):
-    """Save data to tarball"""
+    """Save data to a tarball (.tar, .tgz/.tar.gz or .tar.zst)"""
     project = Project(env=env)
     from yaada.core.analytic.context import make_analytic_context
 
@@ -83,7 +83,7 @@ def save_tar(destination, doc_type, query, scroll, scroll_size, skip_artifacts,
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
 def load_tar(source, process, not_sync, env):
-    """Load data from tarball"""
+    """Load data from a tarball (.tar, .tgz/.tar.gz or .tar.zst)"""
     project = Project(env=env)
     from yaada.core.analytic.context import make_analytic_context
 
@@ -103,10 +103,32 @@ def load_tar(source, process, not_sync, env):
 @click.option("--scroll", type=click.STRING, default="24h")
 @click.option("--scroll-size", type=click.INT, default=100)
 @click.option("--skip-artifacts", is_flag=True, default=False)
+@click.option(
+    "--checkpoint",
+    is_flag=True,
+    default=False,
+    help="Periodically save progress next to the destination so a failed run can be resumed.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume from the checkpoint of a previous run, implies --checkpoint.",
+)
 @click.option(
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
-def save_dir(destination, doc_type, query, scroll, scroll_size, skip_artifacts, env):
+def save_dir(
+    destination,
+    doc_type,
+    query,
+    scroll,
+    scroll_size,
+    skip_artifacts,
+    checkpoint,
+    resume,
+    env,
+):
     """Create a data archive directory containing documents data and binary artifacts based on query"""
     project = Project(env=env)
     from yaada.core.analytic.context import make_analytic_context
@@ -123,6 +145,8 @@ def save_dir(destination, doc_type, query, scroll, scroll_size, skip_artifacts,
         scroll=scroll,
         scroll_size=scroll_size,
         include_artifacts=not skip_artifacts,
+        checkpoint=checkpoint,
+        resume=resume,
     )
 
 
@@ -174,11 +198,55 @@ def load_dir(source, process, not_sync, env):
 @click.option("--query", type=click.STRING, default='{"query":{"match_all":{}}}')
 @click.option("--scroll", type=click.STRING, default="24h")
 @click.option("--scroll-size", type=click.INT, default=100)
+@click.option(
+    "--shards",
+    type=click.INT,
+    default=None,
+    help="Export in parallel into this many <destination>-NNNN.ldjson.zst files plus a manifest.",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["zstd", "gzip", "none"]),
+    default="zstd",
+    show_default=True,
+    help="Compression of the shard files when using --shards.",
+)
+@click.option(
+    "--compression-level",
+    type=click.INT,
+    default=None,
+    help="gzip/zstd compression level, defaults to 6 for gzip and 3 for zstd.",
+)
+@click.option(
+    "--checkpoint",
+    is_flag=True,
+    default=False,
+    help="Periodically save progress next to the destination so a failed run can be resumed.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume from the checkpoint of a previous run, implies --checkpoint.",
+)
 @click.option(
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
-def save_ldjson(destination, doc_type, query, scroll, scroll_size, env):
-    """Export documents to an ldjson file"""
+def save_ldjson(
+    destination,
+    doc_type,
+    query,
+    scroll,
+    scroll_size,
+    shards,
+    compression,
+    compression_level,
+    checkpoint,
+    resume,
+    env,
+):
+    """Export documents to an ldjson file, compressed when the destination ends in
+    .ldjson.gz or .ldjson.zst"""
     project = Project(env=env)
     from yaada.core.analytic.context import make_analytic_context
 
@@ -187,7 +255,21 @@ def save_ldjson(destination, doc_type, query, scroll, scroll_size, env):
         "CLI", init_pipelines=False, overrides=project.config
     )
 
-    if destination is not None:
+    if shards is not None:
+        if destination is None:
+            raise click.UsageError("--shards requires a destination")
+        context.migration.save_ldjson_shards(
+            destination,
+            shards=shards,
+            doc_type=doc_type,
+            query=q,
+            scroll=scroll,
+            scroll_size=scroll_size,
+            compression=None if compression == "none" else compression,
+            level=compression_level,
+            resume=resume,
+        )
+    elif destination is not None:
         context.migration.save_ldjson_to_file(
             destination,
             doc_type=doc_type,
@@ -195,6 +277,9 @@ def save_ldjson(destination, doc_type, query, scroll, scroll_size, env):
             scroll=scroll,
             scroll_size=scroll_size,
             binary=True,
+            compression_level=compression_level,
+            checkpoint=checkpoint,
+            resume=resume,
         )
     else:
         context.migration.export_to_ldjson_stream(
@@ -250,8 +335,46 @@ def save_ldjson(destination, doc_type, query, scroll, scroll_size, env):
     default=False,
     help="Don't read whole file into memory. Will not see progress bar at ingest time.",
 )
-def load_ldjson(source, process, not_sync, env, batch_size, no_validate, lazy_load):
-    """Load data from line-delimited json"""
+@click.option(
+    "--processes",
+    "-p",
+    type=click.INT,
+    default=None,
+    help="Load in parallel with this many processes. Implied for a shard manifest.",
+)
+@click.option(
+    "--chunk-mb",
+    type=click.INT,
+    default=64,
+    show_default=True,
+    help="Size of the byte ranges an uncompressed file is split into with --processes.",
+)
+@click.option(
+    "--checkpoint",
+    is_flag=True,
+    default=False,
+    help="Periodically save progress next to the source so a failed run can be resumed.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume from the checkpoint of a previous run, implies --checkpoint.",
+)
+def load_ldjson(
+    source,
+    process,
+    not_sync,
+    env,
+    batch_size,
+    no_validate,
+    lazy_load,
+    processes,
+    chunk_mb,
+    checkpoint,
+    resume,
+):
+    """Load data from line-delimited json, or from the manifest of a sharded export"""
     project = Project(env=env)
     from yaada.core.analytic.context import make_analytic_context
 
@@ -259,7 +382,20 @@ def load_ldjson(source, process, not_sync, env, batch_size, no_validate, lazy_lo
         "CLI", init_pipelines=False, overrides=project.config
     )
 
-    if source is not None:
+    if source is not None and (
+        processes is not None or source.endswith("-manifest.json")
+    ):
+        context.migration.load_ldjson_parallel(
+            source,
+            processes=processes,
+            chunk_size=chunk_mb * 1024 * 1024,
+            process=process,
+            sync=not not_sync,
+            batch_size=batch_size,
+            validate=not no_validate,
+            resume=resume,
+        )
+    elif source is not None:
         context.migration.load_ldjson_from_file(
             source,
             process=process,
@@ -267,6 +403,8 @@ def load_ldjson(source, process, not_sync, env, batch_size, no_validate, lazy_lo
             batch_size=batch_size,
             validate=not no_validate,
             realize=not lazy_load,
+            checkpoint=checkpoint,
+            resume=resume,
         )
     else:
         context.migration.import_from_ldjson_stream(
@@ -279,6 +417,203 @@ def load_ldjson(source, process, not_sync, env, batch_size, no_validate, lazy_lo
         )
 
 
+@common.data.command()
+@click.argument(
+    "destination", type=click.Path(exists=False, writable=True, resolve_path=True)
+)
+@click.option(
+    "--state",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    default=None,
+    help="JSON file holding the @updated watermarks reached by the previous delta.",
+)
+@click.option(
+    "--consumer",
+    type=click.STRING,
+    default=None,
+    help="Keep the watermarks in OpenSearch under this changefeed consumer instead of --state.",
+)
+@click.option(
+    "--doc-type",
+    type=click.STRING,
+    multiple=True,
+    help="Doc types to export, all of them when omitted.",
+)
+@click.option(
+    "--tombstone-query",
+    type=click.STRING,
+    default=None,
+    help='Query clause for deleted documents, e.g. \'{"term":{"deleted":true}}\'.',
+)
+@click.option("--batch-size", type=click.INT, default=1000)
+@click.option(
+    "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
+)
+def save_delta(
+    destination, state, consumer, doc_type, tombstone_query, batch_size, env
+):
+    """Export documents changed since the previous delta export to an ldjson file"""
+    if (state is None) == (consumer is None):
+        raise click.UsageError("exactly one of --state or --consumer is required")
+    project = Project(env=env)
+    from yaada.core.analytic.context import make_analytic_context
+
+    context = make_analytic_context(
+        "CLI", init_pipelines=False, overrides=project.config
+    )
+
+    if tombstone_query is not None:
+        tombstone_query = json.loads(tombstone_query)
+    context.migration.save_ldjson_delta(
+        destination,
+        state=state,
+        consumer=consumer,
+        doc_types=list(doc_type) or None,
+        tombstone_query=tombstone_query,
+        batch_size=batch_size,
+    )
+
+
+@common.data.command()
+@click.argument(
+    "source",
+    type=click.Path(
+        exists=True, readable=True, resolve_path=True, dir_okay=False, file_okay=True
+    ),
+)
+@click.option(
+    "--process",
+    is_flag=True,
+    default=False,
+    help="Run data through ingest pipelines while loading.",
+)
+@click.option(
+    "--async",
+    "not_sync",
+    is_flag=True,
+    default=False,
+    help="Load data through asynchronous ingest pipeline rather than in local cli process.",
+)
+@click.option(
+    "--no-validate",
+    is_flag=True,
+    default=False,
+    help="Disable schema validation during ingest.",
+)
+@click.option(
+    "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
+)
+def load_delta(source, process, not_sync, no_validate, env):
+    """Apply a delta export, updating documents and deleting tombstoned ones"""
+    project = Project(env=env)
+    from yaada.core.analytic.context import make_analytic_context
+
+    context = make_analytic_context(
+        "CLI", init_pipelines=False, overrides=project.config
+    )
+
+    context.migration.load_ldjson_delta(
+        source, process=process, sync=not not_sync, validate=not no_validate
+    )
+
+
+@common.data.command()
+@click.argument(
+    "destination", type=click.Path(exists=False, writable=True, resolve_path=True)
+)
+@click.option("--doc-type", type=click.STRING, default="*")
+@click.option("--query", type=click.STRING, default='{"query":{"match_all":{}}}')
+@click.option("--scroll", type=click.STRING, default="24h")
+@click.option("--scroll-size", type=click.INT, default=1000)
+@click.option("--row-group-size", type=click.INT, default=10000, show_default=True)
+@click.option(
+    "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
+)
+def save_parquet(
+    destination, doc_type, query, scroll, scroll_size, row_group_size, env
+):
+    """Export documents to a directory of <doc_type>.parquet files"""
+    project = Project(env=env)
+    from yaada.core.analytic.context import make_analytic_context
+
+    q = json.loads(query)
+    context = make_analytic_context(
+        "CLI", init_pipelines=False, overrides=project.config
+    )
+
+    context.migration.save_parquet(
+        destination,
+        doc_type=doc_type,
+        query=q,
+        scroll=scroll,
+        scroll_size=scroll_size,
+        row_group_size=row_group_size,
+    )
+
+
+@common.data.command()
+@click.argument(
+    "source",
+    type=click.Path(exists=True, readable=True, resolve_path=True),
+)
+@click.option("--doc-type", type=click.STRING, default="*")
+@click.option(
+    "--columns",
+    type=click.STRING,
+    default=None,
+    help="Comma separated list of fields to load, doc_type and id are always loaded. The fields are merged into existing documents, missing documents are created with only these fields.",
+)
+@click.option(
+    "--process",
+    is_flag=True,
+    default=False,
+    help="Run data through ingest pipelines while loading.",
+)
+@click.option(
+    "--async",
+    "not_sync",
+    is_flag=True,
+    default=False,
+    help="Load data through asynchronous ingest pipeline rather than in local cli process.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="Used for optimizing synchronous ingest speed.",
+)
+@click.option(
+    "--no-validate",
+    is_flag=True,
+    default=False,
+    help="Disable schema validation during ingest.",
+)
+@click.option(
+    "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
+)
+def load_parquet(
+    source, doc_type, columns, process, not_sync, batch_size, no_validate, env
+):
+    """Load data from a parquet file or a directory written by save-parquet"""
+    project = Project(env=env)
+    from yaada.core.analytic.context import make_analytic_context
+
+    context = make_analytic_context(
+        "CLI", init_pipelines=False, overrides=project.config
+    )
+
+    context.migration.load_parquet(
+        source,
+        columns=None if columns is None else columns.split(","),
+        doc_type=doc_type,
+        process=process,
+        sync=not not_sync,
+        batch_size=batch_size,
+        validate=not no_validate,
+    )
+
+
 @common.data.command()
 @click.argument("from_env", type=common.EnvironmentsType())
 @click.argument("to_env", type=common.EnvironmentsType())
@@ -698,11 +1033,27 @@ def s3_upload(bucket_name, local_path, remote_path, env):
 @click.option("--query", type=click.STRING, default='{"query":{"match_all":{}}}')
 @click.option("--scroll", type=click.STRING, default="24h")
 @click.option("--scroll-size", type=click.INT, default=100)
+@click.option(
+    "--compression-level",
+    type=click.INT,
+    default=None,
+    help="gzip/zstd compression level, defaults to 6 for gzip and 3 for zstd.",
+)
 @click.option(
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
-def s3_save_ldjson(bucket_name, remote_path, doc_type, query, scroll, scroll_size, env):
-    """Export documents to an ldjson file"""
+def s3_save_ldjson(
+    bucket_name,
+    remote_path,
+    doc_type,
+    query,
+    scroll,
+    scroll_size,
+    compression_level,
+    env,
+):
+    """Export documents to an ldjson file, compressed when remote_path ends in
+    .ldjson.gz or .ldjson.zst"""
     project = Project(env=env)
     s3_config = project.get_s3_bucket_config(bucket_name)
     from yaada.core.analytic.context import make_analytic_context
@@ -720,6 +1071,7 @@ def s3_save_ldjson(bucket_name, remote_path, doc_type, query, scroll, scroll_siz
         query=q,
         scroll=scroll,
         scroll_size=scroll_size,
+        compression_level=compression_level,
     )
 
 
@@ -39,10 +39,45 @@ from yaada.core.cli.project import Project
 @click.option("--ldjson", "-l", is_flag=True, default=False)
 @click.option("--produce-yaml", "-y", is_flag=True, default=False)
 @click.option("--include-document-base", "-i", is_flag=True, default=False)
+@click.option(
+    "--sample",
+    type=click.INT,
+    default=None,
+    help="only infer from a reservoir sample of this many ldjson documents",
+)
+@click.option(
+    "--stratify",
+    is_flag=True,
+    default=False,
+    help="sample up to --sample documents per doc_type",
+)
+@click.option(
+    "--processes",
+    "-p",
+    type=click.INT,
+    default=None,
+    help="number of processes used for ldjson files (default: cpu count)",
+)
+@click.option("--chunk-mb", type=click.INT, default=64)
+@click.option("--seed", type=click.INT, default=None)
+@click.option("--progress/--no-progress", default=True)
 @click.option(
     "--env", "-e", type=common.EnvironmentsType(), default=None, multiple=True
 )
-def infer(source, doc_type, ldjson, produce_yaml, include_document_base, env):
+def infer(
+    source,
+    doc_type,
+    ldjson,
+    produce_yaml,
+    include_document_base,
+    sample,
+    stratify,
+    processes,
+    chunk_mb,
+    seed,
+    progress,
+    env,
+):
     """Infer a json-schema from file or stdin"""
     project = Project(env=env)
     from yaada.core.config import YAADAConfig
@@ -53,7 +88,14 @@ def infer(source, doc_type, ldjson, produce_yaml, include_document_base, env):
 
     def gen(lines):
         for line in lines:
-            yield json.loads(line.strip())
+            if line.strip():
+                yield json.loads(line.strip())
+
+    def output(s):
+        if produce_yaml:
+            print(yaml_dump(s))
+        else:
+            print(json.dumps(s, indent=2))
 
     def infer(f, is_ldjson, produce_yaml):
         s = None
@@ -67,17 +109,31 @@ def infer(source, doc_type, ldjson, produce_yaml, include_document_base, env):
             )
         else:
             s = sm.json_schema_from_data(
-                gen(f.readlines()),
+                gen(f),
                 # to_json=True,
                 doc_type=doc_type,
                 include_document_base=include_document_base,
+                sample_size=sample,
+                stratify=stratify,
+                seed=seed,
             )
-        if produce_yaml:
-            print(yaml_dump(s))
-        else:
-            print(json.dumps(s, indent=2))
+        output(s)
 
-    if source is not None:
+    if source is not None and ldjson:
+        # files can be split into byte ranges and inferred in parallel
+        s = sm.json_schema_from_ldjson(
+            source,
+            doc_type=doc_type,
+            include_document_base=include_document_base,
+            sample_size=sample,
+            stratify=stratify,
+            processes=processes,
+            chunk_size=chunk_mb * 1024 * 1024,
+            seed=seed,
+            progress=progress,
+        )
+        output(s)
+    elif source is not None:
         with open(source) as f:
             infer(f, ldjson, produce_yaml)
     else:
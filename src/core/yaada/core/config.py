@@ -100,6 +100,9 @@ class YAADAConfig:
             "YAADA_SCHEMA_DIRECTORY", os.path.join(self.project_directory, "schema")
         )
         self.schema_modules = self.hocon.get("yaada.schema.modules", [])
+        self.schema_fast_validation = to_bool(
+            self.hocon.get("yaada.schema.fast_validation", "false")
+        )
         self.tenant = self.hocon.get("yaada.tenant", "default")
         self.data_prefix = self.hocon.get("yaada.data_prefix", "yaada")
 
@@ -126,6 +129,37 @@ class YAADAConfig:
         self.object_storage_make_bucket = to_bool(
             self.hocon.get("yaada.objectstorage.make_bucket", "true")
         )
+        self.object_storage_multipart_threshold = int(
+            self.hocon.get(
+                "yaada.objectstorage.transfer.multipart_threshold", 8 * 1024 * 1024
+            )
+        )
+        self.object_storage_multipart_chunksize = int(
+            self.hocon.get(
+                "yaada.objectstorage.transfer.multipart_chunksize", 8 * 1024 * 1024
+            )
+        )
+        self.object_storage_max_concurrency = int(
+            self.hocon.get("yaada.objectstorage.transfer.max_concurrency", 10)
+        )
+        self.object_storage_transfer_workers = int(
+            self.hocon.get("yaada.objectstorage.transfer.workers", 8)
+        )
+        self.object_storage_read_ahead = int(
+            self.hocon.get("yaada.objectstorage.transfer.read_ahead", 1024 * 1024)
+        )
+        self.object_storage_content_addressed = to_bool(
+            self.hocon.get("yaada.objectstorage.content_addressed", "false")
+        )
+        self.object_storage_cache_directory = self.hocon.get(
+            "yaada.objectstorage.cache.directory", "/tmp/yaada/cache/artifacts"
+        )
+        self.object_storage_cache_max_bytes = int(
+            self.hocon.get("yaada.objectstorage.cache.max_bytes", 10 * 1024**3)
+        )
+        self.object_storage_cache_validate = to_bool(
+            self.hocon.get("yaada.objectstorage.cache.validate", "true")
+        )
         self.message_provider = self.hocon["yaada.message_provider"]
 
         self.opensearch_url = self.hocon["yaada.opensearch.url"]
@@ -148,12 +182,21 @@ class YAADAConfig:
         self.opensearch_password = self.hocon.get(
             "yaada.opensearch.password", None
         )
+        self.changefeed_overlap_seconds = float(
+            self.hocon.get("yaada.opensearch.changefeed.overlap_seconds", 60)
+        )
 
         self.mqtt_hostname = self.hocon["yaada.mqtt.host"]
         self.mqtt_port = int(self.hocon["yaada.mqtt.port"])
         self.mqtt_ingest_topic = self.hocon["yaada.mqtt.topics.ingest"]
         self.mqtt_sink_topic = self.hocon["yaada.mqtt.topics.sink"]
         self.mqtt_sinklog_topic = self.hocon["yaada.mqtt.topics.sinklog"]
+        self.mqtt_retained_drain_seconds = float(
+            self.hocon.get("yaada.mqtt.retained_drain_seconds", 10)
+        )
+        self.mqtt_sinklog_batches = to_bool(
+            self.hocon.get("yaada.mqtt.sinklog_batches", "false")
+        )
         self.mqtt_event_topic = self.hocon.get("yaada.mqtt.topics.sinklog", "event")
 
         self.ingest_buff_size = int(self.hocon["yaada.ingest.buffer.size"])
@@ -161,8 +204,44 @@ class YAADAConfig:
             self.hocon["yaada.ingest.buffer.timeout"]
         )
         self.ingest_workers = int(self.hocon["yaada.ingest.workers"])
+        self.ingest_processes = int(self.hocon.get("yaada.ingest.processes", 1))
+        self.ingest_sink_retries = int(self.hocon.get("yaada.ingest.sink_retries", 3))
         self.analytic_workers = int(self.hocon.get("yaada.analytic.workers", 10))
+        self.analytic_processes = int(self.hocon.get("yaada.analytic.processes", 1))
         self.yaada_model_cache_size = int(self.hocon["yaada.modelcache.size"])
+        self.yaada_model_cache_max_bytes = int(
+            self.hocon.get("yaada.modelcache.max_bytes", 0)
+        )
+        self.yaada_models_archive_format = self.hocon.get(
+            "yaada.models.archive_format", "tar"
+        )
+        self.yaada_models_directory = self.hocon.get(
+            "yaada.models.directory", "/tmp/yaada/models"
+        )
+        self.yaada_models_mmap = self.hocon.get("yaada.models.mmap", "r") or None
+        self.yaada_models_max_bytes = int(self.hocon.get("yaada.models.max_bytes", 0))
+        self.yaada_models_reload_on_update = to_bool(
+            self.hocon.get("yaada.models.reload_on_update", "false")
+        )
+        self.yaada_models_preload = to_bool(
+            self.hocon.get("yaada.models.preload.enabled", "false")
+        )
+        self.yaada_models_preload_models = [
+            dict(m) for m in self.hocon.get("yaada.models.preload.models", [])
+        ]
+        self.yaada_models_preload_spacy = list(
+            self.hocon.get("yaada.models.preload.spacy", [])
+        )
+        self.yaada_models_warmup = to_bool(
+            self.hocon.get("yaada.models.preload.warmup", "true")
+        )
+        self.yaada_models_warmup_text = self.hocon.get(
+            "yaada.models.preload.warmup_text",
+            "YAADA warm-up document written in Boston, Massachusetts on 1 January 2024.",
+        )
+        self.yaada_models_ready_file = (
+            self.hocon.get("yaada.models.preload.ready_file", "") or None
+        )
 
         self.yaada_load_analytics = os.getenv("YAADA_LOAD_ANALYTICS", None)
         self.yaada_analytics = self.hocon["yaada.analytics"]
@@ -26,6 +26,12 @@ import time
 from yaada.core import utility
 from yaada.core.analytic.context import make_analytic_context
 from yaada.core.analytic.pipeline import make_pipeline
+from yaada.core.config import YAADAConfig
+from yaada.core.infrastructure.prefork import (
+    fork_workers,
+    prepare_for_fork,
+    reconnect_after_fork,
+)
 
 
 # adapted from https://julien.danjou.info/atomic-lock-free-counters-in-python/
@@ -58,14 +64,12 @@ def process_document(doc, pipeline, msg_service, counter):
     msg_service.delete_retained_topic(doc["_topic"])
 
 
-if __name__ == "__main__":
-    ANALYTIC_NAME = "ingest_pipeline_worker"
-    ANALYTIC_SESSION_ID = "0"
-    context = make_analytic_context(ANALYTIC_NAME, ANALYTIC_SESSION_ID)
+def serve(context, pipeline, shared_group=None, drain_retained=False):
     msg_service = context.msg_service
-    msg_service.subscribe_ingest()
+    msg_service.subscribe_ingest(
+        shared_group=shared_group, drain_retained=drain_retained
+    )
 
-    pipeline = make_pipeline(context)
     print(f"INGEST_BUFF_SIZE={context.config.ingest_buff_size}")
     print("Ready for ingest...")
     received_count = 0
@@ -114,3 +118,35 @@ if __name__ == "__main__":
                 time.sleep(0.1)
                 processed_count = processed_counter.value()
                 backlog = received_count - processed_count
+
+
+if __name__ == "__main__":
+    ANALYTIC_NAME = "ingest_pipeline_worker"
+    ANALYTIC_SESSION_ID = "0"
+    config = YAADAConfig()
+    processes = config.ingest_processes
+    context = make_analytic_context(
+        ANALYTIC_NAME,
+        ANALYTIC_SESSION_ID,
+        config=config,
+        preload=True if processes > 1 else config.yaada_models_preload,
+    )
+    pipeline = make_pipeline(context)
+
+    if processes <= 1:
+        serve(context, pipeline)
+    else:
+        # the pipelines and their models are loaded once in this process, the
+        # forked workers inherit them copy-on-write and each take a share of
+        # the ingested documents
+        prepare_for_fork(context)
+        shared_group = f"{config.data_prefix}-{config.tenant}-ingest-pipeline"
+
+        def worker_main(index):
+            reconnect_after_fork(context, f"ingest-pipeline-{index}")
+            # the first worker also picks up the documents retained before startup
+            serve(
+                context, pipeline, shared_group=shared_group, drain_retained=index == 0
+            )
+
+        fork_workers(processes, worker_main)
@@ -38,34 +38,54 @@ if __name__ == "__main__":
 
     doc_service.init_indexes()
     total = 0
+    # (document, failed attempts) of the documents that failed to flush, they are
+    # retried in the following cycles
+    retry = []
 
     while True:
-        docs = []
-
         fetched = msg_service.fetch(max_count=config.ingest_buff_size)
 
-        count = len(fetched)
-
-        # print(f"fetched {count}")
+        if len(fetched) == 0 and len(retry) == 0:
+            continue
 
-        for i in range(len(fetched)):
-            doc = fetched[i]
+        # one cycle per fetched batch: enqueue everything, flush once, then ack and
+        # sinklog only the documents that actually made it into opensearch.
+        docs = retry + [(doc, 0) for doc in fetched]
+        retry = []
+        pending = {}
+        rejected = []
+        for doc, attempts in docs:
+            if doc_service.doc_is_valid(doc):
+                key = (doc["doc_type"], doc["_id"])
+                pending.setdefault(key, []).append((doc, attempts))
+            else:
+                # invalid documents land in the ingest error index and can never
+                # be flushed, so they are acked rather than left retained.
+                rejected.append(doc)
             doc_service.enqueue_document(doc)
-            if doc_service.is_time_to_flush():
-                doc_service.flush_documents()
-            total = total + 1
-        # print(f"trying to flush")
-        doc_service.flush_documents(raise_ingest_error=False)
-        # print(f"acking")
-        for i in range(len(fetched)):
-            doc = fetched[i]
-            # print(f'acking {i}')
-            msg_service.delete_retained_topic(doc["_topic"])
-            msg_service.publish_sinklog(doc)
-        if count > 0:
-            print(f"flushed {total} documents total")
-        # status = dict()
-        # status['@timestamp'] = datetime.utcnow()
-        # status['count'] = len(docs)
-        # if status['count'] > 0:
-        #   doc_service.send_ingest_status(status)
+
+        flushed_ids = doc_service.flush_documents(raise_ingest_error=False)
+
+        flushed = [
+            doc for key in flushed_ids if key in pending for doc, _ in pending[key]
+        ]
+        msg_service.delete_retained_topics(
+            [doc["_topic"] for doc in flushed + rejected]
+        )
+        msg_service.publish_sinklog_batch(flushed)
+
+        total = total + len(flushed)
+        given_up = 0
+        for key, failed in pending.items():
+            if key in flushed_ids:
+                continue
+            for doc, attempts in failed:
+                if attempts < config.ingest_sink_retries:
+                    retry.append((doc, attempts + 1))
+                else:
+                    given_up += 1
+        if len(retry) > 0:
+            print(f"{len(retry)} documents failed to flush and are retried")
+        if given_up > 0:
+            print(f"{given_up} documents failed to flush and remain retained")
+        print(f"flushed {total} documents total")
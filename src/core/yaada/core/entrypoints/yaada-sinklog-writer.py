@@ -19,46 +19,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
-import json
 import os
+import signal
 import sys
-from datetime import datetime
 
-from yaada.core import utility
 from yaada.core.config import YAADAConfig
 from yaada.core.infrastructure.providers import make_message_service
-
-
-class TimestampedAppender:
-    def __init__(self, output, basename):
-        self.output = output
-        self.basename = basename
-        self.current_output_file_path = ""
-        self.current_output_file = None
-
-    def open_output_file(self):
-        self.current_output_file = open(self.current_output_file_path, "a")
-
-    def get_current_output(self):
-        ts = datetime.now().strftime("%Y%m%d")
-        path = os.path.join(self.output, f"{self.basename}-{ts}.ldjson")
-
-        if self.current_output_file_path == "":
-            self.current_output_file_path = path
-            self.open_output_file()
-        elif self.current_output_file_path == path:
-            pass
-        else:
-            self.current_output_file.close()
-            self.current_output_file_path = path
-            self.open_output_file()
-        return self.current_output_file
-
-    def append(self, data: dict):
-        out = self.get_current_output()
-        out.write(json.dumps(data, cls=utility.DateTimeEncoder) + "\n")
-        out.flush()
-
+from yaada.core.infrastructure.sinklog import SinklogWriter
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -80,6 +47,39 @@ if __name__ == "__main__":
         required=False,
         default="sinklog",
     )
+    parser.add_argument(
+        "-c",
+        "--compression",
+        dest="compression",
+        help="Compression used for sinklog segments",
+        required=False,
+        choices=["gzip", "zstd"],
+        default="gzip",
+    )
+    parser.add_argument(
+        "--max-segment-mb",
+        dest="max_segment_mb",
+        help="Rotate to a new segment once the current one reaches this size",
+        required=False,
+        type=int,
+        default=256,
+    )
+    parser.add_argument(
+        "--flush-kb",
+        dest="flush_kb",
+        help="Write a compressed block once this much data is buffered",
+        required=False,
+        type=int,
+        default=1024,
+    )
+    parser.add_argument(
+        "--flush-interval",
+        dest="flush_interval",
+        help="Maximum number of seconds documents stay buffered",
+        required=False,
+        type=float,
+        default=5.0,
+    )
 
     args = parser.parse_args()
     abspath = os.path.abspath(args.output)
@@ -97,12 +97,25 @@ if __name__ == "__main__":
 
     msg_service.subscribe_sinklog()
 
-    appender = TimestampedAppender(abspath, args.basename)
+    writer = SinklogWriter(
+        abspath,
+        basename=args.basename,
+        compression=args.compression,
+        max_segment_bytes=args.max_segment_mb * 1024 * 1024,
+        flush_bytes=args.flush_kb * 1024,
+        flush_interval=args.flush_interval,
+    )
+
+    # make sure buffered documents are written out when the container is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    while True:
-        fetched = msg_service.fetch(max_count=config.ingest_buff_size)
-        # print(f"fetched {len(fetched)}")
-        for doc in fetched:
-            appender.append(doc)
-        if len(fetched) > 0:
-            print(f"wrote {len(fetched)} logs")
+    try:
+        while True:
+            fetched = msg_service.fetch(max_count=config.ingest_buff_size)
+            for doc in fetched:
+                writer.append(doc)
+            writer.maybe_flush()
+            if len(fetched) > 0:
+                print(f"buffered {len(fetched)} logs")
+    finally:
+        writer.close()
@@ -18,6 +18,7 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import hashlib
 import json
 import sys
 import traceback
@@ -30,6 +31,11 @@ from yaada.core.analytic.execution import (
     sync_exec_analytic,
 )
 from yaada.core.config import YAADAConfig
+from yaada.core.infrastructure.prefork import (
+    fork_workers,
+    prepare_for_fork,
+    reconnect_after_fork,
+)
 from yaada.core.infrastructure.providers import (
     make_document_service,
     make_message_service,
@@ -38,11 +44,17 @@ from yaada.core.infrastructure.providers import (
 ANALYTIC_NAME = "ingest_analytic_worker"
 ANALYTIC_SESSION_ID = "0"
 config = YAADAConfig()
-msg_service = make_message_service(config)
-msg_service.set_analytic(ANALYTIC_NAME, ANALYTIC_SESSION_ID)
-msg_service.connect("analytic-worker-0")
-doc_service = make_document_service(config)
-msg_service.subscribe_analytic_request()
+msg_service = None
+doc_service = None
+model_manager = None
+
+
+def connect_services(client_id):
+    global msg_service, doc_service
+    msg_service = make_message_service(config)
+    msg_service.set_analytic(ANALYTIC_NAME, ANALYTIC_SESSION_ID)
+    msg_service.connect(client_id)
+    doc_service = make_document_service(config)
 
 
 def execute_analytic(req):
@@ -53,6 +65,7 @@ def execute_analytic(req):
             req["parameters"],
             msg_service=msg_service,
             doc_service=doc_service,
+            model_manager=model_manager,
             init_analytics=False,
         )
         c.msg_service.delete_retained_topic(
@@ -72,11 +85,10 @@ def execute_analytic(req):
         traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stderr)
 
 
-if __name__ == "__main__":
-    labels = get_worker_labels()
-
-    context = make_analytic_context("worker")
-    print(f"Worker labels: {labels}")
+def serve(labels, shared_group=None, drain_retained=False):
+    msg_service.subscribe_analytic_request(
+        shared_group=shared_group, drain_retained=drain_retained
+    )
     print("Ready for analytic requests...")
     with ThreadPoolExecutor(max_workers=config.analytic_workers) as executor:
         while True:
@@ -87,3 +99,36 @@ if __name__ == "__main__":
                     print(f"executing {req}")
                     executor.submit(execute_analytic, req)
                     # execute_analytic(req)
+
+
+if __name__ == "__main__":
+    labels = get_worker_labels()
+    print(f"Worker labels: {labels}")
+
+    if config.analytic_processes <= 1:
+        connect_services("analytic-worker-0")
+        context = make_analytic_context(
+            "worker", config=config, preload=config.yaada_models_preload
+        )
+        # share one model cache across the analytic threads so concurrent
+        # requests for the same model wait on a single load
+        model_manager = context.get_model_manager()
+        serve(labels)
+    else:
+        # load the models once in this process, the forked workers inherit them
+        # copy-on-write and each take a share of the analytic requests
+        context = make_analytic_context("worker", config=config, preload=True)
+        model_manager = context.get_model_manager()
+        prepare_for_fork(context)
+
+        # only processes with the same labels may share requests between them
+        label_key = hashlib.sha1(",".join(sorted(labels)).encode("utf-8")).hexdigest()
+        shared_group = f"{config.data_prefix}-{config.tenant}-worker-{label_key[:8]}"
+
+        def worker_main(index):
+            reconnect_after_fork(context, f"analytic-worker-{index}")
+            connect_services(f"analytic-worker-{index}")
+            # the first worker also picks up the requests retained before startup
+            serve(labels, shared_group=shared_group, drain_retained=index == 0)
+
+        fork_workers(config.analytic_processes, worker_main)
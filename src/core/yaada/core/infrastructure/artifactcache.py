@@ -0,0 +1,337 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import urllib.parse
+from uuid import uuid4
+
+from yaada.core import default_log_level
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, where locking is best effort
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+# how often an entry is fetched again when it gets evicted before it's used
+FETCH_ATTEMPTS = 3
+# eviction frees space down to this fraction of the budget, so that it doesn't
+# have to run again on the next fetch
+EVICT_TO = 0.9
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """Advisory lock on ``path`` that works across processes. Yields False if
+    the lock is busy and ``blocking`` is False. Lock files may be removed while
+    held, a lock taken on a file that has been removed is retried on the new
+    one."""
+    while True:
+        with open(path, "a") as f:
+            if fcntl is None:
+                yield True
+                return
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(f.fileno(), flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                try:
+                    current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    yield True
+                    return
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def relpath_for_remote_file(remote_file_path):
+    # remote path components are urlencoded already, so they are safe on disk.
+    # the last one is decoded so cached files keep their original filename.
+    parts = [
+        p if p not in ("", ".", "..") else f"{p}_" for p in remote_file_path.split("/")
+    ]
+    filename = urllib.parse.unquote(parts[-1])
+    if "/" not in filename and filename not in (".", ".."):
+        parts[-1] = filename
+    return os.path.join(*parts)
+
+
+class ArtifactCache:
+    """Local cache of object storage files with a byte budget.
+
+    Files are downloaded to a temporary name and renamed into place, so readers
+    never see partial files. Each entry records the object's ETag and size, and
+    is re-downloaded when they no longer match the object store. The total size
+    of the entries is tracked in a file next to them, and once it exceeds
+    ``max_bytes`` entries are evicted least recently used first. Cache
+    directories can be shared between processes, all bookkeeping is guarded
+    with file locks.
+    """
+
+    def __init__(self, directory, max_bytes, validate=True):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.validate = validate
+        self.meta_dir = os.path.join(self.directory, ".meta")
+        self.lock_dir = os.path.join(self.directory, ".locks")
+        self.tmp_dir = os.path.join(self.directory, ".tmp")
+        self.size_path = os.path.join(self.directory, ".size")
+        for d in [self.directory, self.meta_dir, self.lock_dir, self.tmp_dir]:
+            os.makedirs(d, exist_ok=True)
+
+    def local_path(self, relpath):
+        return os.path.join(self.directory, relpath)
+
+    def _meta_path(self, relpath):
+        return os.path.join(self.meta_dir, relpath + ".json")
+
+    def _lock_path(self, relpath):
+        h = hashlib.sha1(relpath.encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{h}.lock")
+
+    def _read_meta(self, relpath):
+        try:
+            with open(self._meta_path(relpath), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, relpath, meta):
+        path = self._meta_path(relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(self.tmp_dir, str(uuid4()))
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _is_current(self, relpath, remote):
+        meta = self._read_meta(relpath)
+        if meta is None:
+            return False
+        try:
+            size = os.path.getsize(self.local_path(relpath))
+        except OSError:
+            return False
+        if size != meta["size"]:
+            return False
+        if remote is not None:
+            return remote["etag"] == meta["etag"] and remote["size"] == meta["size"]
+        return True
+
+    def _size_lock(self):
+        return file_lock(os.path.join(self.lock_dir, "size.lock"))
+
+    def _read_size(self):
+        try:
+            with open(self.size_path, "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _add_size(self, nbytes):
+        # returns the tracked total, which is recomputed from the entries when
+        # it's missing
+        with self._size_lock():
+            total = self._read_size()
+            total = self.size() if total is None else max(total + nbytes, 0)
+            self._write_size(total)
+            return total
+
+    def _write_size(self, total):
+        tmp = os.path.join(self.tmp_dir, str(uuid4()))
+        with open(tmp, "w") as f:
+            f.write(str(total))
+        os.replace(tmp, self.size_path)
+
+    def _touch(self, relpath):
+        try:
+            os.utime(self._meta_path(relpath))
+        except OSError:
+            pass
+
+    def fetch(self, relpath, remote_file_path, head, download):
+        """Make sure ``relpath`` holds a current copy of ``remote_file_path`` and
+        return its local path.
+
+        ``head(remote_file_path)`` returns dict(etag, size) for the object and
+        ``download(remote_file_path, local_path)`` downloads it.
+        """
+        remote = head(remote_file_path) if self.validate else None
+        with file_lock(self._lock_path(relpath), shared=True):
+            if self._is_current(relpath, remote):
+                self._touch(relpath)
+                return self.local_path(relpath)
+
+        added = 0
+        with file_lock(self._lock_path(relpath)):
+            # another process may have filled the entry while we waited
+            if not self._is_current(relpath, remote):
+                if remote is None:
+                    remote = head(remote_file_path)
+                tmp = os.path.join(self.tmp_dir, str(uuid4()))
+                try:
+                    download(remote_file_path, tmp)
+                    size = os.path.getsize(tmp)
+                    if size != remote["size"]:
+                        raise IOError(
+                            f"incomplete download of {remote_file_path}: "
+                            f"got {size} of {remote['size']} bytes"
+                        )
+                    local_path = self.local_path(relpath)
+                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                    previous = self._read_meta(relpath)
+                    os.replace(tmp, local_path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                self._write_meta(
+                    relpath,
+                    dict(
+                        remote_file_path=remote_file_path,
+                        etag=remote["etag"],
+                        size=remote["size"],
+                    ),
+                )
+                added = remote["size"] - (previous or {}).get("size", 0)
+                logger.debug(f"cached {remote_file_path} at {relpath}")
+            else:
+                self._touch(relpath)
+
+        if added and self._add_size(added) > self.max_bytes:
+            self.evict(keep=relpath)
+        return self.local_path(relpath)
+
+    def open(self, relpath, remote_file_path, head, download):
+        """Like fetch, but returns the cached file opened for reading. An open
+        file stays readable after its entry is evicted."""
+        for _ in range(FETCH_ATTEMPTS - 1):
+            path = self.fetch(relpath, remote_file_path, head, download)
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                pass  # evicted between the fetch and the open
+        return open(self.fetch(relpath, remote_file_path, head, download), "rb")
+
+    def link(self, relpath, destination):
+        """Hard link the cached ``relpath`` to ``destination``, or copy it when
+        they're on different filesystems, so that it outlives eviction. An
+        existing ``destination`` is replaced unless it already is the cached
+        file. Returns False if the entry was evicted since it was fetched."""
+        with file_lock(self._lock_path(relpath), shared=True):
+            if not self._is_current(relpath, None):
+                return False
+            path = self.local_path(relpath)
+            try:
+                if os.path.samefile(path, destination):
+                    return True
+            except OSError:
+                pass
+            tmp = f"{destination}.{uuid4()}.tmp"
+            try:
+                try:
+                    os.link(path, tmp)
+                except OSError:
+                    shutil.copyfile(path, tmp)
+                os.replace(tmp, destination)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            return True
+
+    def entries(self):
+        for root, dirs, files in os.walk(self.meta_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                meta_path = os.path.join(root, name)
+                relpath = os.path.relpath(meta_path, self.meta_dir)[: -len(".json")]
+                try:
+                    st = os.stat(meta_path)
+                    with open(meta_path, "r") as f:
+                        size = json.load(f)["size"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                yield relpath, size, st.st_mtime
+
+    def size(self):
+        return sum([size for _, size, _ in self.entries()])
+
+    def evict(self, keep=None):
+        with file_lock(os.path.join(self.lock_dir, "evict.lock"), blocking=False) as ok:
+            if not ok:
+                return  # somebody else is already evicting
+            with self._size_lock():
+                tracked = self._read_size()
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum([size for _, size, _ in entries])
+            target = self.max_bytes * EVICT_TO if total > self.max_bytes else total
+            for relpath, size, _ in entries:
+                if total <= target:
+                    break
+                if relpath == keep:
+                    continue
+                lock_path = self._lock_path(relpath)
+                with file_lock(lock_path, blocking=False) as free:
+                    if not free:
+                        continue
+                    self._remove(relpath)
+                    # nobody can hold the entry's lock, waiters retry on a new file
+                    try:
+                        os.remove(lock_path)
+                    except OSError:
+                        pass
+                    total -= size
+                    logger.debug(f"evicted {relpath} from artifact cache")
+            # correct the tracked total, keeping what was added while we evicted
+            with self._size_lock():
+                added = (self._read_size() or 0) - (tracked or 0)
+                self._write_size(total + max(added, 0))
+
+    def _remove(self, relpath):
+        for path in [self._meta_path(relpath), self.local_path(relpath)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name in (".locks",):
+                continue
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        for d in [self.meta_dir, self.tmp_dir]:
+            os.makedirs(d, exist_ok=True)
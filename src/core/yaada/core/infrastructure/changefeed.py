@@ -0,0 +1,136 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from datetime import datetime, timedelta
+
+import dateutil.parser
+
+# changes are ordered by the @updated stamp applied on ingest, with the id as a
+# tiebreaker so that a page boundary never falls between equal timestamps.
+CHANGE_SORT = [
+    {"@updated": {"order": "asc", "unmapped_type": "date"}},
+    {"id": {"order": "asc", "unmapped_type": "keyword"}},
+]
+
+# @updated is stamped by the writer before the document reaches the sink, so a
+# document can become visible with a stamp behind offsets that were already
+# handed out. Resumed doc_types are re-read from overlap_seconds before their
+# offset, and the (@updated, id) keys already delivered in that window are kept
+# in the offsets under this key so they are not delivered twice.
+SEEN_KEY = "_seen"
+
+
+class ChangeBatch(list):
+    """A batch of changed documents of a single doc_type.
+
+    ``offset`` is the position to resume from once this batch has been
+    processed, and can be passed back as ``since``.
+    """
+
+    def __init__(self, doc_type, docs, offset):
+        super().__init__(docs)
+        self.doc_type = doc_type
+        self.offset = offset
+
+
+def changes(
+    doc_service,
+    doc_types,
+    since=None,
+    consumer=None,
+    batch_size=1000,
+    settle_seconds=5,
+    source=None,
+    filter=None,
+    exclude=None,
+    until=None,
+    overlap_seconds=0,
+):
+    # filter and exclude are optional query clauses that changes must, or must not,
+    # match in addition to the @updated range. until replaces the settle_seconds
+    # upper bound, so that several calls can read exactly the same range.
+    if isinstance(doc_types, str):
+        doc_types = [doc_types]
+    overlap_ms = int(overlap_seconds * 1000)
+
+    offsets = {}
+    watermark = None
+    if since is None:
+        if consumer is not None:
+            offsets = doc_service.read_changefeed_offsets(consumer)
+    elif isinstance(since, dict):
+        offsets = dict(since)
+    elif isinstance(since, str):
+        watermark = dateutil.parser.isoparse(since)
+    elif isinstance(since, datetime):
+        watermark = since
+    else:
+        raise ValueError(f"unsupported change offset: {since}")
+
+    # documents are stamped before they make it through the ingest pipeline and
+    # sink, so very recent stamps are left for the next call to avoid skipping
+    # documents that are still in flight.
+    upper = until
+    if upper is None:
+        upper = datetime.utcnow() - timedelta(seconds=settle_seconds)
+
+    for doc_type in doc_types:
+        updated_range = {"lt": upper.isoformat()}
+        if watermark is not None and doc_type not in offsets:
+            updated_range["gte"] = watermark.isoformat()
+        query = {"query": {"range": {"@updated": updated_range}}}
+        if filter is not None or exclude is not None:
+            clauses = dict(filter=[query["query"]])
+            if filter is not None:
+                clauses["filter"].append(filter)
+            if exclude is not None:
+                clauses["must_not"] = [exclude]
+            query = {"query": {"bool": clauses}}
+        if source is not None:
+            query["_source"] = source
+
+        position = offsets.get(doc_type, None)
+        cursor = position
+        seen = set(tuple(key) for key in offsets.get(SEEN_KEY, {}).get(doc_type, []))
+        if position is not None and overlap_ms > 0:
+            cursor = [position[0] - overlap_ms, ""]
+        while True:
+            page = doc_service.search_after_page(
+                doc_type, query, CHANGE_SORT, cursor, batch_size
+            )
+            if len(page) == 0:
+                break
+            cursor = page[-1][1]
+            docs = [doc for doc, key in page if tuple(key) not in seen]
+            if position is None or cursor > position:
+                position = cursor
+            offsets[doc_type] = position
+            if overlap_ms > 0:
+                floor = position[0] - overlap_ms
+                seen.update(tuple(key) for _, key in page)
+                seen = set(key for key in seen if key[0] >= floor)
+                offsets[SEEN_KEY] = dict(offsets.get(SEEN_KEY, {}))
+                offsets[SEEN_KEY][doc_type] = sorted(list(key) for key in seen)
+            if len(docs) > 0:
+                yield ChangeBatch(doc_type, docs, dict(offsets))
+                # the consumer asked for the next batch, so the previous one is done
+                if consumer is not None:
+                    doc_service.write_changefeed_offsets(consumer, offsets)
+            if len(page) < batch_size:
+                break
@@ -0,0 +1,79 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import logging
+import os
+
+from yaada.core import default_log_level, utility
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+# exports page through the query with search_after on a total order over all indexes.
+# unlike a scroll or point in time context, the sort values stay valid however long
+# it takes to resume a failed job.
+EXPORT_SORT = [
+    {"doc_type": {"order": "asc", "unmapped_type": "keyword"}},
+    {"id": {"order": "asc", "unmapped_type": "keyword"}},
+]
+
+
+def checkpoint_path(path):
+    return f"{path.rstrip(os.sep)}.checkpoint.json"
+
+
+class Checkpoint:
+    """Progress of a long running export or import job, persisted next to its
+    destination (or source) so that a failed run can be resumed.
+
+    ``job`` describes the job (e.g. its doc_type and query) and is checked on resume,
+    so a checkpoint is never applied to a different job.
+    """
+
+    def __init__(self, path, job):
+        self.path = checkpoint_path(path)
+        self.job = json.loads(json.dumps(job, cls=utility.DateTimeEncoder))
+        self.state = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("job") != self.job:
+            raise ValueError(
+                f"checkpoint {self.path} belongs to a different job: {checkpoint.get('job')}"
+            )
+        self.state = checkpoint["state"]
+        logger.info(f"resuming from {self.path}: {self.state}")
+        return self.state
+
+    def save(self, **state):
+        self.state = state
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(job=self.job, state=state), f, cls=utility.DateTimeEncoder)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,202 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import datetime
+import json
+import logging
+
+import dateutil.parser
+
+from yaada.core import default_log_level, utility
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+EXTRA_COLUMN = "_extra"
+JSON_COLUMNS_METADATA = b"yaada.json_columns"
+TIMESTAMP_COLUMNS_METADATA = b"yaada.timestamp_columns"
+
+
+def pyarrow():
+    # pyarrow is an optional dependency, only required for parquet export/import
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            "parquet export/import requires the pyarrow package (pip install pyarrow)"
+        )
+    return pyarrow
+
+
+def arrow_type(property_schema):
+    """Arrow type for a json-schema property, None if it has to be stored as json."""
+    pa = pyarrow()
+    t = property_schema.get("type")
+    if t == "string":
+        if property_schema.get("format") == "date-time":
+            return pa.timestamp("us", tz="UTC")
+        return pa.string()
+    elif t == "integer":
+        return pa.int64()
+    elif t == "number":
+        return pa.float64()
+    elif t == "boolean":
+        return pa.bool_()
+    elif t == "array":
+        item_type = arrow_type(property_schema.get("items", {}))
+        if item_type is not None and not pa.types.is_timestamp(item_type):
+            return pa.list_(item_type)
+    return None
+
+
+def arrow_schema(document_schema):
+    """Arrow schema for a doc_type's json-schema. Scalars and lists of scalars get
+    typed columns, objects, references and anything else get a json string column,
+    and properties not in the schema are collected into a json `_extra` column."""
+    pa = pyarrow()
+    fields = []
+    json_columns = []
+    timestamp_columns = []
+    for name, prop in document_schema.get("properties", {}).items():
+        t = arrow_type(prop)
+        if t is None:
+            t = pa.string()
+            json_columns.append(name)
+        elif pa.types.is_timestamp(t):
+            timestamp_columns.append(name)
+        fields.append(pa.field(name, t))
+    fields.append(pa.field(EXTRA_COLUMN, pa.string()))
+    return pa.schema(
+        fields,
+        metadata={
+            JSON_COLUMNS_METADATA: json.dumps(json_columns),
+            TIMESTAMP_COLUMNS_METADATA: json.dumps(timestamp_columns),
+        },
+    )
+
+
+def schema_columns(schema, key):
+    return json.loads((schema.metadata or {}).get(key, b"[]"))
+
+
+def to_timestamp(value):
+    # naive date-times are taken to be UTC, which is how yaada stamps documents
+    if isinstance(value, datetime.datetime):
+        dt = value
+    else:
+        dt = dateutil.parser.isoparse(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+def timestamp_str(dt):
+    # how a timestamp column value is rendered back into a document
+    return dt.isoformat()
+
+
+def original_str(value):
+    if isinstance(value, datetime.datetime):
+        return json.loads(json.dumps(value, cls=utility.DateTimeEncoder))
+    return value
+
+
+def docs_to_table(docs, schema):
+    """Convert documents to an arrow table with `schema`. Values that can't be
+    converted to their column's type are kept in `_extra` instead of failing.
+    Date-times are stored as UTC microsecond timestamps; when rendering that back
+    would not give the original string (another offset, a `Z` suffix, a naive
+    time or more precision), the original string is kept in `_extra` as well."""
+    pa = pyarrow()
+    json_columns = set(schema_columns(schema, JSON_COLUMNS_METADATA))
+    timestamp_columns = set(schema_columns(schema, TIMESTAMP_COLUMNS_METADATA))
+    names = [f.name for f in schema if f.name != EXTRA_COLUMN]
+    known = set(names)
+    extras = [{k: v for k, v in doc.items() if k not in known} for doc in docs]
+
+    arrays = []
+    for name in names:
+        field = schema.field(name)
+        values = [doc.get(name) for doc in docs]
+        if name in json_columns:
+            values = [
+                None if v is None else json.dumps(v, cls=utility.DateTimeEncoder)
+                for v in values
+            ]
+        elif name in timestamp_columns:
+            converted = []
+            for i, v in enumerate(values):
+                try:
+                    converted.append(None if v is None else to_timestamp(v))
+                except (ValueError, TypeError, OverflowError):
+                    extras[i][name] = v
+                    converted.append(None)
+                    continue
+                if v is not None:
+                    stored = converted[-1].astimezone(datetime.timezone.utc)
+                    if timestamp_str(stored) != original_str(v):
+                        extras[i][name] = original_str(v)
+            values = converted
+        try:
+            array = pa.array(values, type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            converted = []
+            for i, v in enumerate(values):
+                try:
+                    pa.scalar(v, type=field.type)
+                    converted.append(v)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                    extras[i][name] = v
+                    converted.append(None)
+            array = pa.array(converted, type=field.type)
+        arrays.append(array)
+
+    arrays.append(
+        pa.array(
+            [json.dumps(e, cls=utility.DateTimeEncoder) if e else None for e in extras],
+            type=pa.string(),
+        )
+    )
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def rows_to_docs(rows, schema, fields=None):
+    """Turn rows read back from a parquet file into documents. `_extra` values
+    override the typed columns, and only `fields` of it are used when given."""
+    json_columns = set(schema_columns(schema, JSON_COLUMNS_METADATA))
+    for row in rows:
+        doc = {}
+        extra = None
+        for name, value in row.items():
+            if value is None:
+                continue
+            if name == EXTRA_COLUMN:
+                extra = json.loads(value)
+            elif name in json_columns:
+                doc[name] = json.loads(value)
+            elif isinstance(value, datetime.datetime):
+                doc[name] = timestamp_str(value)
+            else:
+                doc[name] = value
+        if extra is not None:
+            if fields is not None:
+                extra = {k: v for k, v in extra.items() if k in fields}
+            doc.update(extra)
+        yield doc
@@ -0,0 +1,126 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import gzip
+import io
+
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def zstandard():
+    # zstandard is an optional dependency, only required when zstd is requested
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError(
+            "zstd compression requires the zstandard package (pip install zstandard)"
+        )
+    return zstandard
+
+
+def compress_block(data: bytes, compression: str, level: int = None) -> bytes:
+    """Compress data as a single self-contained gzip member or zstd frame.
+
+    Blocks can be concatenated into one file and still be decompressed as a
+    whole, or individually when their byte offset and length are known.
+    """
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6 if level is None else level)
+    elif compression == "zstd":
+        compressor = zstandard().ZstdCompressor(level=3 if level is None else level)
+        return compressor.compress(data)
+    raise ValueError(f"unsupported compression '{compression}'")
+
+
+def decompress_block(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    elif compression == "zstd":
+        return zstandard().ZstdDecompressor().decompress(data)
+    raise ValueError(f"unsupported compression '{compression}'")
+
+
+def compression_for_filename(filename: str):
+    """Guess the compression of a file from its extension, None if uncompressed."""
+    if filename.endswith(".gz") or filename.endswith(".tgz"):
+        return "gzip"
+    elif filename.endswith(".zst") or filename.endswith(".tzst"):
+        return "zstd"
+    return None
+
+
+def open_compressed_writer(fileobj, compression, level=None, threads=-1):
+    """Wrap a binary file object so that writes to it are compressed as a stream.
+
+    Closing the returned writer finishes the stream without closing ``fileobj``.
+    zstd compresses on ``threads`` worker threads, -1 meaning one per cpu.
+    """
+    if compression is None:
+        return _Unclosed(fileobj)
+    elif compression == "gzip":
+        return gzip.GzipFile(
+            fileobj=fileobj, mode="wb", compresslevel=6 if level is None else level
+        )
+    elif compression == "zstd":
+        compressor = zstandard().ZstdCompressor(
+            level=3 if level is None else level, threads=threads
+        )
+        return compressor.stream_writer(fileobj, closefd=False)
+    raise ValueError(f"unsupported compression '{compression}'")
+
+
+def open_compressed_reader(fileobj, compression):
+    """Wrap a binary file object so that reads from it are decompressed as a
+    stream. Concatenated gzip members and zstd frames are read through."""
+    if compression is None:
+        return _Unclosed(fileobj)
+    elif compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif compression == "zstd":
+        decompressor = zstandard().ZstdDecompressor()
+        return decompressor.stream_reader(
+            fileobj, read_across_frames=True, closefd=False
+        )
+    raise ValueError(f"unsupported compression '{compression}'")
+
+
+class _Unclosed(io.RawIOBase):
+    # passes reads and writes through, but leaves the wrapped file open on close
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def readable(self):
+        return self.fileobj.readable()
+
+    def writable(self):
+        return self.fileobj.writable()
+
+    def read(self, size=-1):
+        return self.fileobj.read(size)
+
+    def readinto(self, b):
+        data = self.fileobj.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+    def write(self, b):
+        return self.fileobj.write(b)
+
+    def flush(self):
+        self.fileobj.flush()
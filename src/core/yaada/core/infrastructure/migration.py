@@ -18,13 +18,21 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import glob
+import hashlib
+import io
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 import tarfile
 import tempfile
+import threading
+import time
+import uuid
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import boto3
@@ -33,10 +41,141 @@ from tqdm import tqdm
 
 from yaada.core import default_log_level, utility
 from yaada.core.analytic.plugin import AnalyticContextPlugin
+from yaada.core.infrastructure import changefeed, columnar
+from yaada.core.infrastructure.checkpoint import EXPORT_SORT, Checkpoint
+from yaada.core.infrastructure.compression import (
+    COMPRESSION_EXTENSIONS,
+    compression_for_filename,
+    open_compressed_reader,
+    open_compressed_writer,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
 
+# delta exports mark deleted documents with a line of {doc_type, id, _deleted: true}
+TOMBSTONE_FIELD = "_deleted"
+
+LDJSON_SUFFIXES = [".ldjson.zst", ".ldjson.gz", ".ldjson", ".zst", ".gz"]
+
+
+def shard_prefix(destination):
+    for suffix in LDJSON_SUFFIXES:
+        if destination.endswith(suffix):
+            return destination[: -len(suffix)]
+    return destination
+
+
+def shard_filename(prefix, shard, compression="zstd"):
+    return f"{prefix}-{shard:04d}.ldjson{COMPRESSION_EXTENSIONS.get(compression, '')}"
+
+
+def shard_manifest_filename(prefix):
+    return f"{prefix}-manifest.json"
+
+
+class HashingWriter:
+    """Passes writes through to a file object while counting and hashing the bytes."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.nbytes = 0
+
+    def write(self, b):
+        self.sha256.update(b)
+        self.nbytes += len(b)
+        return self.fileobj.write(b)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+def tar_member(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    return info
+
+
+def read_shard_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    dirname = os.path.dirname(path)
+    for shard in manifest["shards"]:
+        shard["path"] = os.path.join(dirname, shard["path"])
+    return manifest
+
+
+def ldjson_import_units(source, chunk_size):
+    # (path, start, end, compression, nbytes) units of work for a parallel import.
+    # uncompressed files are split into newline aligned byte ranges, the shards of a
+    # sharded export are imported whole, as are other compressed files since a
+    # compressed stream can't be entered in the middle.
+    if source.endswith("-manifest.json"):
+        manifest = read_shard_manifest(source)
+        return [
+            (s["path"], None, None, manifest["compression"], s["bytes"])
+            for s in manifest["shards"]
+        ]
+    compression = compression_for_filename(source)
+    if compression is not None:
+        return [(source, None, None, compression, os.path.getsize(source))]
+    return [
+        (source, start, end, None, end - start)
+        for start, end in utility.line_aligned_byte_ranges(source, chunk_size)
+    ]
+
+
+_import_context = None
+
+
+def _init_import_worker(overrides, init_pipelines):
+    # each worker process gets its own context, and with it its own bulk client
+    global _import_context
+    from yaada.core.analytic.context import make_analytic_context
+
+    _import_context = make_analytic_context(
+        "ldjson-import",
+        init_pipelines=init_pipelines,
+        init_analytics=False,
+        overrides=overrides,
+        preload=False,
+    )
+
+
+def _import_unit(
+    path, start, end, compression, nbytes, process, sync, batch_size, validate
+):
+    def docs(lines):
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    count = 0
+    if start is not None:
+        lines = utility.read_byte_range_lines(path, start, end)
+        for batch in utility.batched_generator(docs(lines), batch_size):
+            _import_context.update(
+                batch, process=process, sync=sync, archive=True, validate=validate
+            )
+            count += len(batch)
+    else:
+        with open(path, "rb") as f:
+            with open_compressed_reader(f, compression) as reader:
+                lines = io.BufferedReader(reader)
+                for batch in utility.batched_generator(docs(lines), batch_size):
+                    _import_context.update(
+                        batch,
+                        process=process,
+                        sync=sync,
+                        archive=True,
+                        validate=validate,
+                    )
+                    count += len(batch)
+    return nbytes, count
+
 
 class MigrationContextPlugin(AnalyticContextPlugin):
     def __init__(self):
@@ -78,8 +217,43 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         scroll_size=100,
         scroll="24h",
         binary=False,
+        compression_level=None,
+        threads=-1,
+        checkpoint=False,
+        resume=False,
+        checkpoint_every=10000,
     ):
-        if destination.endswith(".zip"):
+        # .ldjson.gz and .ldjson.zst are written as a compressed stream, zstd on
+        # `threads` compression threads (-1 meaning one per cpu).
+        compression = compression_for_filename(destination)
+        if checkpoint or resume:
+            if destination.endswith(".zip"):
+                raise ValueError("checkpointed exports don't support .zip files")
+            self.save_ldjson_checkpointed(
+                destination,
+                compression,
+                doc_type=doc_type,
+                query=query,
+                page_size=scroll_size,
+                compression_level=compression_level,
+                threads=threads,
+                resume=resume,
+                checkpoint_every=checkpoint_every,
+            )
+        elif compression is not None:
+            with open(destination, "wb") as f:
+                with open_compressed_writer(
+                    f, compression, compression_level, threads=threads
+                ) as out:
+                    self.export_to_ldjson_stream(
+                        out,
+                        doc_type=doc_type,
+                        query=query,
+                        scroll=scroll,
+                        scroll_size=scroll_size,
+                        binary=True,
+                    )
+        elif destination.endswith(".zip"):
             internal_name, ext = destination.rsplit(".", 1)
             basename = os.path.basename(internal_name)
             with zipfile.ZipFile(destination, "w", compression=zipfile.ZIP_BZIP2) as zf:
@@ -104,6 +278,253 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                     binary=binary,
                 )
 
+    def export_pages(self, doc_type, query, page_size=1000, search_after=None):
+        # pages of (doc, sort values) in EXPORT_SORT order, starting after search_after
+        while True:
+            page = self.context.doc_service.search_after_page(
+                doc_type, query, EXPORT_SORT, search_after, page_size
+            )
+            if len(page) == 0:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            search_after = page[-1][1]
+
+    def export_docs_checkpointed(
+        self, checkpoint, doc_type, query, page_size=1000, state=None, every=10000
+    ):
+        # documents of the query, saving a checkpoint once the consumer has been
+        # handed every document of a page and asks for the next one.
+        state = state or {}
+        count = state.get("count", 0)
+        pending = 0
+        for page in self.export_pages(
+            doc_type, query, page_size, state.get("search_after")
+        ):
+            for doc, _ in page:
+                yield doc
+            count += len(page)
+            pending += len(page)
+            if pending >= every:
+                checkpoint.save(search_after=page[-1][1], count=count)
+                pending = 0
+        checkpoint.remove()
+
+    def save_ldjson_checkpointed(
+        self,
+        destination,
+        compression,
+        doc_type="*",
+        query={"query": {"match_all": {}}},
+        page_size=1000,
+        compression_level=None,
+        threads=-1,
+        resume=False,
+        checkpoint_every=10000,
+    ):
+        """Export to an ldjson file, saving the search_after position and the byte
+        offset reached every `checkpoint_every` documents. A compressed file is
+        written as a sequence of gzip members or zstd frames that end at every
+        checkpoint, so a resumed export can truncate the file at the last
+        checkpoint and append to it."""
+        cp = Checkpoint(
+            destination, dict(kind="ldjson", doc_type=doc_type, query=query)
+        )
+        state = (cp.load() if resume else None) or {}
+        search_after = state.get("search_after")
+        offset = state.get("offset", 0)
+        count = state.get("count", 0)
+        if offset > 0 and os.path.getsize(destination) < offset:
+            raise ValueError(
+                f"{destination} is shorter than its checkpoint offset {offset}"
+            )
+
+        with open(destination, "r+b" if offset > 0 else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            out = open_compressed_writer(
+                f, compression, compression_level, threads=threads
+            )
+            pending = 0
+            try:
+                with tqdm(initial=count, unit="docs") as pbar:
+                    for page in self.export_pages(
+                        doc_type, query, page_size, search_after
+                    ):
+                        for doc, _ in page:
+                            out.write(
+                                (
+                                    json.dumps(doc, cls=utility.DateTimeEncoder) + "\n"
+                                ).encode()
+                            )
+                        count += len(page)
+                        pending += len(page)
+                        pbar.update(len(page))
+                        if pending >= checkpoint_every:
+                            # end the member/frame so the file is complete up to here
+                            out.close()
+                            f.flush()
+                            os.fsync(f.fileno())
+                            cp.save(
+                                search_after=page[-1][1], offset=f.tell(), count=count
+                            )
+                            out = open_compressed_writer(
+                                f, compression, compression_level, threads=threads
+                            )
+                            pending = 0
+            finally:
+                out.close()
+        cp.remove()
+        logger.info(f"Wrote {count} documents")
+
+    def export_ldjson_shard(
+        self,
+        path,
+        shard,
+        shards,
+        doc_type="*",
+        query={"query": {"match_all": {}}},
+        scroll_size=1000,
+        scroll="24h",
+        compression="zstd",
+        level=None,
+        on_progress=None,
+    ):
+        doc_service = self.context.doc_service
+        count = 0
+        with open(path, "wb") as f:
+            hashing = HashingWriter(f)
+            # shards already run in parallel, so each one compresses on its own thread
+            with open_compressed_writer(hashing, compression, level, threads=0) as out:
+                for doc in doc_service.query(
+                    doc_type=doc_type,
+                    query=query,
+                    scroll_size=scroll_size,
+                    scroll=scroll,
+                    slice=dict(id=shard, max=shards),
+                ):
+                    out.write(
+                        (json.dumps(doc, cls=utility.DateTimeEncoder) + "\n").encode()
+                    )
+                    count = count + 1
+                    if on_progress is not None and count % scroll_size == 0:
+                        on_progress(scroll_size)
+        if on_progress is not None:
+            on_progress(count % scroll_size)
+        return dict(
+            shard=shard,
+            path=os.path.basename(path),
+            count=count,
+            bytes=hashing.nbytes,
+            sha256=hashing.sha256.hexdigest(),
+        )
+
+    def save_ldjson_shards(
+        self,
+        destination,
+        shards=4,
+        doc_type="*",
+        query={"query": {"match_all": {}}},
+        scroll_size=1000,
+        scroll="24h",
+        compression="zstd",
+        level=None,
+        progress=True,
+        resume=False,
+    ):
+        """Export documents with a sliced scroll into `shards` files written in
+        parallel, named `<destination>-NNNN.ldjson.zst`, and a
+        `<destination>-manifest.json` with the count and sha256 of every shard.
+        The manifest is written last, so its presence means the export completed.
+        Completed shards are checkpointed, and skipped when resuming. A slice can't
+        be resumed part way, so unfinished shards are exported again.
+        Returns the path of the manifest."""
+        prefix = shard_prefix(destination)
+        dirname = os.path.dirname(prefix)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        manifest_path = shard_manifest_filename(prefix)
+        cp = Checkpoint(
+            manifest_path,
+            dict(
+                kind="ldjson-shards",
+                shards=shards,
+                doc_type=doc_type,
+                query=query,
+                compression=compression,
+            ),
+        )
+        done = {}
+        for r in ((cp.load() if resume else None) or {}).get("shards", []):
+            path = os.path.join(os.path.dirname(manifest_path), r["path"])
+            if os.path.exists(path) and os.path.getsize(path) == r["bytes"]:
+                done[r["shard"]] = r
+        total = self.context.doc_service.query_count(doc_type, query=query)
+        lock = threading.Lock()
+
+        with tqdm(
+            total=total,
+            initial=sum(r["count"] for r in done.values()),
+            unit="docs",
+            disable=not progress,
+        ) as pbar:
+
+            def on_progress(n):
+                with lock:
+                    pbar.update(n)
+
+            with ThreadPoolExecutor(max_workers=shards) as pool:
+                futures = [
+                    pool.submit(
+                        self.export_ldjson_shard,
+                        shard_filename(prefix, shard, compression),
+                        shard,
+                        shards,
+                        doc_type=doc_type,
+                        query=query,
+                        scroll_size=scroll_size,
+                        scroll=scroll,
+                        compression=compression,
+                        level=level,
+                        on_progress=on_progress,
+                    )
+                    for shard in range(shards)
+                    if shard not in done
+                ]
+                error = None
+                for future in as_completed(futures):
+                    # record every shard that finished before raising, so that a
+                    # resumed export only redoes the failed ones
+                    try:
+                        r = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    with lock:
+                        done[r["shard"]] = r
+                        cp.save(shards=list(done.values()))
+                if error is not None:
+                    raise error
+
+        results = [done[shard] for shard in range(shards)]
+        manifest = dict(
+            format="ldjson",
+            compression=compression,
+            doc_type=doc_type,
+            query=query,
+            count=sum(r["count"] for r in results),
+            shards=results,
+        )
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        cp.remove()
+        logger.info(
+            f"Wrote {manifest['count']} documents in {shards} shards, manifest {manifest_path}"
+        )
+        return manifest_path
+
     def import_from_ldjson_stream(
         self,
         infile,
@@ -130,6 +551,26 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                 batch, process=process, sync=sync, archive=True, validate=validate
             )
 
+    def import_from_compressed_ldjson_stream(
+        self,
+        infile,
+        compression,
+        process=True,
+        sync=True,
+        batch_size=10,
+        validate=True,
+        realize=False,
+    ):
+        with open_compressed_reader(infile, compression) as reader:
+            self.import_from_ldjson_stream(
+                io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8"),
+                process=process,
+                sync=sync,
+                batch_size=batch_size,
+                validate=validate,
+                realize=realize,
+            )
+
     def load_ldjson_from_file(
         self,
         source,
@@ -138,8 +579,36 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         batch_size=10,
         validate=True,
         realize=False,
+        checkpoint=False,
+        resume=False,
+        checkpoint_every=10000,
     ):
-        if source.endswith(".zip"):
+        compression = compression_for_filename(source)
+        if checkpoint or resume:
+            if source.endswith(".zip"):
+                raise ValueError("checkpointed imports don't support .zip files")
+            self.load_ldjson_checkpointed(
+                source,
+                compression,
+                process=process,
+                sync=sync,
+                batch_size=batch_size,
+                validate=validate,
+                resume=resume,
+                checkpoint_every=checkpoint_every,
+            )
+        elif compression is not None:
+            with open(source, "rb") as f:
+                self.import_from_compressed_ldjson_stream(
+                    f,
+                    compression,
+                    process=process,
+                    sync=sync,
+                    batch_size=batch_size,
+                    validate=validate,
+                    realize=realize,
+                )
+        elif source.endswith(".zip"):
             internal_name, ext = source.rsplit(".", 1)
             basename = os.path.basename(internal_name)
             with zipfile.ZipFile(source, "r", compression=zipfile.ZIP_BZIP2) as zf:
@@ -163,6 +632,503 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                     realize=realize,
                 )
 
+    def load_ldjson_checkpointed(
+        self,
+        source,
+        compression,
+        process=True,
+        sync=True,
+        batch_size=10,
+        validate=True,
+        resume=False,
+        checkpoint_every=10000,
+    ):
+        """Import an ldjson file, saving the byte offset of the last committed batch
+        every `checkpoint_every` documents. Offsets count uncompressed bytes, so a
+        resumed import of a compressed file decompresses but doesn't reload the
+        part that was already committed."""
+        cp = Checkpoint(source, dict(kind="ldjson-import", compression=compression))
+        state = (cp.load() if resume else None) or {}
+        offset = state.get("offset", 0)
+        count = state.get("count", 0)
+
+        with open(source, "rb") as f:
+            if compression is None:
+                f.seek(offset)
+            with open_compressed_reader(f, compression) as reader:
+                lines = io.BufferedReader(reader)
+                if compression is not None:
+                    skip = offset
+                    while skip > 0:
+                        data = lines.read(min(skip, 1024 * 1024))
+                        if not data:
+                            break
+                        skip -= len(data)
+                pending = 0
+                batch = []
+                with tqdm(
+                    initial=offset,
+                    total=os.path.getsize(source) if compression is None else None,
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024,
+                ) as pbar:
+                    for line in lines:
+                        offset += len(line)
+                        pbar.update(len(line))
+                        line = line.strip()
+                        if line:
+                            batch.append(json.loads(line))
+                        if len(batch) >= batch_size:
+                            self.context.update(
+                                batch,
+                                process=process,
+                                sync=sync,
+                                archive=True,
+                                validate=validate,
+                            )
+                            count += len(batch)
+                            pending += len(batch)
+                            batch = []
+                            if pending >= checkpoint_every:
+                                cp.save(offset=offset, count=count)
+                                pending = 0
+                    if batch:
+                        self.context.update(
+                            batch,
+                            process=process,
+                            sync=sync,
+                            archive=True,
+                            validate=validate,
+                        )
+                        count += len(batch)
+        cp.remove()
+        logger.info(f"loaded {count} documents from {source}")
+        return count
+
+    def load_ldjson_parallel(
+        self,
+        source,
+        processes=None,
+        chunk_size=64 * 1024 * 1024,
+        process=True,
+        sync=True,
+        batch_size=100,
+        validate=True,
+        progress=True,
+        resume=False,
+    ):
+        """Import an ldjson file, or the manifest of a sharded export, in a pool of
+        processes that each parse and bulk-load one unit of work at a time. Memory
+        use stays constant regardless of the input size and progress is reported
+        in bytes. Completed units are checkpointed and skipped when resuming."""
+        units = ldjson_import_units(source, chunk_size)
+        cp = Checkpoint(
+            source, dict(kind="ldjson-parallel-import", chunk_size=chunk_size)
+        )
+        state = (cp.load() if resume else None) or {}
+        done = set(state.get("done", []))
+        count = state.get("count", 0)
+
+        def unit_key(unit):
+            return f"{os.path.basename(unit[0])}:{unit[1]}"
+
+        remaining = [unit for unit in units if unit_key(unit) not in done]
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, len(remaining) or 1))
+        total = sum(unit[-1] for unit in units)
+        with tqdm(
+            total=total,
+            initial=total - sum(unit[-1] for unit in remaining),
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            disable=not progress,
+        ) as pbar:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_import_worker,
+                initargs=(self.context.overrides, process),
+            ) as pool:
+                futures = {
+                    pool.submit(
+                        _import_unit, *unit, process, sync, batch_size, validate
+                    ): unit
+                    for unit in remaining
+                }
+                for future in as_completed(futures):
+                    nbytes, n = future.result()
+                    count += n
+                    pbar.update(nbytes)
+                    done.add(unit_key(futures[future]))
+                    cp.save(done=sorted(done), count=count)
+        cp.remove()
+        if source.endswith("-manifest.json"):
+            expected = read_shard_manifest(source)["count"]
+            if expected != count:
+                logger.warning(
+                    f"loaded {count} documents but manifest {source} lists {expected}"
+                )
+        logger.info(f"loaded {count} documents from {source} in {len(units)} units")
+        return count
+
+    def read_delta_state(self, state=None, consumer=None):
+        if consumer is not None:
+            doc_service = self.context.doc_service
+            return dict(offsets=doc_service.read_changefeed_offsets(consumer))
+        if os.path.exists(state):
+            with open(state) as f:
+                return json.load(f)
+        return dict(offsets={}, watermarks={})
+
+    def write_delta_state(self, delta_state, state=None, consumer=None):
+        if consumer is not None:
+            self.context.doc_service.write_changefeed_offsets(
+                consumer, delta_state["offsets"]
+            )
+            return
+        with open(f"{state}.tmp", "w") as f:
+            json.dump(delta_state, f, indent=2, cls=utility.DateTimeEncoder)
+        os.replace(f"{state}.tmp", state)
+
+    def save_ldjson_delta(
+        self,
+        destination,
+        state=None,
+        consumer=None,
+        doc_types=None,
+        tombstone_query=None,
+        deleted=None,
+        batch_size=1000,
+        settle_seconds=5,
+        compression_level=None,
+        overlap_seconds=None,
+    ):
+        """Export only the documents whose `@updated` stamp is past the watermark
+        reached by the previous delta export, and advance the watermark.
+        The last `overlap_seconds` before the watermark are read again so that
+        late documents aren't missed, skipping the ones already exported
+        (defaults to `yaada.opensearch.changefeed.overlap_seconds`).
+
+        The per doc_type watermarks are kept in the json file `state`, or as the
+        changefeed offsets of `consumer` in OpenSearch. They are only advanced once
+        the export file is complete, so a failed run is simply repeated.
+
+        Deletes are exported as tombstone lines `{doc_type, id, _deleted: true}`,
+        for the changed documents matching `tombstone_query` (e.g. soft deleted
+        documents) and for the `deleted` list of (doc_type, id) pairs.
+        `load_ldjson_delta` applies a delta file, including its tombstones.
+        Returns the number of documents and tombstones written per doc_type.
+        """
+        if (state is None) == (consumer is None):
+            raise ValueError("save_ldjson_delta needs exactly one of state or consumer")
+        if doc_types is None:
+            doc_types = list(self.context.doc_service.document_counts().keys())
+        delta_state = self.read_delta_state(state, consumer)
+        offsets = delta_state.get("offsets", {})
+        watermarks = dict(delta_state.get("watermarks", {}))
+        new_offsets = dict(offsets)
+        until = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        if overlap_seconds is None:
+            overlap_seconds = self.context.config.changefeed_overlap_seconds
+        counts = {}
+
+        def advance(batch):
+            # the document pass and the tombstone pass read the same range, so the
+            # watermark moves to whichever of them got further
+            position = batch.offset[batch.doc_type]
+            previous = new_offsets.get(batch.doc_type)
+            if previous is None or position > previous:
+                new_offsets[batch.doc_type] = position
+            # both passes start from the same delivered keys, so keep the union
+            seen = batch.offset.get(changefeed.SEEN_KEY, {}).get(batch.doc_type)
+            if seen is not None:
+                merged = dict(new_offsets.get(changefeed.SEEN_KEY, {}))
+                keys = set(map(tuple, merged.get(batch.doc_type, []))) | set(
+                    map(tuple, seen)
+                )
+                merged[batch.doc_type] = sorted(list(key) for key in keys)
+                new_offsets[changefeed.SEEN_KEY] = merged
+            for doc in batch:
+                updated = doc.get("@updated")
+                if updated and updated > watermarks.get(batch.doc_type, ""):
+                    watermarks[batch.doc_type] = updated
+            counts[batch.doc_type] = counts.get(batch.doc_type, 0) + len(batch)
+
+        compression = compression_for_filename(destination)
+        with open(destination, "wb") as f:
+            with open_compressed_writer(f, compression, compression_level) as out:
+
+                def write(doc):
+                    out.write(
+                        (json.dumps(doc, cls=utility.DateTimeEncoder) + "\n").encode()
+                    )
+
+                for batch in tqdm(
+                    changefeed.changes(
+                        self.context.doc_service,
+                        doc_types,
+                        since=dict(offsets),
+                        batch_size=batch_size,
+                        exclude=tombstone_query,
+                        until=until,
+                        overlap_seconds=overlap_seconds,
+                    ),
+                    desc="exporting changes",
+                ):
+                    for doc in batch:
+                        write(doc)
+                    advance(batch)
+                if tombstone_query is not None:
+                    for batch in changefeed.changes(
+                        self.context.doc_service,
+                        doc_types,
+                        since=dict(offsets),
+                        batch_size=batch_size,
+                        source=["doc_type", "id", "@updated"],
+                        filter=tombstone_query,
+                        until=until,
+                        overlap_seconds=overlap_seconds,
+                    ):
+                        for doc in batch:
+                            write(
+                                {
+                                    "doc_type": doc["doc_type"],
+                                    "id": doc["id"],
+                                    TOMBSTONE_FIELD: True,
+                                }
+                            )
+                        advance(batch)
+                for d in deleted or []:
+                    if isinstance(d, dict):
+                        doc_type, id = d["doc_type"], d["id"]
+                    else:
+                        doc_type, id = d
+                    write({"doc_type": doc_type, "id": id, TOMBSTONE_FIELD: True})
+                    counts[doc_type] = counts.get(doc_type, 0) + 1
+
+        self.write_delta_state(
+            dict(
+                offsets=new_offsets,
+                watermarks=watermarks,
+                until=until.isoformat(),
+                destination=destination,
+            ),
+            state,
+            consumer,
+        )
+        logger.info(f"Wrote delta {counts} to {destination}")
+        return counts
+
+    def load_ldjson_delta(
+        self,
+        source,
+        process=False,
+        sync=True,
+        batch_size=100,
+        validate=True,
+        barrier_timeout=600,
+    ):
+        """Apply a delta written by `save_ldjson_delta`: documents are updated and
+        tombstones deleted, in the order they appear in the file. Tombstones for
+        documents that are already gone are skipped. With `sync=False` every update
+        carries an ingest sentinel, and a tombstone, or a second update of the same
+        document, first waits until the update still in flight for that document
+        has been indexed. So ingest workers applying batches out of order can't
+        bring a deleted document back."""
+        compression = compression_for_filename(source)
+        count = 0
+        deleted = 0
+        # (doc_type, _id) -> sentinel of the async update last sent for it
+        in_flight = {}
+
+        def wait_for(key):
+            sentinel = in_flight.pop(key, None)
+            if sentinel is not None:
+                self.context.ingest_barrier(
+                    key[0], key[1], barrier_timeout, "_ingest_sentinel", sentinel
+                )
+
+        def send(updates):
+            self.context.update(
+                updates, process=process, sync=sync, archive=True, validate=validate
+            )
+
+        def apply_updates(updates):
+            if sync:
+                send(updates)
+                return len(updates)
+            batch = {}
+            sentinel = str(uuid.uuid4())
+            for doc in updates:
+                key = (doc["doc_type"], utility.assign_document_id(doc)["_id"])
+                if key in batch:
+                    # a second update of a document in this batch goes out after
+                    # the first one is indexed
+                    send(list(batch.values()))
+                    batch = {}
+                    sentinel = str(uuid.uuid4())
+                wait_for(key)
+                doc["_ingest_sentinel"] = sentinel
+                batch[key] = doc
+                in_flight[key] = sentinel
+            send(list(batch.values()))
+            return len(updates)
+
+        with open(source, "rb") as f:
+            with open_compressed_reader(f, compression) as reader:
+                lines = (
+                    line for line in io.BufferedReader(reader) if line.strip()
+                )
+                docs = (json.loads(line) for line in lines)
+                updates = []
+                for doc in tqdm(docs):
+                    if doc.get(TOMBSTONE_FIELD):
+                        if updates:
+                            count += apply_updates(updates)
+                            updates = []
+                        wait_for((doc["doc_type"], doc["id"]))
+                        self.context.delete(doc["doc_type"], doc["id"], missing_ok=True)
+                        deleted += 1
+                        continue
+                    updates.append(doc)
+                    if len(updates) >= batch_size:
+                        count += apply_updates(updates)
+                        updates = []
+                if updates:
+                    count += apply_updates(updates)
+        logger.info(f"applied {count} updates and {deleted} deletes from {source}")
+        return count, deleted
+
+    def save_parquet(
+        self,
+        destination,
+        doc_type="*",
+        query={"query": {"match_all": {}}},
+        scroll_size=1000,
+        scroll="24h",
+        row_group_size=10000,
+        compression="zstd",
+    ):
+        """Export documents to a directory with one `<doc_type>.parquet` file per
+        doc_type. Columns are typed from the doc_type's schema and nested fields
+        are stored as json strings. Documents are buffered per doc_type and written
+        out a row group at a time, so memory is bounded by `row_group_size`."""
+        pa = columnar.pyarrow()
+        os.makedirs(destination, exist_ok=True)
+        schemas = {}
+        writers = {}
+        buffers = {}
+        counts = {}
+
+        def flush(dt):
+            if not buffers.get(dt):
+                return
+            if dt not in writers:
+                schemas[dt] = columnar.arrow_schema(
+                    self.context.schema_manager.get_document_schema(dt)
+                )
+                writers[dt] = pa.parquet.ParquetWriter(
+                    os.path.join(destination, f"{dt}.parquet"),
+                    schemas[dt],
+                    compression=compression,
+                )
+            writers[dt].write_table(
+                columnar.docs_to_table(buffers[dt], schemas[dt]),
+                row_group_size=row_group_size,
+            )
+            counts[dt] = counts.get(dt, 0) + len(buffers[dt])
+            buffers[dt] = []
+
+        try:
+            for doc in tqdm(
+                self.context.doc_service.query(
+                    doc_type=doc_type,
+                    query=query,
+                    scroll_size=scroll_size,
+                    scroll=scroll,
+                )
+            ):
+                dt = doc["doc_type"]
+                buffers.setdefault(dt, []).append(doc)
+                if len(buffers[dt]) >= row_group_size:
+                    flush(dt)
+            for dt in list(buffers):
+                flush(dt)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        logger.info(f"Wrote {counts} documents to {destination}")
+        return counts
+
+    def parquet_files(self, source, doc_type="*"):
+        if os.path.isfile(source):
+            return [source]
+        pattern = "*" if doc_type is None else doc_type
+        return sorted(glob.glob(os.path.join(source, f"{pattern}.parquet")))
+
+    def read_parquet(self, source, columns=None, doc_type="*", batch_size=10000):
+        """Generator of documents from a `save_parquet` export, reading only
+        `columns` (plus `doc_type` and `id`) when given."""
+        pa = columnar.pyarrow()
+        for path in self.parquet_files(source, doc_type):
+            pf = pa.parquet.ParquetFile(path)
+            cols = None
+            fields = None
+            if columns is not None:
+                # _extra is read too, for the values of these fields kept there
+                names = set(pf.schema_arrow.names)
+                fields = set(["doc_type", "id", *columns])
+                cols = [
+                    c
+                    for c in dict.fromkeys(
+                        ["doc_type", "id", *columns, columnar.EXTRA_COLUMN]
+                    )
+                    if c in names
+                ]
+            for batch in pf.iter_batches(batch_size=batch_size, columns=cols):
+                yield from columnar.rows_to_docs(
+                    batch.to_pylist(), pf.schema_arrow, fields=fields
+                )
+
+    def parquet_to_dataframe(self, source, columns=None, doc_type="*"):
+        """Load a `save_parquet` export, or just `columns` of it, into a pandas
+        DataFrame without going through python dicts."""
+        pa = columnar.pyarrow()
+        tables = [
+            pa.parquet.read_table(path, columns=columns)
+            for path in self.parquet_files(source, doc_type)
+        ]
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+    def load_parquet(
+        self,
+        source,
+        columns=None,
+        doc_type="*",
+        process=True,
+        sync=True,
+        batch_size=1000,
+        validate=True,
+    ):
+        """Load a `save_parquet` export. With `columns`, every document is a
+        partial update: the loaded fields are merged into the existing document,
+        a document that doesn't exist yet is created with only those fields, and
+        with `process` the ingest pipelines only see those fields."""
+        c = 0
+        for batch in utility.batched_generator(
+            tqdm(self.read_parquet(source, columns=columns, doc_type=doc_type)),
+            batch_size,
+        ):
+            self.context.update(
+                batch, process=process, sync=sync, archive=True, validate=validate
+            )
+            c += len(batch)
+        logger.info(f"done loading {c} documents from {source}")
+        return c
+
     def save_archive_to_directory(
         self,
         directory_path,
@@ -173,14 +1139,33 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         include_artifacts=True,
         id_by_count=False,
         id_by_hash=True,
+        checkpoint=False,
+        resume=False,
+        checkpoint_every=1000,
     ):
         c = 0
-        for doc in tqdm(
-            self.context.query(
+        if checkpoint or resume:
+            # documents are written to their own directories, so the documents of a
+            # page that was interrupted are simply written again when resuming.
+            cp = Checkpoint(
+                directory_path,
+                dict(kind="archive", doc_type=doc_type, query=query),
+            )
+            state = (cp.load() if resume else None) or {}
+            c = state.get("count", 0)
+            docs = self.export_docs_checkpointed(
+                cp,
+                doc_type,
+                query,
+                page_size=scroll_size,
+                state=state,
+                every=checkpoint_every,
+            )
+        else:
+            docs = self.context.query(
                 doc_type=doc_type, query=query, scroll_size=scroll_size, scroll=scroll
-            ),
-            desc=f"exporting to '{directory_path}'",
-        ):
+            )
+        for doc in tqdm(docs, initial=c, desc=f"exporting to '{directory_path}'"):
             id_str = utility.urlencode(doc["_id"])
             if id_by_hash:
                 id_str = utility.hash_for_text([doc["_id"]])
@@ -268,48 +1253,139 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         scroll_size=100,
         scroll="24h",
         include_artifacts=True,
+        compression_level=None,
     ):
-        with tempfile.TemporaryDirectory() as tempdir:
-            dest_basename = os.path.basename(dest_path)
-            inner_dir = Path(dest_basename).stem
-            download_dir = os.path.join(tempdir, inner_dir)
-            mode = "w"
-            if dest_path.endswith("tgz") or dest_path.endswith("tar.gz"):
-                mode = "w:gz"
-            logger.info(f"storing data in {download_dir}")
-            self.save_archive_to_directory(
-                download_dir,
-                doc_type=doc_type,
-                query=query,
-                scroll_size=scroll_size,
-                scroll=scroll,
-                include_artifacts=include_artifacts,
-            )
-            temp_tar_path = os.path.join(tempdir, dest_basename)
-            print(f"archiving to {temp_tar_path}")
-            with tarfile.open(temp_tar_path, mode) as tar:
-                tar.add(download_dir, arcname=inner_dir)
-            print(f"moving {temp_tar_path} to {dest_path}")
-            shutil.move(temp_tar_path, dest_path)
+        """Write an archive with the layout of `save_archive_to_directory` straight
+        into a tar stream (.tar, .tgz/.tar.gz or .tar.zst), one document at a time.
+        Each doc.json is followed by its artifacts, which are streamed from object
+        storage, so nothing is staged on local disk."""
+        inner_dir = Path(os.path.basename(dest_path)).stem
+        compression = compression_for_filename(dest_path)
+        partial_path = f"{dest_path}.partial"
+        c = 0
+        with open(partial_path, "wb") as f:
+            with open_compressed_writer(f, compression, compression_level) as out:
+                with tarfile.open(fileobj=out, mode="w|") as tar:
+                    for doc in tqdm(
+                        self.context.query(
+                            doc_type=doc_type,
+                            query=query,
+                            scroll_size=scroll_size,
+                            scroll=scroll,
+                        ),
+                        desc=f"archiving to '{dest_path}'",
+                    ):
+                        doc_dir = "/".join(
+                            [
+                                inner_dir,
+                                utility.urlencode(doc["doc_type"]),
+                                utility.hash_for_text([doc["_id"]]),
+                            ]
+                        )
+                        data = json.dumps(doc, indent=2).encode()
+                        tar.addfile(
+                            tar_member(f"{doc_dir}/doc.json", len(data)),
+                            io.BytesIO(data),
+                        )
+                        if include_artifacts:
+                            self.add_artifacts_to_tar(tar, doc, doc_dir)
+                        c = c + 1
+        os.replace(partial_path, dest_path)
+        logger.info(f"done archiving {c} documents to {dest_path}")
 
-    def load_archive_from_tar(self, tar_path, process=False, sync=True, validate=True):
-        with tempfile.TemporaryDirectory() as tempdir:
-            basename = os.path.basename(tar_path)
-            mode = "r"
-            if basename.endswith("tgz") or basename.endswith("tar.gz"):
-                mode = "r:gz"
-            with tarfile.open(tar_path, mode) as tar:
-                # tar.extractall(path=tempdir)
-                for member in tqdm(
-                    iterable=tar.getmembers(),
-                    total=len(tar.getmembers()),
-                    desc=f"extracting {tar_path}",
-                ):
-                    tar.extract(member=member, path=tempdir)
+    def add_artifacts_to_tar(self, tar, doc, doc_dir):
+        for artifact_type in doc.get("artifacts", {}):
+            for blob in doc["artifacts"][artifact_type]:
+                if blob and "remote_file_path" in blob and "filename" in blob:
+                    remote_file_path = blob["remote_file_path"]
+                    size = self.context.ob_service.head_file(remote_file_path)["size"]
+                    with self.context.open_artifact(remote_file_path) as src:
+                        tar.addfile(
+                            tar_member(
+                                f"{doc_dir}/{artifact_type}/{blob['filename']}", size
+                            ),
+                            src,
+                        )
+
+    def load_archive_from_tar_stream(
+        self, fileobj, process=False, sync=True, validate=True
+    ):
+        """Load an archive from a tar stream in member order, without extracting it.
+        A document is loaded once all of its members have been read. Archives
+        written by `save_archive_to_tar` have every doc.json ahead of its artifacts.
+        Older archives may not, so artifacts seen before their doc.json are
+        spooled to a temporary file."""
+        c = 0
+        batch = []
+        current = dict(dir=None, doc=None, pending=[])
+
+        def save_artifact(doc, artifact_type, filename, file):
+            blobs = doc.get("artifacts", {}).get(artifact_type, [])
+            if any(blob and blob.get("filename") == filename for blob in blobs):
+                self.context.save_artifact(doc, artifact_type, filename, file)
+
+        def flush():
+            if batch:
+                self.context.update(
+                    batch, process=process, sync=sync, archive=True, validate=validate
+                )
+                batch.clear()
+
+        def finish():
+            # all members of the current document have been read
+            nonlocal c
+            for _, _, spooled in current["pending"]:
+                spooled.close()
+            if current["doc"] is not None:
+                batch.append(current["doc"])
+                c = c + 1
+            if len(batch) >= 10:
+                flush()
 
-                archive_dir = os.path.join(tempdir)
-                self.load_archive_from_directory(
-                    archive_dir, process=process, sync=sync, validate=validate
+        with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+            for member in tqdm(tar, desc="loading documents"):
+                if not member.isfile():
+                    continue
+                # <archive>/<doc_type>/<id>/doc.json or
+                # <archive>/<doc_type>/<id>/<artifact_type>/<filename>
+                parts = member.name.split("/")
+                if len(parts) < 4:
+                    continue
+                doc_dir, rel = "/".join(parts[:3]), parts[3:]
+                if doc_dir != current["dir"]:
+                    finish()
+                    current.update(dir=doc_dir, doc=None, pending=[])
+                if rel == ["doc.json"]:
+                    doc = json.load(tar.extractfile(member))
+                    for artifact_type, filename, spooled in current["pending"]:
+                        spooled.seek(0)
+                        save_artifact(doc, artifact_type, filename, spooled)
+                    current["doc"] = doc
+                elif len(rel) >= 2:
+                    artifact_type, filename = rel[0], "/".join(rel[1:])
+                    if current["doc"] is not None:
+                        save_artifact(
+                            current["doc"],
+                            artifact_type,
+                            filename,
+                            tar.extractfile(member),
+                        )
+                    else:
+                        spooled = tempfile.SpooledTemporaryFile(
+                            max_size=16 * 1024 * 1024
+                        )
+                        shutil.copyfileobj(tar.extractfile(member), spooled)
+                        current["pending"].append((artifact_type, filename, spooled))
+            finish()
+            flush()
+        logger.info(f"done loading {c} documents")
+        return c
+
+    def load_archive_from_tar(self, tar_path, process=False, sync=True, validate=True):
+        with open(tar_path, "rb") as f:
+            with open_compressed_reader(f, compression_for_filename(tar_path)) as r:
+                self.load_archive_from_tar_stream(
+                    r, process=process, sync=sync, validate=validate
                 )
 
     def save_archive_to_s3_tar(
@@ -341,13 +1417,16 @@ class MigrationContextPlugin(AnalyticContextPlugin):
     def load_archive_from_s3_tar(
         self, bucket, remote_path, process=False, sync=True, validate=True
     ):
-        with tempfile.TemporaryDirectory() as tempdir:
-            basename = os.path.basename(remote_path)
-            temp_tar_path = os.path.join(tempdir, basename)
-            bucket.fetch_file(remote_path, temp_tar_path)
-            self.load_archive_from_tar(
-                temp_tar_path, process=process, sync=sync, validate=validate
-            )
+        # the archive is loaded as it downloads
+        body = bucket.open_file(remote_path)
+        try:
+            compression = compression_for_filename(remote_path)
+            with open_compressed_reader(body, compression) as r:
+                self.load_archive_from_tar_stream(
+                    r, process=process, sync=sync, validate=validate
+                )
+        finally:
+            body.close()
 
     def save_archive_to_s3(
         self,
@@ -380,9 +1459,7 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                 for artifact_type in doc.get("artifacts", {}):
                     for blob in doc["artifacts"][artifact_type]:
                         if blob and "remote_file_path" in blob and "filename" in blob:
-                            tf = self.context.fetch_file_to_temp(
-                                blob["remote_file_path"]
-                            )
+                            tf = self.context.open_artifact(blob["remote_file_path"])
                             s3_artifact_dir = os.path.join(
                                 s3_doc_dir_path, utility.urlencode(artifact_type)
                             )
@@ -451,7 +1528,9 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         query={"query": {"match_all": {}}},
         scroll_size=100,
         scroll="24h",
+        compression_level=None,
     ):
+        # the compression is chosen by the extension of remote_path (.gz, .zst or .zip)
         with tempfile.TemporaryDirectory() as tempdir:
             basename = os.path.basename(remote_path)
             temp_file_path = os.path.join(tempdir, basename)
@@ -462,6 +1541,7 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                 scroll=scroll,
                 scroll_size=scroll_size,
                 binary=True,
+                compression_level=compression_level,
             )
             with open(temp_file_path, "rb") as f:
                 bucket.put_file(remote_path, f)
@@ -477,6 +1557,23 @@ class MigrationContextPlugin(AnalyticContextPlugin):
         validate=True,
         realize=False,
     ):
+        compression = compression_for_filename(remote_path)
+        if compression is not None:
+            # compressed streams are decompressed and loaded as they download
+            body = bucket.open_file(remote_path)
+            try:
+                self.import_from_compressed_ldjson_stream(
+                    body,
+                    compression,
+                    process=process,
+                    sync=sync,
+                    batch_size=batch_size,
+                    validate=validate,
+                    realize=realize,
+                )
+            finally:
+                body.close()
+            return
         with tempfile.TemporaryDirectory() as tempdir:
             basename = os.path.basename(remote_path)
             temp_file_path = os.path.join(tempdir, basename)
@@ -517,9 +1614,7 @@ class MigrationContextPlugin(AnalyticContextPlugin):
                 for artifact_type in doc.get("artifacts", {}):
                     for blob in doc["artifacts"][artifact_type]:
                         if blob and "remote_file_path" in blob and "filename" in blob:
-                            tf = self.context.fetch_file_to_temp(
-                                blob["remote_file_path"]
-                            )
+                            tf = self.context.open_artifact(blob["remote_file_path"])
                             to_context.save_artifact(
                                 doc, artifact_type, blob["filename"], tf
                             )
@@ -682,6 +1777,10 @@ class S3Bucket:
         #     Bucket=self.bucket, Key=remote_file_path, Filename=local_file_path
         # )
 
+    def open_file(self, remote_file_path):
+        # streaming body of the object, read it sequentially and close it when done
+        return self.client.get_object(Bucket=self.bucket, Key=remote_file_path)["Body"]
+
     def put_file(self, remote_file_path, file):
         file.seek(0, os.SEEK_END)
         total_length = file.tell()
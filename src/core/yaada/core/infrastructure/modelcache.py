@@ -17,8 +17,47 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+
 from pylru import _dlnode, lrucache
 
+from yaada.core import default_log_level
+from yaada.core.infrastructure.artifactcache import FETCH_ATTEMPTS, file_lock
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if it can't be read."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
 
 class CacheFullError(Exception):
     pass
@@ -29,17 +68,26 @@ class UnevictableNodeError(Exception):
 
 
 class DoublyLinkedListNode(_dlnode):
-    __slots__ = ("evictable", "empty", "next", "prev", "key", "value")
+    __slots__ = ("evictable", "empty", "next", "prev", "key", "value", "nbytes")
 
     def __init__(self):
         self.empty = True
         self.evictable = True
+        self.nbytes = 0
 
 
 class ModelCache(lrucache):
-    def __init__(self, size, callback=None):
+    def __init__(self, size, callback=None, max_bytes=None):
         self.callback = callback
 
+        # byte budget across all entries; None or 0 means only the entry count
+        # bounds the cache
+        self.max_bytes = max_bytes or None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
         # Create an empty hash table.
         self.table = {}
 
@@ -67,11 +115,67 @@ class ModelCache(lrucache):
             self.table[key].evictable = True
 
     def unevictable_nodes(self):
-        node = self.head.prev
-        for i in range(len(self.table)):
+        # empty nodes sit at the tail, so walk the occupied ones from the head
+        for node in self.dli():
             if not node.evictable:
                 yield node.key
-            node = node.prev
+
+    def lookup(self, key, default=None):
+        # like get(), but counts towards the hit/miss metrics
+        if key in self.table:
+            self.hits += 1
+            return self[key]
+        self.misses += 1
+        return default
+
+    def nbytes(self, key):
+        return self.table[key].nbytes
+
+    def stats(self):
+        return dict(
+            entries=len(self.table),
+            size=self.listSize,
+            bytes=self.total_bytes,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            unevictable=list(self.unevictable_nodes()),
+        )
+
+    def _evicted(self, node):
+        self.evictions += 1
+        logger.debug(f"evicting {node.key} ({node.nbytes} bytes) from model cache")
+        if self.callback is not None:
+            self.callback(node.key, node.value)
+
+    def _enforce_byte_budget(self, keep):
+        if self.max_bytes is None or self.total_bytes <= self.max_bytes:
+            return
+        # walk from least to most recently used
+        for node in reversed(list(self.dli())):
+            if self.total_bytes <= self.max_bytes:
+                return
+            if node.key == keep or not node.evictable:
+                continue
+            self._evicted(node)
+            del self[node.key]
+        if self.total_bytes > self.max_bytes:
+            logger.warning(
+                f"model cache holds {self.total_bytes} bytes, over its budget of {self.max_bytes}, because the remaining models are unevictable"
+            )
+
+    def put(self, key, value, nbytes=0):
+        self[key] = value
+        node = self.table[key]
+        nbytes = max(int(nbytes or 0), 0)
+        self.total_bytes += nbytes - node.nbytes
+        node.nbytes = nbytes
+        self._enforce_byte_budget(key)
+
+    def clear(self):
+        super().clear()
+        self.total_bytes = 0
 
     def __setitem__(self, key, value):
         # If any value is stored under 'key' in the cache already, then replace
@@ -109,8 +213,8 @@ class ModelCache(lrucache):
                 # Reorder the linked list in accordance with LRU.
                 # Move evicted node to the tail and update the pointers
                 self.mtf(node)
-                if self.callback is not None:
-                    self.callback(node.key, node.value)
+                self._evicted(node)
+                self.total_bytes -= node.nbytes
                 del self.table[node.key]
                 break
             else:
@@ -124,6 +228,7 @@ class ModelCache(lrucache):
         node.key = key
         node.value = value
         node.evictable = True
+        node.nbytes = 0
 
         # Add the node to the dictionary under the new key and update head pointer.
         self.table[key] = node
@@ -135,8 +240,10 @@ class ModelCache(lrucache):
         if not node.evictable:
             raise UnevictableNodeError("Unable to delete unevictable node.")
         del self.table[key]
+        self.total_bytes -= node.nbytes
         node.empty = True
         node.evictable = True
+        node.nbytes = 0
 
         # Not strictly necessary.
         node.key = None
@@ -161,3 +268,163 @@ class ModelCache(lrucache):
             self.head.prev = node
 
         self.listSize += n
+
+
+# non-archive models are downloaded next to the disk tier, but aren't part of it
+DOWNLOADS_DIRECTORY = ".downloads"
+
+
+class ModelDiskCache:
+    """On-disk tier beneath ModelCache holding extracted model directories.
+
+    Entries live under ``<directory>/<key>/<etag>``, so a model that is saved
+    again under the same key gets a fresh entry while the stale one is dropped.
+    A ``.complete`` marker records the entry's size once it is fully populated,
+    its mtime tracks the last use. Entries are evicted least recently used
+    first once the tier exceeds ``max_bytes``. The directory can be shared
+    between processes, population and eviction are guarded with file locks, and
+    an entry is only removed while nobody is loading from it.
+    """
+
+    COMPLETE = ".complete"
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes or None
+        self.lock_dir = os.path.join(self.directory, ".locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def entry_path(self, key, etag):
+        safe_etag = "".join(c if c.isalnum() or c in "-_." else "_" for c in etag)
+        return os.path.join(self.directory, *key.split("/"), safe_etag)
+
+    def _lock(self, name, shared=False, blocking=True):
+        return file_lock(self._lock_path(name), shared=shared, blocking=blocking)
+
+    def _lock_path(self, name):
+        h = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{h}.lock")
+
+    def _marker(self, entry):
+        return os.path.join(entry, self.COMPLETE)
+
+    def get(self, key, etag):
+        entry = self.entry_path(key, etag)
+        try:
+            os.utime(self._marker(entry))
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    @contextlib.contextmanager
+    def use(self, key, etag, populate):
+        """Context manager yielding the entry for key and etag, filled with
+        ``populate(entry)`` if needed. The entry isn't evicted or replaced
+        before the block exits, so a model can be loaded from it."""
+        entry = self.entry_path(key, etag)
+        for attempt in range(FETCH_ATTEMPTS):
+            with self._lock(entry, shared=True):
+                try:
+                    os.utime(self._marker(entry))
+                except OSError:
+                    pass
+                else:
+                    if attempt == 0:
+                        self.hits += 1
+                    yield entry
+                    return
+            if attempt == 0:
+                self.misses += 1
+            self.fill(key, etag, populate)
+        raise IOError(f"{key} keeps getting evicted from the model disk cache")
+
+    def fill(self, key, etag, populate):
+        """Return the entry for key and etag, calling ``populate(entry)`` to
+        create it if no other thread or process has done so already."""
+        entry = self.entry_path(key, etag)
+        with self._lock(key):
+            if not os.path.isfile(self._marker(entry)):
+                populate(entry)
+                with open(self._marker(entry), "w") as f:
+                    json.dump(dict(key=key, etag=etag, size=directory_size(entry)), f)
+            self._remove_stale(key, entry)
+        self.evict(keep=entry)
+        return entry
+
+    def _remove_stale(self, key, keep):
+        # other versions of the same model
+        key_dir = os.path.dirname(keep)
+        for name in os.listdir(key_dir):
+            path = os.path.join(key_dir, name)
+            if path != keep and os.path.isfile(self._marker(path)):
+                if self._remove(path):
+                    logger.debug(f"removed stale model directory {path}")
+
+    def _remove(self, entry):
+        # skips entries that are being loaded from, returns whether it was removed
+        with self._lock(entry, blocking=False) as free:
+            if not free:
+                return False
+            try:
+                os.remove(self._marker(entry))
+            except OSError:
+                return False
+            shutil.rmtree(entry, ignore_errors=True)
+            # waiters retry on a new lock file and then find the entry gone
+            try:
+                os.remove(self._lock_path(entry))
+            except OSError:
+                pass
+            return True
+
+    def entries(self):
+        """Yield (entry path, size, last used) of all complete entries."""
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory:
+                for name in [".locks", DOWNLOADS_DIRECTORY]:
+                    if name in dirs:
+                        dirs.remove(name)
+            if self.COMPLETE in files:
+                dirs.clear()
+                marker = os.path.join(root, self.COMPLETE)
+                try:
+                    with open(marker, "r") as f:
+                        size = json.load(f).get("size", 0)
+                    yield root, size, os.path.getmtime(marker)
+                except (OSError, ValueError):
+                    continue
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        with self._lock(".evict"):
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for entry, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if entry == keep:
+                    continue
+                # files that are still memory mapped stay valid after removal
+                if not self._remove(entry):
+                    continue
+                logger.debug(f"evicted model directory {entry} ({size} bytes)")
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        return dict(
+            bytes=self.size(),
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
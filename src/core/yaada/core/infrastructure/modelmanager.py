@@ -17,19 +17,146 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import contextlib
+import logging
 import os
+import shutil
 import tarfile
 import tempfile
+import threading
 import typing
+import uuid
+import weakref
+from concurrent.futures import Future
 
-from yaada.core import analytic
-from yaada.core.infrastructure.modelcache import ModelCache
+from yaada.core import analytic, default_log_level
+from yaada.core.infrastructure import modelservice
+from yaada.core.infrastructure.compression import (
+    compression_for_filename,
+    open_compressed_reader,
+    open_compressed_writer,
+)
+from yaada.core.infrastructure.modelcache import (
+    DOWNLOADS_DIRECTORY,
+    ModelCache,
+    ModelDiskCache,
+    current_rss,
+    directory_size,
+)
+from yaada.core.utility import urlencode
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+# key: archive format, value: compression of the tar stream
+ARCHIVE_FORMATS = {"tar": None, "tar.gz": "gzip", "tar.zst": "zstd"}
+
+
+def estimate_model_bytes(model, rss_before=None, path=None):
+    # prefer what the model reports, then how much the process grew while
+    # loading it, then how big its artifacts are on disk
+    nbytes = model.memory_footprint()
+    if nbytes is None and rss_before is not None:
+        rss_after = current_rss()
+        if rss_after is not None and rss_after > rss_before:
+            nbytes = rss_after - rss_before
+    if nbytes is None and path is not None and os.path.isdir(path):
+        nbytes = directory_size(path)
+    return nbytes or 0
+
+
+MODEL_UPDATED_EVENT = "model/updated"
+
+# every live ModelManager, so that their locks can be reset in forked children
+# and model updated events reach all of them
+_managers = weakref.WeakSet()
+# message service subscriptions that model updated events are already routed
+# from, a reconnect starts with a fresh set of subscriptions
+_update_subscriptions = weakref.WeakKeyDictionary()
+_update_subscriptions_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _update_subscriptions_lock
+    _update_subscriptions_lock = threading.Lock()
+    for manager in list(_managers):
+        manager.lock = threading.RLock()
+        manager.loading = {}
+        # so that siblings don't mistake each other's events for their own
+        manager.origin = uuid.uuid4().hex
+
+
+def publish_model_updated(msg_service, model_name, model_instance_id, **data):
+    msg_service.publish_event(
+        f"{MODEL_UPDATED_EVENT}/{model_name}/{urlencode(model_instance_id)}",
+        dict(model_name=model_name, model_instance_id=model_instance_id, **data),
+        qos=1,
+    )
+
+
+def _dispatch_model_updated(msg_service, event):
+    for manager in list(_managers):
+        if manager.context is not None and manager.context.msg_service is msg_service:
+            manager.on_model_updated(event)
+
+
+class ModelUpdatedListener:
+    # subscription destination, the message service calls put for each event
+    def __init__(self, msg_service):
+        self.msg_service = weakref.ref(msg_service)
+
+    def put(self, event):
+        msg_service = self.msg_service()
+        if msg_service is not None:
+            _dispatch_model_updated(msg_service, event)
+
+
+def subscribe_model_updates(msg_service):
+    """Route model updated events received by ``msg_service`` to the
+    ModelManagers using it. Subscribes once per connection."""
+    if msg_service is None or msg_service.subscriptions is None:
+        return
+    with _update_subscriptions_lock:
+        if msg_service.subscriptions in _update_subscriptions:
+            return
+        listener = ModelUpdatedListener(msg_service)
+        msg_service.subscribe_event(f"{MODEL_UPDATED_EVENT}/#", dest=listener)
+        _update_subscriptions[msg_service.subscriptions] = listener
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 class ModelManager:
     def __init__(self, config, context):
-        self.cache = ModelCache(config.yaada_model_cache_size)
+        self.cache = ModelCache(
+            config.yaada_model_cache_size,
+            max_bytes=config.yaada_model_cache_max_bytes,
+        )
         self.context = context
+        if config.yaada_models_archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(
+                f"unsupported model archive format '{config.yaada_models_archive_format}', expected one of {list(ARCHIVE_FORMATS)}"
+            )
+        self.archive_format = config.yaada_models_archive_format
+        self.models_directory = config.yaada_models_directory
+        self.mmap = config.yaada_models_mmap
+        # models evicted from memory reload from their extracted directories on
+        # disk, only a miss here goes back to object storage
+        self.disk_cache = ModelDiskCache(
+            self.models_directory, config.yaada_models_max_bytes
+        )
+        # guards the cache, which isn't thread safe, and the in-flight loads
+        self.lock = threading.RLock()
+        self.loading = {}  # key: model cache key, value: Future of the load
+        self.generations = {}  # bumped on invalidation to discard in-flight loads
+        # identifies the model updated events this manager published itself
+        self.origin = uuid.uuid4().hex
+        self.reload_on_update = config.yaada_models_reload_on_update
+        _managers.add(self)
+        if context is not None:
+            subscribe_model_updates(context.msg_service)
 
     def save_model_instance(
         self,
@@ -47,8 +174,13 @@ class ModelManager:
             local_path = tempfile.TemporaryDirectory().name
         save_path = model.save(local_path)
 
-        if model_cache_key not in self.cache:
-            self.cache[model_cache_key] = model
+        nbytes = estimate_model_bytes(model, path=save_path)
+        with self.lock:
+            # replaces a stale cached instance, and discards any in-flight load
+            self.generations[model_cache_key] = (
+                self.generations.get(model_cache_key, 0) + 1
+            )
+            self.cache.put(model_cache_key, model, nbytes)
 
         doc = {
             "doc_type": model_name,
@@ -58,14 +190,14 @@ class ModelManager:
         }
 
         if archive:
-            temp_dir = tempfile.TemporaryDirectory()
-            archive_name = f"{model_name}_{model_instance_id}.tar.gz"
-            archive_path = os.path.join(temp_dir.name, archive_name)
-            with tarfile.open(archive_path, "w:gz") as tgz:
-                tgz.add(save_path, arcname="")
-            with open(archive_path, "rb") as f:
+            archive_name = f"{model_name}_{model_instance_id}.{self.archive_format}"
+            compression = ARCHIVE_FORMATS[self.archive_format]
+            with tempfile.TemporaryFile() as f:
+                with open_compressed_writer(f, compression) as w:
+                    with tarfile.open(fileobj=w, mode="w|") as tar:
+                        tar.add(save_path, arcname="")
                 doc = self.context.ob_service.save_artifact(
-                    doc, "archive", os.path.basename(f.name), f
+                    doc, "archive", archive_name, f
                 )
         else:
             for type in model.get_artifact_types():
@@ -78,7 +210,18 @@ class ModelManager:
                             doc, type, os.path.basename(f.name), f
                         )
         if save_model_document:
-            self.context.update(doc, process=process_model_document)
+            # searchable before the event goes out, receivers reload from it
+            self.context.update(doc, process=process_model_document, barrier=True)
+        if save_model_document and self.context.msg_service is not None:
+            # other processes drop or reload their cached copy of this model. when
+            # the caller saves the document itself, it publishes once it's saved
+            publish_model_updated(
+                self.context.msg_service,
+                model_name,
+                model_instance_id,
+                model_full_name=model.get_full_name(),
+                origin=self.origin,
+            )
         return doc
 
     def load_model_instance(
@@ -100,54 +243,239 @@ class ModelManager:
         model_name = model_clazz.__name__
         model_cache_key = f"{model_name}/{model_instance_id}"
 
-        if model_cache_key in self.cache:
-            return self.cache[model_cache_key]
-        else:
-            if local_path is None:
-                local_path = tempfile.TemporaryDirectory().name
-
-            doc = self.context.get(model_name, model_instance_id)
-            if doc is not None:
-                if archive:
-                    temp_dir = tempfile.TemporaryDirectory()
-                    archive_name = f"{model_name}_{model_instance_id}.tar.gz"
-                    archive_path = self.context.ob_service.fetch_artifact_to_directory(
-                        doc, "archive", temp_dir.name
-                    )
-                    if archive_path is None:
-                        return None
-                    with tarfile.open(
-                        os.path.join(archive_path, archive_name), "r:gz"
-                    ) as tgz:
-                        tgz.extractall(
-                            path=os.path.join(local_path, model_name, model_instance_id)
+        # Single flight: the first caller for a key loads the model while any
+        # concurrent callers for the same key wait on its result.
+        with self.lock:
+            model = self.cache.lookup(model_cache_key)
+            if model is not None:
+                return model
+            future = self.loading.get(model_cache_key)
+            if future is None:
+                future = Future()
+                self.loading[model_cache_key] = future
+                generation = self.generations.get(model_cache_key, 0)
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            logger.debug(f"waiting on in-flight load of {model_cache_key}")
+            return future.result()
+
+        try:
+            model, nbytes = self._load_model_instance(
+                model_clazz, model_instance_id, local_path, archive
+            )
+            with self.lock:
+                if (
+                    model is not None
+                    and self.generations.get(model_cache_key, 0) == generation
+                ):
+                    self.cache.put(model_cache_key, model, nbytes)
+            future.set_result(model)
+            return model
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.loading.pop(model_cache_key, None)
+
+    def _load_model_instance(self, model_clazz, model_instance_id, local_path, archive):
+        model_name = model_clazz.__name__
+
+        doc = self.context.get(model_name, model_instance_id)
+        if doc is None:
+            return None, 0
+        with contextlib.ExitStack() as stack:
+            download_path = None
+            if archive:
+                blob = self.find_archive_blob(doc)
+                if blob is None:
+                    return None, 0
+                remote_file_path = self.context.ob_service.blob_remote_file_path(
+                    doc, "archive", blob
+                )
+                compression = compression_for_filename(blob["filename"])
+                if local_path is None:
+                    # the entry can't be evicted while the model loads from it
+                    local_path = stack.enter_context(
+                        self.use_disk_cache(
+                            model_name, model_instance_id, remote_file_path, compression
                         )
+                    )
                 else:
-                    self.context.ob_service.fetch_artifacts_to_directory(
-                        doc, local_path
+                    self.extract_archive(
+                        remote_file_path,
+                        compression,
+                        os.path.join(local_path, model_name, model_instance_id),
+                    )
+            else:
+                if local_path is None:
+                    local_path = download_path = self.download_directory(
+                        model_name, model_instance_id
                     )
+                self.context.ob_service.fetch_artifacts_to_directory(doc, local_path)
 
-                model = model_clazz.load(local_path, model_instance_id)
-                self.cache[model_cache_key] = model
-                return model
+            rss_before = current_rss()
+            model = model_clazz.load(local_path, model_instance_id, mmap=self.mmap)
+            if download_path is not None:
+                self.remove_old_downloads(download_path)
+            nbytes = estimate_model_bytes(
+                model,
+                rss_before=rss_before,
+                path=os.path.join(local_path, model_name, model_instance_id),
+            )
+        logger.debug(f"loaded {model_name}/{model_instance_id} ({nbytes} bytes)")
+        return model, nbytes
+
+    def download_directory(self, model_name, model_instance_id):
+        # every load of a non-archive model fetches into a directory of its own. A
+        # reused one would keep files the newer instance no longer has, and would
+        # change underneath a model that is still being served from it.
+        parent = os.path.join(
+            self.models_directory,
+            DOWNLOADS_DIRECTORY,
+            urlencode(model_name),
+            urlencode(model_instance_id),
+        )
+        os.makedirs(parent, exist_ok=True)
+        return tempfile.mkdtemp(dir=parent)
+
+    def remove_old_downloads(self, download_path):
+        # the previous loads of this instance have been replaced once a newer one
+        # loaded successfully
+        parent = os.path.dirname(download_path)
+        for name in os.listdir(parent):
+            path = os.path.join(parent, name)
+            if path != download_path:
+                shutil.rmtree(path, ignore_errors=True)
 
-        return None
+    def find_archive_blob(self, doc):
+        blobs = doc.get("artifacts", {}).get("archive", [])
+        prefix = f"{doc['doc_type']}_{doc['_id']}.tar"
+        for blob in blobs:
+            if blob.get("filename", "").startswith(prefix):
+                return blob
+        return blobs[0] if len(blobs) > 0 else None
+
+    def use_disk_cache(
+        self, model_name, model_instance_id, remote_file_path, compression
+    ):
+        key = f"{model_name}/{model_instance_id}"
+        etag = self.context.ob_service.head_file(remote_file_path)["etag"]
+        return self.disk_cache.use(
+            key,
+            etag,
+            lambda entry: self.extract_archive(
+                remote_file_path,
+                compression,
+                os.path.join(entry, model_name, model_instance_id),
+            ),
+        )
+
+    def extract_archive(self, remote_file_path, compression, model_dir):
+        # Stream the archive straight out of object storage into a scratch
+        # directory next to model_dir and swap it into place once complete, so
+        # that readers never see a partially extracted model. Files of a model
+        # replaced this way stay valid for anyone still memory mapping them.
+        parent = os.path.dirname(model_dir)
+        os.makedirs(parent, exist_ok=True)
+        scratch_dir = tempfile.mkdtemp(prefix=".extract-", dir=parent)
+        try:
+            with self.context.ob_service.open_artifact(remote_file_path) as f:
+                with open_compressed_reader(f, compression) as r:
+                    with tarfile.open(fileobj=r, mode="r|") as tar:
+                        if hasattr(tarfile, "data_filter"):
+                            tar.extractall(path=scratch_dir, filter="data")
+                        else:
+                            tar.extractall(path=scratch_dir)
+            stale_dir = None
+            if os.path.isdir(model_dir):
+                stale_dir = f"{model_dir}.stale-{uuid.uuid4().hex}"
+                os.rename(model_dir, stale_dir)
+            try:
+                os.rename(scratch_dir, model_dir)
+            except OSError:
+                if not os.path.isdir(model_dir):
+                    raise
+                # another process extracted the same model concurrently
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            if stale_dir is not None:
+                shutil.rmtree(stale_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            raise
+        return model_dir
 
     def invalidate_model_instance(self, model_clazz, model_instance_id):
         model_cache_key = f"{model_clazz.__name__}/{model_instance_id}"
-        if model_cache_key in self.cache:
+        with self.lock:
+            self.generations[model_cache_key] = (
+                self.generations.get(model_cache_key, 0) + 1
+            )
+            if model_cache_key in self.cache:
+                self.cache.mark_evictable(model_cache_key)
+                del self.cache[model_cache_key]
+
+    def on_model_updated(self, event):
+        # Called on the message service's network thread, so anything slow is
+        # left to a background thread.
+        if event.get("origin", None) == self.origin:
+            return
+        model_name = event["model_name"]
+        model_instance_id = event["model_instance_id"]
+        modelservice.invalidate_model_instance(model_name, model_instance_id)
+
+        model_cache_key = f"{model_name}/{model_instance_id}"
+        with self.lock:
+            self.generations[model_cache_key] = (
+                self.generations.get(model_cache_key, 0) + 1
+            )
+            if model_cache_key not in self.cache:
+                return
+            model_clazz = self.cache.peek(model_cache_key).__class__
+            unevictable = model_cache_key in self.cache.unevictable_nodes()
             self.cache.mark_evictable(model_cache_key)
             del self.cache[model_cache_key]
+        logger.info(f"evicted {model_cache_key}, it was updated elsewhere")
+
+        # models that are pinned in memory are expected to stay loaded
+        if unevictable or self.reload_on_update:
+            threading.Thread(
+                target=self._reload_model_instance,
+                args=(model_clazz, model_instance_id, unevictable),
+                daemon=True,
+            ).start()
+
+    def _reload_model_instance(self, model_clazz, model_instance_id, unevictable):
+        try:
+            model = self.load_model_instance(model_clazz, model_instance_id)
+            if model is not None and unevictable:
+                self.mark_model_unevictable(model_clazz, model_instance_id)
+            logger.info(f"reloaded {model_clazz.__name__}/{model_instance_id}")
+        except Exception:
+            logger.error(
+                f"failed to reload {model_clazz.__name__}/{model_instance_id}",
+                exc_info=True,
+            )
 
     def mark_model_unevictable(self, model_clazz, model_instance_id):
         model_cache_key = f"{model_clazz.__name__}/{model_instance_id}"
-        if model_cache_key in self.cache:
-            self.cache.mark_unevictable(model_cache_key)
+        with self.lock:
+            if model_cache_key in self.cache:
+                self.cache.mark_unevictable(model_cache_key)
 
     def mark_model_evictable(self, model_clazz, model_instance_id):
         model_cache_key = f"{model_clazz.__name__}/{model_instance_id}"
-        if model_cache_key in self.cache:
-            self.cache.mark_evictable(model_cache_key)
+        with self.lock:
+            if model_cache_key in self.cache:
+                self.cache.mark_evictable(model_cache_key)
 
     def get_unevictable(self):
-        return self.cache.unevictable_nodes()
+        with self.lock:
+            return list(self.cache.unevictable_nodes())
+
+    def get_cache_stats(self):
+        with self.lock:
+            return dict(**self.cache.stats(), disk=self.disk_cache.stats())
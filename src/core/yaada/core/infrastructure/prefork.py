@@ -0,0 +1,134 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+import traceback
+
+from yaada.core import default_log_level
+from yaada.core.infrastructure.modelmanager import subscribe_model_updates
+from yaada.core.infrastructure.providers import (
+    make_document_service,
+    make_objectstorage_service,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+
+def prepare_for_fork(context):
+    """Quiesce a fully initialized context in the parent process before forking.
+
+    Stops the MQTT network thread, and moves everything allocated so far (the
+    preloaded models in particular) into the garbage collector's permanent
+    generation. Collections in the children then never touch those objects,
+    which keeps their pages shared copy-on-write instead of being copied into
+    every child.
+    """
+    if context.msg_service is not None:
+        context.msg_service.disconnect()
+    gc.collect()
+    gc.freeze()
+
+
+def reconnect_after_fork(context, client_id):
+    """Give a forked child its own service connections.
+
+    Sockets inherited from the parent can't be shared between processes, so
+    the document and object storage services are replaced on the context and
+    its pipeline context, and the message service reconnects.
+    """
+    doc_service = make_document_service(context.config, overrides=context.overrides)
+    ob_service = make_objectstorage_service(
+        context.config, overrides=context.overrides
+    )
+    contexts = [context]
+    if context._document_pipeline is not None:
+        contexts.append(context._document_pipeline.context)
+    for c in contexts:
+        c.doc_service = doc_service
+        c.ob_service = ob_service
+    if context.msg_service is not None:
+        context.msg_service.connect(client_id)
+        subscribe_model_updates(context.msg_service)
+
+
+def fork_workers(processes, child_main, restart_delay=1.0):
+    """Fork ``processes`` children that each run ``child_main(index)``.
+
+    The parent stays behind as a supervisor: it restarts children that fail
+    and forwards SIGTERM/SIGINT to them, returning once they have
+    all exited.
+    """
+    children = {}  # key: pid, value: worker index
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                child_main(index)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        logger.info(f"started worker process {index} (pid {pid})")
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(processes):
+        spawn(index)
+
+    while len(children) > 0:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        code = os.waitstatus_to_exitcode(status)
+        if index is None or stopping or code == 0:
+            continue
+        logger.warning(
+            f"worker process {index} (pid {pid}) exited with status {code}, restarting"
+        )
+        time.sleep(restart_delay)
+        spawn(index)
@@ -21,6 +21,7 @@ import json
 import logging
 import os
 import queue
+import threading
 from datetime import datetime, timedelta
 from uuid import uuid4
 
@@ -55,7 +56,13 @@ def extract_message_payload(msg):
 
 class RawMessage(object):
     def __init__(
-        self, key, payload=None, rawProps=None, jsondata=None, jsonencoder=None
+        self,
+        key,
+        payload=None,
+        rawProps=None,
+        jsondata=None,
+        jsonencoder=None,
+        retain=False,
     ):
         if rawProps is not None:
             self.rawProps = rawProps
@@ -64,6 +71,8 @@ class RawMessage(object):
 
         self.key = key
         self.payload = payload
+        # set on received messages that the broker delivered from its retained store
+        self.retain = retain
 
         if jsondata:
             self.payload = json.dumps(jsondata, cls=jsonencoder).encode("utf-8")
@@ -125,7 +134,9 @@ class RawConnection(object):
         payload = extract_message_payload(msg)
         if callback:
             try:
-                callback(RawMessage(msg.topic, payload, msg.properties))
+                callback(
+                    RawMessage(msg.topic, payload, msg.properties, retain=msg.retain)
+                )
             except Exception:
                 self.__logger.error("Failed message callback", exc_info=True)
         else:
@@ -168,7 +179,7 @@ class RawConnection(object):
 
     # Publish
     def publish(self, msg, qos=0, retain=False):
-        self.__mqttc.publish(
+        return self.__mqttc.publish(
             msg.key, msg.payload, qos=qos, retain=retain, properties=msg.rawProps
         )
 
@@ -182,7 +193,9 @@ class RawConnection(object):
         def my_callback(client, userdata, msg):
             try:
                 payload = extract_message_payload(msg)
-                callback(RawMessage(msg.topic, payload, msg.properties))
+                callback(
+                    RawMessage(msg.topic, payload, msg.properties, retain=msg.retain)
+                )
             except Exception:
                 self.__logger.error("Failed message callback", exc_info=True)
 
@@ -266,6 +279,20 @@ class BufferedStream:
         self._callback = None
 
 
+def shared_subscription(sub, group):
+    # with a shared subscription the broker hands each message to only one of
+    # the subscribers in the group
+    if group is None:
+        return sub
+    return f"$share/{group}/{sub}"
+
+
+def topic_filter(sub):
+    if sub.startswith("$share/"):
+        return sub.split("/", 2)[2]
+    return sub
+
+
 class SubscriptionManager:
     def __init__(self, connection, default_queue):
         self.connection = connection
@@ -289,7 +316,7 @@ class SubscriptionManager:
 
     def put(self, doc):
         for sub, dests in self.subscriptions.items():
-            if mqtt.topic_matches_sub(sub, doc["_topic"]):
+            if mqtt.topic_matches_sub(topic_filter(sub), doc["_topic"]):
                 for d in dests:
                     d.put(doc)
 
@@ -297,6 +324,11 @@ class SubscriptionManager:
 logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
 
+SINKLOG_BATCH = "_sinklog_batch"
+# batches are published per doc_type as <sinklog>/<doc_type>/_batch, so that
+# subscriptions to <sinklog>/<doc_type>/# still see every document of that type
+SINKLOG_BATCH_TOPIC = "_batch"
+
 
 def onConnection(isConnected, rc):
     if isConnected:
@@ -351,10 +383,14 @@ class MQTTProvider:
         self.analytic_name = analytic_name
         self.analytic_session_id = analytic_session_id
 
-    def subscribe_ingest(self):
-        ingest_subscription = f"{self._ingest_topic}/#"
+    def subscribe_ingest(self, shared_group=None, drain_retained=False):
+        ingest_subscription = shared_subscription(
+            f"{self._ingest_topic}/#", shared_group
+        )
         self.subscriptions.subscribe(ingest_subscription)
         logger.info(f"ingest_subscription: {ingest_subscription}")
+        if drain_retained and shared_group is not None:
+            self.drain_retained(ingest_subscription)
 
     def subscribe_sink(self):
         sink_subscription = f"{self._sink_topic}/#"
@@ -366,7 +402,13 @@ class MQTTProvider:
         self.subscriptions.subscribe(sinklog_subscription)
         logger.info(f"sinklog_subscription: {sinklog_subscription}")
 
-    def subscribe_analytic_request(self, analytic_name=None, analytic_session_id=None):
+    def subscribe_analytic_request(
+        self,
+        analytic_name=None,
+        analytic_session_id=None,
+        shared_group=None,
+        drain_retained=False,
+    ):
         sub_base = self._analytic_request_topic
         if analytic_name is None and analytic_session_id is None:
             sub = f"{sub_base}/#"
@@ -374,8 +416,36 @@ class MQTTProvider:
             sub = f"{sub_base}/{analytic_name}/#"
         else:
             sub = f"{sub_base}/{analytic_name}/{analytic_session_id}"
+        sub = shared_subscription(sub, shared_group)
         self.subscriptions.subscribe(sub)
         logger.info(f"analytic_request_subscription: {sub}")
+        if drain_retained and shared_group is not None:
+            self.drain_retained(sub)
+
+    def drain_retained(self, sub, seconds=None):
+        # brokers never deliver retained messages to shared subscriptions, so
+        # whatever was retained before the group subscribed is picked up through
+        # a plain subscription on a short-lived second connection. only messages
+        # from the retained store are kept, live ones are left to the group.
+        if seconds is None:
+            seconds = self._config.mqtt_retained_drain_seconds
+        hostname = self.overrides.get("hostname", self._config.mqtt_hostname)
+        port = self.overrides.get("port", self._config.mqtt_port)
+        connection = RawConnection(
+            f"{self._client_id}-drain-{str(uuid4())}", host=hostname, port=port
+        )
+
+        def on_message(msg):
+            if msg.retain:
+                self._incoming_message(msg)
+
+        connection.onMessage = on_message
+        connection.connect()
+        connection.subscribe(topic_filter(sub))
+        logger.info(f"draining retained {topic_filter(sub)} for {seconds} seconds")
+        timer = threading.Timer(seconds, connection.disconnect)
+        timer.daemon = True
+        timer.start()
 
     def subscribe_analytic_status(self, analytic_name, analytic_session_id):
         sub_base = self._analytic_status_topic
@@ -425,12 +495,35 @@ class MQTTProvider:
 
     def publish_sinklog(self, doc):
         msg = RawMessage(
-            f"{self._sinklog_topic}/{doc['doc_type']}/{utility.urlencode(doc['_id'])}",
+            self.sinklog_topic(doc),
             jsondata=doc,
             jsonencoder=utility.DateTimeEncoder,
         )
         self._send_msg(msg, retain=False, qos=0)
 
+    def sinklog_topic(self, doc):
+        doc_type = doc["doc_type"]
+        return f"{self._sinklog_topic}/{doc_type}/{utility.urlencode(doc['_id'])}"
+
+    def publish_sinklog_batch(self, docs):
+        # with yaada.mqtt.sinklog_batches, one envelope per doc_type in the batch
+        # instead of one message per document. _incoming_message unpacks it back
+        # into documents, other subscribers only see documents by default.
+        if not self._config.mqtt_sinklog_batches:
+            for doc in docs:
+                self.publish_sinklog(doc)
+            return
+        by_doc_type = {}
+        for doc in docs:
+            by_doc_type.setdefault(doc["doc_type"], []).append(doc)
+        for doc_type, batch in by_doc_type.items():
+            msg = RawMessage(
+                f"{self._sinklog_topic}/{doc_type}/{SINKLOG_BATCH_TOPIC}",
+                jsondata={SINKLOG_BATCH: batch},
+                jsonencoder=utility.DateTimeEncoder,
+            )
+            self._send_msg(msg, retain=False, qos=0)
+
     def analytic_request_topic(self, analytic_name, analytic_session_id):
         return f"{self._analytic_request_topic}/{analytic_name}/{analytic_session_id}"
 
@@ -467,6 +560,15 @@ class MQTTProvider:
         msg = RawMessage(topic, payload=None)
         self._send_msg(msg, retain=True)
 
+    def delete_retained_topics(self, topics, qos=1):
+        # the clears are pipelined by the mqtt client; since the broker handles
+        # them in order, waiting on the last one confirms the whole batch.
+        last = None
+        for topic in topics:
+            last = self._send_msg(RawMessage(topic, payload=None), qos=qos, retain=True)
+        if last is not None and qos > 0:
+            last.wait_for_publish(timeout=self._config.connection_timeout)
+
     def fetch(self, timeout_ms=1000, max_count=1000):
         return self.receive_buffer.fetch(timeout_ms=timeout_ms, max_count=max_count)
 
@@ -474,6 +576,19 @@ class MQTTProvider:
         if not msg.payload:
             return
         doc = msg.jsondata
+        if (
+            msg.key.startswith(f"{self._sinklog_topic}/")
+            and msg.key.endswith(f"/{SINKLOG_BATCH_TOPIC}")
+            and isinstance(doc, dict)
+            and SINKLOG_BATCH in doc
+        ):
+            for d in doc[SINKLOG_BATCH]:
+                d["_topic"] = self.sinklog_topic(d)
+                if "@timestamp" not in d:
+                    d["@timestamp"] = datetime.utcnow()
+                self.subscriptions.put(d)
+            logger.debug(f"mqtt received {len(doc[SINKLOG_BATCH])} sinklog documents")
+            return
         doc["_topic"] = msg.key
         if "@timestamp" not in doc:
             doc["@timestamp"] = datetime.utcnow()
@@ -481,7 +596,7 @@ class MQTTProvider:
         logger.debug(f"mqtt received {msg.payload}")
 
     def _send_msg(self, rawmsg, qos=0, retain=False):
-        self.connection.publish(rawmsg, qos=qos, retain=retain)
+        return self.connection.publish(rawmsg, qos=qos, retain=retain)
 
 
 class ExternalMQTTProvider:
@@ -17,20 +17,142 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import contextlib
+import hashlib
+import io
 import logging
 import mimetypes
 import os
+import shutil
 import tempfile
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import boto3
 import botocore
+from boto3.s3.transfer import TransferConfig
 
 from yaada.core import default_log_level, exceptions, utility
+from yaada.core.infrastructure.artifactcache import (
+    FETCH_ATTEMPTS,
+    ArtifactCache,
+    relpath_for_remote_file,
+)
 
 mimetypes.add_type("text/markdown", ".md")
 logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
 
+# file level transfers for artifact directories share one pool per process
+_transfer_pool = None
+_transfer_pool_lock = threading.Lock()
+
+
+def get_transfer_pool(workers):
+    global _transfer_pool
+    with _transfer_pool_lock:
+        if _transfer_pool is None:
+            _transfer_pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="yaada-transfer"
+            )
+        return _transfer_pool
+
+
+def _reset_transfer_pool():
+    # a forked child doesn't inherit the parent's pool threads
+    global _transfer_pool, _transfer_pool_lock
+    _transfer_pool = None
+    _transfer_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_transfer_pool)
+
+
+class ObjectReader(io.RawIOBase):
+    """Seekable, read-only view of an object in object storage.
+
+    Sequential reads are served from a single open-ended ranged GET, a seek to
+    a different position starts a new ranged GET from there. Wrap in an
+    io.BufferedReader (see ObjectStorageProvider.open_artifact) for read-ahead.
+    """
+
+    def __init__(self, client, bucket, key, size=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        if size is None:
+            size = client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.size = size
+        self._pos = 0
+        self._body = None
+        self._body_pos = None
+
+    @property
+    def name(self):
+        return self.key
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence {whence}")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return self._pos
+
+    def readinto(self, b):
+        if self._pos >= self.size or len(b) == 0:
+            return 0
+        if self._body is None or self._body_pos != self._pos:
+            self._close_body()
+            r = self.client.get_object(
+                Bucket=self.bucket, Key=self.key, Range=f"bytes={self._pos}-"
+            )
+            self._body = r["Body"]
+            self._body_pos = self._pos
+        data = self._body.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        self._body_pos += n
+        return n
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+            self._body_pos = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+def artifact_ref(doc, artifact_type, filename):
+    return dict(
+        doc_type=doc["doc_type"],
+        _id=doc["_id"],
+        artifact_type=artifact_type,
+        filename=filename,
+    )
+
 
 class ObjectStorageProvider:
     def __init__(self, config, overrides={}):
@@ -72,6 +194,19 @@ class ObjectStorageProvider:
             "make_bucket", self.config.object_storage_make_bucket
         )
 
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.config.object_storage_multipart_threshold,
+            multipart_chunksize=self.config.object_storage_multipart_chunksize,
+            max_concurrency=self.config.object_storage_max_concurrency,
+            use_threads=True,
+        )
+        self.transfer_workers = self.config.object_storage_transfer_workers
+        self.read_ahead = self.config.object_storage_read_ahead
+        self.content_addressed = overrides.get(
+            "content_addressed", self.config.object_storage_content_addressed
+        )
+        self._artifact_cache = None
+
         if self.enabled:
             utility.wait_net_service(
                 "objectstorage", self.object_storage_url, 5.0, config.connection_timeout
@@ -107,6 +242,12 @@ class ObjectStorageProvider:
     def create_temp_dir(self):
         return tempfile.TemporaryDirectory()
 
+    def map_transfers(self, fn, items):
+        # run fn over items on the shared transfer pool, re-raising the first error
+        pool = get_transfer_pool(self.transfer_workers)
+        futures = [pool.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+
     def get_content_type(self, filename):
         return mimetypes.guess_type(filename)
 
@@ -119,50 +260,136 @@ class ObjectStorageProvider:
         )
         return remote_path
 
+    @property
+    def artifact_cache(self):
+        if self._artifact_cache is None:
+            self._artifact_cache = ArtifactCache(
+                self.config.object_storage_cache_directory,
+                self.config.object_storage_cache_max_bytes,
+                validate=self.config.object_storage_cache_validate,
+            )
+        return self._artifact_cache
+
+    def head_file(self, remote_file_path):
+        r = self.client.head_object(Bucket=self.bucket, Key=remote_file_path)
+        return dict(etag=r["ETag"].strip('"'), size=r["ContentLength"])
+
+    def download_file(self, remote_file_path, local_file_path):
+        self.client.download_file(
+            Bucket=self.bucket,
+            Key=remote_file_path,
+            Filename=local_file_path,
+            Config=self.transfer_config,
+        )
+
+    def fetch_file_to_cache(self, remote_file_path, relpath=None):
+        self.check_enabled()
+        if relpath is None:
+            relpath = relpath_for_remote_file(remote_file_path)
+        return self.artifact_cache.fetch(
+            relpath, remote_file_path, self.head_file, self.download_file
+        )
+
     def fetch_file_to_temp(self, remote_file_path):
+        # served from the artifact cache, the returned file must be treated as
+        # read only
         self.check_enabled()
-        tf = tempfile.NamedTemporaryFile()
-        self.client.download_fileobj(
-            Bucket=self.bucket, Key=remote_file_path, Fileobj=tf
+        return self.artifact_cache.open(
+            relpath_for_remote_file(remote_file_path),
+            remote_file_path,
+            self.head_file,
+            self.download_file,
         )
-        tf.seek(0)
-        return tf
 
-    def fetch_file_to_directory(self, remote_file_path, local_dir, filename):
+    def open_artifact(self, remote_file_path, read_ahead=None):
+        """Open a file in object storage for streaming reads. The returned file
+        object is seekable and only fetches the bytes that are actually read."""
         self.check_enabled()
-        if not os.path.isdir(local_dir):
-            os.makedirs(local_dir)
-        local_file_path = f"{local_dir}/{filename}"
-        self.client.download_file(
-            Bucket=self.bucket, Key=remote_file_path, Filename=local_file_path
+        return io.BufferedReader(
+            ObjectReader(self.client, self.bucket, remote_file_path),
+            buffer_size=read_ahead or self.read_ahead,
         )
 
+    def fetch_file_to_directory(self, remote_file_path, local_dir, filename):
+        self.check_enabled()
+        os.makedirs(local_dir, exist_ok=True)
+        self.download_file(remote_file_path, f"{local_dir}/{filename}")
+
+    def blob_remote_file_path(self, doc, artifact_type, blob):
+        if "remote_file_path" in blob:
+            return blob["remote_file_path"]
+        remote_path = self.create_remote_path(artifact_type, doc)
+        return f"{remote_path}/{utility.urlencode(blob['filename'])}"
+
+    def link_artifact_files(self, doc, artifact_type, local_path):
+        # fetch every file through the artifact cache and link it into local_path
+        remote_path = self.create_remote_path(artifact_type, doc)
+        reldir = os.path.join(*remote_path.split("/"))
+        os.makedirs(local_path, exist_ok=True)
+
+        def fetch(blob):
+            relpath = os.path.join(reldir, blob["filename"])
+            destination = os.path.join(local_path, blob["filename"])
+            remote_file_path = self.blob_remote_file_path(doc, artifact_type, blob)
+            for _ in range(FETCH_ATTEMPTS):
+                self.fetch_file_to_cache(remote_file_path, relpath)
+                if self.artifact_cache.link(relpath, destination):
+                    return
+            raise IOError(f"{relpath} keeps getting evicted from the artifact cache")
+
+        self.map_transfers(fetch, doc["artifacts"][artifact_type])
+
     def fetch_artifact_to_directory(
         self, doc, artifact_type, cache_dir="/tmp/yaada/artifacts-cache"
     ):
+        """Fetch all files of an artifact to
+        ``<cache_dir>/<doc_type>/<_id>/<artifact_type>`` and return that
+        directory. The files are validated by the managed artifact cache and
+        hard linked from it, replacing stale copies. ``cache_dir`` belongs to the
+        caller: it doesn't count against the cache's byte budget and its files
+        stay after the cache evicted them. Use `artifact_directory` to read an
+        artifact without keeping a copy around."""
         self.check_enabled()
         if "artifacts" not in doc or artifact_type not in doc["artifacts"]:
             return None
 
-        remote_path = self.create_remote_path(artifact_type, doc)
         local_path = os.path.join(
             cache_dir,
             utility.urlencode(doc["doc_type"]),
             utility.urlencode(doc["_id"]),
             artifact_type,
         )
-        for blob in doc["artifacts"][artifact_type]:
-            remote_file_path = f"{remote_path}/{utility.urlencode(blob['filename'])}"
-            if not os.path.isfile(os.path.join(local_path, blob["filename"])):
-                self.fetch_file_to_directory(
-                    remote_file_path, local_path, blob["filename"]
-                )
+        self.link_artifact_files(doc, artifact_type, local_path)
         return local_path
 
     def fetch_artifacts_to_directory(self, doc, cache_dir="/tmp/yaada/artifacts-cache"):
+        """Fetch all artifacts of a document like `fetch_artifact_to_directory`
+        and return a dict of artifact_type to local directory."""
+        self.check_enabled()
+        return {
+            artifact_type: self.fetch_artifact_to_directory(
+                doc, artifact_type, cache_dir
+            )
+            for artifact_type in doc.get("artifacts", {}).keys()
+        }
+
+    @contextlib.contextmanager
+    def artifact_directory(self, doc, artifact_type):
+        """Context manager yielding a temporary directory with all files of an
+        artifact, or None if the document has no such artifact. The files are
+        hard links into the managed artifact cache, so they must be treated as
+        read only. Eviction doesn't remove them while the directory exists, the
+        directory and the space of evicted files are freed on exit."""
         self.check_enabled()
-        for artifact_type in doc["artifacts"].keys():
-            self.fetch_artifact_to_directory(doc, artifact_type, cache_dir)
+        if "artifacts" not in doc or artifact_type not in doc["artifacts"]:
+            yield None
+            return
+        local_path = tempfile.mkdtemp(prefix="yaada-artifact-")
+        try:
+            self.link_artifact_files(doc, artifact_type, local_path)
+            yield local_path
+        finally:
+            shutil.rmtree(local_path, ignore_errors=True)
 
     def save_file(self, remote_path, filename, file):
         self.check_enabled()
@@ -172,7 +399,12 @@ class ObjectStorageProvider:
 
         remote_file_path = f"{remote_path}/{utility.urlencode(filename)}"
 
-        self.client.put_object(Bucket=self.bucket, Key=remote_file_path, Body=file)
+        self.client.upload_fileobj(
+            Fileobj=file,
+            Bucket=self.bucket,
+            Key=remote_file_path,
+            Config=self.transfer_config,
+        )
         file.close()
         return dict(
             remote_file_path=remote_file_path,
@@ -181,18 +413,149 @@ class ObjectStorageProvider:
             filename=filename,
         )
 
+    def create_content_path(self, digest):
+        return f"{self.tenant}/blobs/sha256/{digest[:2]}/{digest}"
+
+    def exists(self, remote_file_path):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=remote_file_path)
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def create_ref_prefix(self, digest):
+        return f"{self.tenant}/blobrefs/sha256/{digest[:2]}/{digest}"
+
+    def create_ref_path(self, digest, ref):
+        # one empty marker object per referencing artifact, so concurrent writers
+        # never read-modify-write a shared index
+        parts = [ref["doc_type"], ref["_id"], ref["artifact_type"], ref["filename"]]
+        return "/".join(
+            [self.create_ref_prefix(digest)] + [utility.urlencode(p) for p in parts]
+        )
+
+    def add_blob_ref(self, digest, ref):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.create_ref_path(digest, ref), Body=b""
+        )
+
+    def blob_refs(self, digest):
+        """The artifacts recorded as referencing the blob ``digest``, as dicts of
+        doc_type, _id, artifact_type, filename and the marker's key and
+        last_modified."""
+        prefix = f"{self.create_ref_prefix(digest)}/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for ob in page.get("Contents", []):
+                parts = ob["Key"][len(prefix) :].split("/")
+                if len(parts) != 4:
+                    continue
+                doc_type, _id, artifact_type, filename = map(
+                    urllib.parse.unquote, parts
+                )
+                yield dict(
+                    doc_type=doc_type,
+                    _id=_id,
+                    artifact_type=artifact_type,
+                    filename=filename,
+                    key=ob["Key"],
+                    last_modified=ob["LastModified"],
+                )
+
+    def list_blobs(self):
+        # (digest, last modified) of every content-addressed blob of the tenant
+        prefix = f"{self.tenant}/blobs/sha256/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for ob in page.get("Contents", []):
+                yield ob["Key"].rsplit("/", 1)[-1], ob["LastModified"]
+
+    def collect_blob_garbage(self, is_live, min_age_seconds=3600, dry_run=False):
+        """Delete content-addressed blobs that no document references anymore.
+
+        ``is_live(ref, digest)`` decides whether a recorded reference still holds.
+        References are recorded before their document is saved, so a reference
+        younger than ``min_age_seconds`` is kept even if it doesn't hold yet, and
+        older ones that don't hold are removed. A blob is deleted once it is older
+        than ``min_age_seconds`` and has neither a live nor a recent reference.
+        Returns counts of the blobs seen, the blobs deleted and the stale
+        references."""
+        self.check_enabled()
+        counts = dict(blobs=0, deleted=0, stale_refs=0)
+        now = datetime.now(timezone.utc)
+        for digest, last_modified in self.list_blobs():
+            counts["blobs"] += 1
+            kept = 0
+            for ref in self.blob_refs(digest):
+                if (now - ref["last_modified"]).total_seconds() < min_age_seconds:
+                    kept += 1
+                elif is_live(ref, digest):
+                    kept += 1
+                else:
+                    counts["stale_refs"] += 1
+                    if not dry_run:
+                        self.client.delete_object(Bucket=self.bucket, Key=ref["key"])
+            age = (now - last_modified).total_seconds()
+            if kept == 0 and age >= min_age_seconds:
+                counts["deleted"] += 1
+                logger.info(f"unreferenced blob {digest}")
+                if not dry_run:
+                    self.client.delete_object(
+                        Bucket=self.bucket, Key=self.create_content_path(digest)
+                    )
+        return counts
+
+    def save_content_addressed_file(self, remote_path, filename, file, ref=None):
+        """Store a file under the hash of its content, skipping the upload if the
+        same content is already stored. The returned blob metadata still carries
+        the per-document remote_path and filename. ``ref`` (doc_type, _id,
+        artifact_type and filename) is recorded as referencing the blob, before
+        the blob is stored, so that `collect_blob_garbage` never sees it
+        unreferenced."""
+        self.check_enabled()
+        file.seek(0)
+        h = hashlib.sha256()
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            h.update(chunk)
+        file_size = file.tell()
+        digest = h.hexdigest()
+        remote_file_path = self.create_content_path(digest)
+        if ref is not None:
+            self.add_blob_ref(digest, ref)
+
+        if self.exists(remote_file_path):
+            logger.debug(f"{filename} already stored as {remote_file_path}")
+        else:
+            file.seek(0)
+            self.client.upload_fileobj(
+                Fileobj=file,
+                Bucket=self.bucket,
+                Key=remote_file_path,
+                Config=self.transfer_config,
+            )
+        file.close()
+        return dict(
+            remote_file_path=remote_file_path,
+            file_size=file_size,
+            remote_path=remote_path,
+            filename=filename,
+            sha256=digest,
+        )
+
+    def save_artifact_file(self, remote_path, filename, file, ref=None):
+        if self.content_addressed:
+            return self.save_content_addressed_file(remote_path, filename, file, ref)
+        return self.save_file(remote_path, filename, file)
+
     def find_artifact(self, doc, artifact_type, filename):
         if "artifacts" in doc and artifact_type in doc["artifacts"]:
             for blob in doc["artifacts"][artifact_type]:
                 if blob.get("filename", None) == filename:
                     return blob
 
-    def save_artifact(self, doc, artifact_type, filename, file):
-        self.check_enabled()
-        # file.seek(0, 2)  # go to end of file
-        # file_size = file.tell()
-        file.seek(0)
-
+    def artifact_blob(self, doc, artifact_type, filename):
         cleaned_filename = filename.split("?")[
             0
         ]  # stripping off any querystring parameters on end of filename
@@ -209,10 +572,18 @@ class ObjectStorageProvider:
             if content_type is not None:
                 blob["content_type"] = content_type
             doc["artifacts"][artifact_type].append(blob)
+        return blob
+
+    def save_artifact(self, doc, artifact_type, filename, file):
+        self.check_enabled()
+        file.seek(0)
+
+        blob = self.artifact_blob(doc, artifact_type, filename)
 
         remote_path = self.create_remote_path(artifact_type, doc)
 
-        blob.update(self.save_file(remote_path, filename, file))
+        ref = artifact_ref(doc, artifact_type, filename)
+        blob.update(self.save_artifact_file(remote_path, filename, file, ref))
 
         return doc
 
@@ -231,13 +602,24 @@ class ObjectStorageProvider:
             f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))
         ]
 
-        for filename in files:
-            if re_skip_matches is not None and any(
-                [f.match(filename) for f in re_skip_matches]
-            ):
-                continue
+        if re_skip_matches is not None:
+            files = [
+                filename
+                for filename in files
+                if not any([f.match(filename) for f in re_skip_matches])
+            ]
+
+        # the doc is only touched from this thread, the uploads run on the pool
+        blobs = [self.artifact_blob(doc, artifact_type, filename) for filename in files]
+        remote_path = self.create_remote_path(artifact_type, doc)
+
+        def upload(filename):
             with open(os.path.join(dir_path, filename), "rb") as f:
-                self.save_artifact(doc, artifact_type, filename, f)
+                ref = artifact_ref(doc, artifact_type, filename)
+                return self.save_artifact_file(remote_path, filename, f, ref)
+
+        for blob, result in zip(blobs, self.map_transfers(upload, files)):
+            blob.update(result)
 
         return doc
 
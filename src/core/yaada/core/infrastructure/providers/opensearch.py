@@ -24,7 +24,7 @@ import time
 import warnings
 from datetime import datetime, timedelta
 
-from deepmerge import always_merger
+from deepmerge import Merger, always_merger
 from opensearchpy import OpenSearch, helpers
 from opensearchpy.client import ClusterClient, IndicesClient
 from opensearchpy.exceptions import NotFoundError
@@ -35,6 +35,10 @@ from yaada.core import default_log_level, utility
 logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
 
+# mirrors how opensearch applies a partial update document: objects are merged
+# recursively while lists and scalars replace the existing value.
+partial_update_merger = Merger([(dict, ["merge"])], ["override"], ["override"])
+
 
 class OpenSearchProvider:
     def __init__(self, config, overrides={}):
@@ -68,6 +72,8 @@ class OpenSearchProvider:
         self.tenant = overrides.get("tenant", config.tenant)
         self.prefix = overrides.get("prefix", config.data_prefix)
         self.document_buffer = []
+        self.document_buffer_index = {}
+        self.document_buffer_merged = set()
         self.result_buffer = []
         self.last_result_flush = datetime.utcnow()
         self.last_document_flush = datetime.utcnow()
@@ -259,7 +265,33 @@ class OpenSearchProvider:
         )
 
     def enqueue_document(self, doc):
-        self.document_buffer.append(doc)
+        # coalesce consecutive writes to the same document so that each id in the
+        # buffer results in a single bulk action.
+        if not self.doc_is_valid(doc):
+            self.document_buffer.append(doc)
+            return
+        key = (doc["doc_type"], doc["_id"])
+        if key not in self.document_buffer_index:
+            self.document_buffer_index[key] = len(self.document_buffer)
+            self.document_buffer.append(doc)
+            return
+        i = self.document_buffer_index[key]
+        if doc.get("_op_type", "index") == "index":
+            # an index op replaces the whole document, so earlier ops are moot
+            self.document_buffer[i] = doc
+            self.document_buffer_merged.discard(key)
+        else:
+            # merge the update into whatever is buffered, keeping the buffered op
+            # type (an update applied on top of an index op is still an index op).
+            # the buffered doc is copied once so callers' documents aren't mutated.
+            merged = self.document_buffer[i]
+            if key not in self.document_buffer_merged:
+                merged = copy.deepcopy(merged)
+                self.document_buffer_merged.add(key)
+            op_type = merged.get("_op_type", "index")
+            partial_update_merger.merge(merged, copy.deepcopy(doc))
+            merged["_op_type"] = op_type
+            self.document_buffer[i] = merged
 
     def write_analytic_status(self, analytic_name, analytic_session_id, status):
         with warnings.catch_warnings():
@@ -338,16 +370,18 @@ class OpenSearchProvider:
                         self.write_ingest_error("BulkIndexError", error_data)
                         # since the document actually wasn't flushed to opensearch, remove from the result set
                         error_id = error_data.get("_id")
-                        error_doc_type = (
-                            error_data.get("data", {})
-                            .get("doc", {})
-                            .get("doc_type", None)
+                        # update actions carry the source under "doc", index actions don't
+                        error_source = error_data.get("data", {})
+                        error_doc_type = error_source.get("doc", error_source).get(
+                            "doc_type", None
                         )
                         if error_id is not None and error_doc_type is not None:
-                            flushed_docs.remove((error_doc_type, error_id))
+                            flushed_docs.discard((error_doc_type, error_id))
                 if raise_ingest_error:
                     raise e
             self.document_buffer.clear()
+            self.document_buffer_index.clear()
+            self.document_buffer_merged.clear()
         self.last_document_flush = datetime.utcnow()
         return flushed_docs
 
@@ -380,13 +414,13 @@ class OpenSearchProvider:
                         self.write_ingest_error("BulkIndexError", error_data)
                         # since the document actually wasn't flushed to opensearch, remove from the result set
                         error_id = error_data.get("_id")
-                        error_doc_type = (
-                            error_data.get("data", {})
-                            .get("doc", {})
-                            .get("doc_type", None)
+                        # update actions carry the source under "doc", index actions don't
+                        error_source = error_data.get("data", {})
+                        error_doc_type = error_source.get("doc", error_source).get(
+                            "doc_type", None
                         )
                         if error_id is not None and error_doc_type is not None:
-                            flushed_docs.remove((error_doc_type, error_id))
+                            flushed_docs.discard((error_doc_type, error_id))
                 if raise_ingest_error:
                     raise e
         return flushed_docs
@@ -406,9 +440,14 @@ class OpenSearchProvider:
         scroll="2m",
         tenant=None,
         raw=False,
+        slice=None,
     ):
+        # slice=dict(id=i, max=n) scrolls only the i-th of n disjoint slices, so that
+        # n scrolls can read the results of one query in parallel.
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
+            if slice is not None and slice.get("max", 1) > 1:
+                query = dict(query, slice=slice)
             try:
                 i = self.i_pattern(doc_type, tenant=tenant)
                 c = 0
@@ -428,6 +467,69 @@ class OpenSearchProvider:
             except NotFoundError:
                 pass
 
+    def search_after_page(
+        self, doc_type, query, sort, search_after=None, page_size=1000, tenant=None
+    ):
+        # one page of search_after pagination, returned as (doc, sort values) pairs
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            body = dict(query)
+            body["sort"] = sort
+            if search_after is not None:
+                body["search_after"] = search_after
+            try:
+                i = self.i_pattern(doc_type, tenant=tenant)
+                r = self.es.search(index=i, body=body, size=page_size)
+            except NotFoundError:
+                return []
+            page = []
+            for hit in r["hits"].get("hits", []):
+                doc = hit.get("_source", {})
+                doc["_id"] = hit["_id"]
+                page.append((doc, hit["sort"]))
+            return page
+
+    def query_search_after(
+        self, doc_type, query, sort, search_after=None, page_size=1000, tenant=None
+    ):
+        while True:
+            page = self.search_after_page(
+                doc_type, query, sort, search_after, page_size, tenant=tenant
+            )
+            yield from page
+            if len(page) < page_size:
+                return
+            search_after = page[-1][1]
+
+    def changefeed_index(self, tenant=None):
+        mytenant = self.tenant
+        if tenant is not None:
+            mytenant = tenant
+        return f"{self.prefix}-{mytenant}-changefeed"
+
+    def read_changefeed_offsets(self, consumer):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                r = self.es.get(index=self.changefeed_index(), id=consumer)
+                return json.loads(r["_source"]["offsets"])
+            except NotFoundError:
+                return {}
+
+    def write_changefeed_offsets(self, consumer, offsets):
+        # offsets are sort values of mixed types, so they're stored as a json string
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.es.index(
+                index=self.changefeed_index(),
+                id=consumer,
+                body={
+                    "consumer": consumer,
+                    "offsets": json.dumps(offsets),
+                    "@timestamp": datetime.utcnow(),
+                },
+            )
+
     def query_count(self, doc_type, query={"query": {"match_all": {}}}, tenant=None):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
@@ -542,11 +644,15 @@ class OpenSearchProvider:
             i = self.i_pattern(doc_type, tenant=tenant)
             self.es.delete_by_query(body=query, index=i)
 
-    def delete(self, doc_type, id):
+    def delete(self, doc_type, id, missing_ok=False):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             i = self.i_pattern(doc_type)
-            self.es.delete(index=i, id=id)
+            try:
+                self.es.delete(index=i, id=id)
+            except NotFoundError:
+                if not missing_ok:
+                    raise
 
     def delete_index(self, doc_type, tenant=None, initialize_index=True):
         with warnings.catch_warnings():
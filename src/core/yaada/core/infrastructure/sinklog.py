@@ -0,0 +1,246 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import dateutil.parser
+
+from yaada.core import default_log_level, utility
+from yaada.core.infrastructure.compression import (
+    COMPRESSION_EXTENSIONS,
+    compress_block,
+    decompress_block,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+INDEX_SUFFIX = ".index.ldjson"
+
+
+def _segment_pattern(basename):
+    return re.compile(
+        rf"^{re.escape(basename)}-(\d{{8}})-(\d{{6}})\.ldjson(\.gz|\.zst)$"
+    )
+
+
+def _compression_for(segment):
+    for compression, ext in COMPRESSION_EXTENSIONS.items():
+        if segment.endswith(ext):
+            return compression
+    raise ValueError(f"unknown sinklog segment compression: {segment}")
+
+
+def _as_naive_utc(ts):
+    if isinstance(ts, str):
+        ts = dateutil.parser.isoparse(ts)
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _timestamp_str(doc):
+    ts = doc.get("@timestamp")
+    if isinstance(ts, datetime):
+        return ts.isoformat()
+    return ts
+
+
+class SinklogWriter:
+    """Appends documents to compressed, rotated sinklog segments.
+
+    Documents are buffered and written as one compressed block per flush, so a
+    segment is a concatenation of independently decompressable gzip members or
+    zstd frames. Every document gets a line in the segment's index file with the
+    block's byte offset and length so the log can be range-scanned without
+    decompressing whole segments.
+    """
+
+    def __init__(
+        self,
+        directory,
+        basename="sinklog",
+        compression="gzip",
+        max_segment_bytes=256 * 1024 * 1024,
+        flush_bytes=1024 * 1024,
+        flush_interval=5.0,
+    ):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"unsupported compression '{compression}'")
+        self.directory = directory
+        self.basename = basename
+        self.compression = compression
+        self.max_segment_bytes = max_segment_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.index_entries = []
+        self.last_flush = time.monotonic()
+        self.segment = None
+        self.segment_date = None
+        self.segment_seq = 0
+        self.segment_file = None
+        self.index_file = None
+
+    def append(self, doc: dict):
+        line = (json.dumps(doc, cls=utility.DateTimeEncoder) + "\n").encode("utf-8")
+        self.buffer.append(line)
+        self.buffer_bytes += len(line)
+        self.index_entries.append(
+            dict(
+                doc_type=doc.get("doc_type"),
+                _id=doc.get("_id"),
+                **{"@timestamp": _timestamp_str(doc)},
+            )
+        )
+        if self.buffer_bytes >= self.flush_bytes:
+            self.flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if len(self.buffer) == 0:
+            return
+        self._rotate_if_needed()
+        block = compress_block(b"".join(self.buffer), self.compression)
+        offset = self.segment_file.tell()
+        self.segment_file.write(block)
+        self.segment_file.flush()
+        for entry in self.index_entries:
+            entry = dict(segment=self.segment, offset=offset, length=len(block), **entry)
+            self.index_file.write(json.dumps(entry) + "\n")
+        self.index_file.flush()
+        logger.debug(
+            f"wrote {len(self.buffer)} documents ({len(block)} bytes) to {self.segment}"
+        )
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.index_entries = []
+
+    def close(self):
+        self.flush()
+        self._close_segment()
+
+    def _rotate_if_needed(self):
+        today = datetime.now().strftime("%Y%m%d")
+        if self.segment_file is not None:
+            if (
+                self.segment_date == today
+                and self.segment_file.tell() < self.max_segment_bytes
+            ):
+                return
+            self._close_segment()
+        if self.segment_date != today:
+            self.segment_date = today
+            self.segment_seq = self._last_segment_seq(today)
+        self.segment_seq += 1
+        ext = COMPRESSION_EXTENSIONS[self.compression]
+        self.segment = (
+            f"{self.basename}-{self.segment_date}-{self.segment_seq:06d}.ldjson{ext}"
+        )
+        path = os.path.join(self.directory, self.segment)
+        self.segment_file = open(path, "ab")
+        self.index_file = open(path + INDEX_SUFFIX, "a")
+        logger.info(f"opened sinklog segment {path}")
+
+    def _last_segment_seq(self, date):
+        # never append to segments left over from a previous run
+        pattern = _segment_pattern(self.basename)
+        seq = 0
+        for name in os.listdir(self.directory):
+            m = pattern.match(name)
+            if m and m.group(1) == date:
+                seq = max(seq, int(m.group(2)))
+        return seq
+
+    def _close_segment(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.index_file.close()
+            self.segment_file = None
+            self.index_file = None
+
+
+def list_segments(directory, basename="sinklog"):
+    pattern = _segment_pattern(basename)
+    return sorted(
+        [name for name in os.listdir(directory) if pattern.match(name)],
+        key=lambda name: pattern.match(name).group(1, 2),
+    )
+
+
+def read_index(directory, segment):
+    path = os.path.join(directory, segment + INDEX_SUFFIX)
+    if not os.path.isfile(path):
+        return
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_block(directory, segment, offset, length):
+    with open(os.path.join(directory, segment), "rb") as f:
+        f.seek(offset)
+        data = decompress_block(f.read(length), _compression_for(segment))
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def replay(directory, basename="sinklog", start=None, end=None, doc_types=None):
+    """Yield sinklog documents in log order, optionally restricted to a
+    ``@timestamp`` range and a set of doc_types.
+
+    Only the blocks that the segment indexes say contain matching documents
+    are read and decompressed. Timestamps without a timezone are taken as UTC.
+    """
+    start = _as_naive_utc(start)
+    end = _as_naive_utc(end)
+    if doc_types is not None:
+        doc_types = set(doc_types)
+
+    def matches(doc_type, ts):
+        if doc_types is not None and doc_type not in doc_types:
+            return False
+        if start is None and end is None:
+            return True
+        if ts is None:
+            return False
+        ts = _as_naive_utc(ts)
+        return (start is None or ts >= start) and (end is None or ts < end)
+
+    for segment in list_segments(directory, basename):
+        blocks = {}
+        for entry in read_index(directory, segment):
+            if matches(entry["doc_type"], entry["@timestamp"]):
+                blocks[entry["offset"]] = entry["length"]
+        for offset in sorted(blocks):
+            for doc in read_block(directory, segment, offset, blocks[offset]):
+                if matches(doc.get("doc_type"), doc.get("@timestamp")):
+                    yield doc
@@ -0,0 +1,195 @@
+# Copyright (c) 2023 Aptima, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+# FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+# IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import logging
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from genson import SchemaBuilder
+from tqdm import tqdm
+
+from yaada.core import default_log_level, utility
+
+logger = logging.getLogger(__name__)
+logger.setLevel(default_log_level)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class Reservoir:
+    """Uniform sample of at most `size` items from a stream of unknown length (Algorithm R)."""
+
+    def __init__(self, size, rng=None):
+        self.size = size
+        self.rng = rng or random.Random()
+        self.seen = 0
+        self.items = []
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            i = self.rng.randrange(self.seen)
+            if i < self.size:
+                self.items[i] = item
+
+
+class StratifiedReservoir:
+    """One reservoir per doc_type so rare doc_types are not crowded out by common ones."""
+
+    def __init__(self, size, rng=None, key="doc_type"):
+        self.size = size
+        self.rng = rng or random.Random()
+        self.key = key
+        self.strata = {}
+
+    @property
+    def seen(self):
+        return sum(r.seen for r in self.strata.values())
+
+    @property
+    def items(self):
+        return [item for r in self.strata.values() for item in r.items]
+
+    def add(self, item):
+        stratum = item.get(self.key) if isinstance(item, dict) else None
+        if stratum not in self.strata:
+            self.strata[stratum] = Reservoir(self.size, self.rng)
+        self.strata[stratum].add(item)
+
+
+def make_reservoir(size, stratify=False, rng=None):
+    if stratify:
+        return StratifiedReservoir(size, rng)
+    return Reservoir(size, rng)
+
+
+def sample_documents(docs, size, stratify=False, seed=None):
+    reservoir = make_reservoir(size, stratify, random.Random(seed))
+    for doc in docs:
+        reservoir.add(doc)
+    return reservoir.items
+
+
+def parse_ldjson_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def infer_byte_range(path, start, end, sample_size=None, stratify=False, seed=None):
+    # runs in a worker process, so everything it returns has to be picklable. the
+    # partial schema is returned as a plain dict and merged by the parent.
+    builder = SchemaBuilder()
+    docs = parse_ldjson_lines(utility.read_byte_range_lines(path, start, end))
+    count = 0
+    if sample_size is None:
+        for doc in docs:
+            builder.add_object(doc)
+            count += 1
+        sampled = count
+    else:
+        reservoir = make_reservoir(sample_size, stratify, random.Random(seed))
+        for doc in docs:
+            reservoir.add(doc)
+        count = reservoir.seen
+        sampled = 0
+        for doc in reservoir.items:
+            builder.add_object(doc)
+            sampled += 1
+    return builder.to_schema(), end - start, count, sampled
+
+
+def chunk_sample_size(sample_size, start, end, total):
+    # spread the sample across chunks in proportion to their size, keeping at least
+    # one document per chunk (per doc_type when stratified).
+    if sample_size is None:
+        return None
+    if total == 0:
+        return sample_size
+    return max(1, math.ceil(sample_size * (end - start) / total))
+
+
+def infer_schema_from_ldjson(
+    path,
+    sample_size=None,
+    stratify=False,
+    processes=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    seed=None,
+    progress=False,
+    builder=None,
+):
+    """Infer a json-schema from a newline delimited json file.
+
+    The file is split into newline aligned byte ranges that are inferred independently
+    in a process pool and the partial schemas are merged. With `sample_size` only a
+    reservoir sample of that many documents (that many per doc_type with `stratify`)
+    is fed to genson. Progress is reported in bytes.
+    """
+    if builder is None:
+        builder = SchemaBuilder()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    total = os.path.getsize(path)
+    ranges = utility.line_aligned_byte_ranges(path, chunk_size)
+    tasks = [
+        (
+            path,
+            start,
+            end,
+            chunk_sample_size(sample_size, start, end, total),
+            stratify,
+            None if seed is None else seed + i,
+        )
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+    seen = 0
+    sampled = 0
+    with tqdm(
+        total=total, unit="B", unit_scale=True, unit_divisor=1024, disable=not progress
+    ) as pbar:
+
+        def merge(result):
+            nonlocal seen, sampled
+            schema, nbytes, count, n = result
+            builder.add_schema(schema)
+            seen += count
+            sampled += n
+            pbar.update(nbytes)
+
+        if processes <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                merge(infer_byte_range(*task))
+        else:
+            with ProcessPoolExecutor(max_workers=min(processes, len(tasks))) as pool:
+                futures = [pool.submit(infer_byte_range, *task) for task in tasks]
+                for future in as_completed(futures):
+                    merge(future.result())
+
+    logger.info(
+        f"inferred schema for {path} from {sampled} of {seen} documents in {len(tasks)} chunks"
+    )
+    return builder
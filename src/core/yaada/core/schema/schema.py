@@ -25,7 +25,7 @@ from glob import glob
 
 from deepmerge import Merger
 from genson import SchemaBuilder
-from jsonschema.exceptions import ValidationError
+from jsonschema.exceptions import ValidationError, best_match
 from openapi_schema_validator import (  # we use OpenAPI 3.0 validation because that is what Connexion supports. Once Connexion supports 3.1, we should consider upgrading
     OAS30Validator,
     validate,
@@ -34,6 +34,12 @@ from ruamel.yaml import YAML
 
 from yaada.core import default_log_level, utility
 from yaada.core.config import YAADAConfig
+from yaada.core.schema import inference
+
+try:  # optional, only used when yaada.schema.fast_validation is enabled
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
 
 logger = logging.getLogger(__name__)
 logger.setLevel(default_log_level)
@@ -81,12 +87,61 @@ DEFINITION_PREFIX = "#/definitions/"
 LINK_PREFIX = "#/links/"
 
 
+# OpenAPI keywords that change validation in ways fastjsonschema doesn't implement
+OPENAPI_ONLY_KEYWORDS = {"readOnly", "writeOnly", "discriminator"}
+
+
+def fast_validation_schema(schema):
+    """Translate an OpenAPI 3.0 schema into an equivalent JSON Schema draft 4
+    schema for fastjsonschema, or return None if it uses OpenAPI keywords that
+    can't be translated."""
+
+    def translate(x):
+        if isinstance(x, dict):
+            if any(k in OPENAPI_ONLY_KEYWORDS for k in x.keys()):
+                raise ValueError("unsupported keyword")
+            x = {k: translate(v) for k, v in x.items()}
+            if x.get("nullable", None) is True:
+                del x["nullable"]
+                if isinstance(x.get("type", None), str):
+                    x["type"] = [x["type"], "null"]
+            return x
+        elif isinstance(x, list):
+            return [translate(v) for v in x]
+        return x
+
+    try:
+        fast_schema = translate(schema)
+    except ValueError:
+        return None
+    fast_schema["$schema"] = "http://json-schema.org/draft-04/schema#"
+    return fast_schema
+
+
+class FastValidator:
+    """Validates with fastjsonschema generated code first. Only documents it
+    rejects are validated again by the OpenAPI validator, which produces the
+    reported errors, so errors are identical with and without the fast path."""
+
+    def __init__(self, validate, validator):
+        self.validate = validate
+        self.validator = validator
+
+    def iter_errors(self, instance):
+        try:
+            self.validate(instance)
+            return iter(())
+        except fastjsonschema.JsonSchemaValueException:
+            return self.validator.iter_errors(instance)
+
+
 class SchemaManager:
     DEFINITION_PREFIX = DEFINITION_PREFIX
     LINK_PREFIX = LINK_PREFIX
 
     def __init__(self, config: YAADAConfig):
         self.doc_type_schemas = {}
+        self.validators = {}  # key: doc_type, value: compiled validator
 
         self.base_document_schema = base_document_schema
         self.common_definitions = self.base_document_schema.get("definitions", {})
@@ -101,9 +156,54 @@ class SchemaManager:
 
         self._load_schema_dir(config.schema_directory)
 
+    def get_validator(self, doc_type):
+        """Return the compiled validator for a doc_type. Validators are built,
+        and their schema checked, once per doc_type until its schema changes."""
+        validator = self.validators.get(doc_type, None)
+        if validator is None:
+            s = self.get_document_schema(doc_type)
+            OAS30Validator.check_schema(s)
+            validator = OAS30Validator(s)
+            if self.config.schema_fast_validation:
+                validator = self.make_fast_validator(doc_type, s, validator)
+            self.validators[doc_type] = validator
+        return validator
+
+    def make_fast_validator(self, doc_type, schema, validator):
+        if fastjsonschema is None:
+            logger.warning(
+                "yaada.schema.fast_validation is enabled but fastjsonschema isn't installed"
+            )
+            return validator
+        fast_schema = fast_validation_schema(schema)
+        if fast_schema is None:
+            logger.info(f"{doc_type} schema uses OpenAPI keywords, no fast path")
+            return validator
+        try:
+            validate = fastjsonschema.compile(
+                fast_schema, use_default=False, use_formats=False
+            )
+        except fastjsonschema.JsonSchemaDefinitionException as e:
+            logger.info(f"{doc_type} schema can't be compiled, no fast path: {e}")
+            return validator
+        return FastValidator(validate, validator)
+
     def validate_document(self, doc):
-        s = self.get_document_schema(doc["doc_type"])
-        validate(doc, s, cls=OAS30Validator)
+        error = best_match(self.get_validator(doc["doc_type"]).iter_errors(doc))
+        if error is not None:
+            raise error
+
+    def validate_documents(self, docs):
+        """Validate a batch of documents, returning a list aligned with ``docs``
+        holding None for each valid document and the ValidationError otherwise."""
+        errors = []
+        for doc in docs:
+            try:
+                self.validate_document(doc)
+                errors.append(None)
+            except ValidationError as e:
+                errors.append(e)
+        return errors
 
     def load_from_path(self, filepath):
         """open a file and load to dictionary from a yaml"""
@@ -200,6 +300,7 @@ class SchemaManager:
                     raise UnresolvedReference(ref)
 
             self.doc_type_schemas[doc_type] = newschema
+            self.validators.pop(doc_type, None)
 
             if "doc_type" not in newschema["properties"]:
                 newschema["properties"]["doc_type"] = dict(type="string")
@@ -219,7 +320,14 @@ class SchemaManager:
             return self.doc_type_schemas.get(doc_type, self.base_document_schema)
 
     def json_schema_from_data(
-        self, docs, doc_type=None, to_json=False, include_document_base=False
+        self,
+        docs,
+        doc_type=None,
+        to_json=False,
+        include_document_base=False,
+        sample_size=None,
+        stratify=False,
+        seed=None,
     ):
         builder = SchemaBuilder()
         if include_document_base:
@@ -229,6 +337,8 @@ class SchemaManager:
             _docs = docs
         else:
             _docs.append(docs)
+        if sample_size is not None:
+            _docs = inference.sample_documents(_docs, sample_size, stratify, seed)
         for doc in _docs:
             builder.add_object(doc)
 
@@ -237,6 +347,38 @@ class SchemaManager:
         else:
             return builder.to_schema()
 
+    def json_schema_from_ldjson(
+        self,
+        path,
+        doc_type=None,
+        to_json=False,
+        include_document_base=False,
+        sample_size=None,
+        stratify=False,
+        processes=None,
+        chunk_size=inference.DEFAULT_CHUNK_SIZE,
+        seed=None,
+        progress=False,
+    ):
+        builder = SchemaBuilder()
+        if include_document_base:
+            builder.add_schema(self.get_document_schema(doc_type=doc_type))
+        inference.infer_schema_from_ldjson(
+            path,
+            sample_size=sample_size,
+            stratify=stratify,
+            processes=processes,
+            chunk_size=chunk_size,
+            seed=seed,
+            progress=progress,
+            builder=builder,
+        )
+
+        if to_json:
+            return builder.to_json(indent=2)
+        else:
+            return builder.to_schema()
+
     def files_from_dir(self, dirpath):
         return (
             glob(f"{dirpath}/*.json")
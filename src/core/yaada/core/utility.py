@@ -452,3 +452,35 @@ def hash_for_text(data: typing.List[str]) -> str:
 def hash_doc_fields(doc, fields: typing.List[str]):
     h = hash_for_text([str(doc[f]) for f in fields if doc.get(f, None) is not None])
     return h
+
+
+# split a newline delimited file into byte ranges of roughly chunk_size bytes. every
+# boundary is moved forward to just past the next newline, so each range holds only
+# whole lines and the ranges can be read independently (e.g. in separate processes).
+def line_aligned_byte_ranges(path, chunk_size):
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            end = start + max(int(chunk_size), 1)
+            if end < size:
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            else:
+                end = size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+# yield the lines in [start,end) of a file produced by line_aligned_byte_ranges
+def read_byte_range_lines(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
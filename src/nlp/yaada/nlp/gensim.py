@@ -207,7 +207,7 @@ class GensimLDAModel(ModelBase):
 
         self.id2word = corpora.Dictionary.load(ldamodel_dir + "/id2word")
         self.lda_model = gensim.models.ldamodel.LdaModel.load(
-            ldamodel_dir + "/lda_model"
+            ldamodel_dir + "/lda_model", mmap=self.mmap
         )
         self.data_lemmatized = pickle.load(
             open(ldamodel_dir + "/data_lemmatized.p", "rb")
@@ -19,6 +19,7 @@
 
 import logging
 import random
+import threading
 
 import spacy
 from spacy.util import compounding, minibatch
@@ -112,17 +113,17 @@ class SpacyLanguageModel(ModelBase):
         return self.nlp
 
 
-_nlp = None
+_nlp = {}  # key: spacy package name, value: loaded pipeline
+_nlp_lock = threading.Lock()
 
 
-def spacy_nlp():
-    global _nlp
-    if _nlp is None:
-        lan_model = "en_core_web_md"
-        ensure_spacy_model(lan_model)
-        logging.info(f"loading spacy model: {lan_model}")
-        _nlp = spacy.load(lan_model)
-    return _nlp
+def spacy_nlp(lan_model="en_core_web_md"):
+    with _nlp_lock:
+        if lan_model not in _nlp:
+            ensure_spacy_model(lan_model)
+            logging.info(f"loading spacy model: {lan_model}")
+            _nlp[lan_model] = spacy.load(lan_model)
+        return _nlp[lan_model]
 
 
 class SpacyNER(YAADAPipelineProcessor):
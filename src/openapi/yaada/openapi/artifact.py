@@ -17,11 +17,16 @@
 # IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import urllib.parse
+
 import connexion
-from flask import send_file
+from flask import Response
+from werkzeug.http import parse_range_header
 
 from yaada.core import utility
 
+STREAM_CHUNK_SIZE = 256 * 1024
+
 
 def upload_artifact(body, doc_type, id, sync, process, barrier, artifact_type, file):
     doc = connexion.request.context.doc_service.get(
@@ -37,16 +42,56 @@ def upload_artifact(body, doc_type, id, sync, process, barrier, artifact_type, f
     return utility.jsonify(doc), 200
 
 
+def stream_file(f, start, end):
+    try:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
 def get_artifact(artifact_type, doc_type, id, filename):
     doc = connexion.request.context.doc_service.get(doc_type, id)
 
     for blob in doc["artifacts"][artifact_type]:
         if filename == blob["filename"]:
-            tf = connexion.request.context.ob_service.fetch_file_to_temp(
+            f = connexion.request.context.ob_service.open_artifact(
                 blob["remote_file_path"]
             )
-            return send_file(
-                tf, mimetype=blob["content_type"], download_name=filename
+            size = f.raw.size
+            headers = {"Accept-Ranges": "bytes"}
+            try:
+                filename.encode("ascii")
+                headers["Content-Disposition"] = f'inline; filename="{filename}"'
+            except UnicodeEncodeError:
+                quoted = urllib.parse.quote(filename)
+                headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quoted}"
+
+            start, end, status = 0, size, 200
+            byte_range = parse_range_header(connexion.request.headers.get("Range"))
+            if byte_range is not None:
+                r = byte_range.range_for_length(size)
+                if r is None:
+                    f.close()
+                    headers["Content-Range"] = f"bytes */{size}"
+                    return Response(status=416, headers=headers)
+                start, end = r
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+            headers["Content-Length"] = str(end - start)
+
+            return Response(
+                stream_file(f, start, end),
+                status=status,
+                mimetype=blob.get("content_type", "application/octet-stream"),
+                headers=headers,
+                direct_passthrough=True,
             )
 
     return None
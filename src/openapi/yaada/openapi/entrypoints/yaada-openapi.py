@@ -31,8 +31,10 @@ parser = argparse.ArgumentParser(description="Run YAADA's OpenAPI-based REST ser
 parser.add_argument("--debug", action="store_true")
 if __name__ == "__main__":
     args = parser.parse_args()
-    context = make_analytic_context("openapi")
     config = YAADAConfig()
+    context = make_analytic_context(
+        "openapi", config=config, preload=config.yaada_models_preload
+    )
     app = connexion.FlaskApp(__name__)
 
     @app.app.before_request
@@ -213,6 +213,13 @@ class Neo4jPlugin(AnalyticContextPlugin):
                     log_cypher,
                 )
 
+    def sync(self, doc_types, consumer="neo4j", batch_size=1000, log_cypher=False):
+        # incrementally ingest whatever changed since the last sync by this consumer
+        for batch in self.context.changes(
+            doc_types, consumer=consumer, batch_size=batch_size
+        ):
+            self.ingest(batch, log_cypher=log_cypher)
+
     def node_counts(self):
         with self.driver.session() as s:
             result = s.run(
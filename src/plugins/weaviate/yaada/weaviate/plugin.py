@@ -128,6 +128,21 @@ class WeaviatePlugin(AnalyticContextPlugin):
                 class_name, props, id = self.prepare_object(doc)
                 batch.add_data_object(props, class_name, id)
 
+    def sync(self, doc_types=None, consumer="weaviate", batch_size=1000):
+        # incrementally ingest whatever changed since the last sync by this consumer.
+        # documents get a uuid derived from their id so that changes overwrite the
+        # existing object instead of adding a new one.
+        if doc_types is None:
+            doc_types = list(self.doc_type_schemas.keys())
+        for batch in self.context.changes(
+            doc_types, consumer=consumer, batch_size=batch_size
+        ):
+            for doc in batch:
+                if "uuid4" not in doc:
+                    name = f"{doc['doc_type']}/{doc['_id']}"
+                    doc["uuid4"] = str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+            self.ingest(batch)
+
     def ask(
         self, question, doc_type, search_props, return_props=["xid"], num_results=1
     ):
@@ -0,0 +1,36 @@
+from yaada.core.analytic.context import make_analytic_context
+
+context = make_analytic_context("test", "test")
+context.wait_for_ready()
+
+
+def test_changes_resume_from_consumer_offset():
+    counts = context.document_counts()
+    if "TestChange" in counts:
+        context.delete_index("TestChange")
+
+    docs = [dict(doc_type="TestChange", id=str(i), value=i) for i in range(5)]
+    context.update(docs, barrier=True)
+
+    seen = []
+    for batch in context.changes(
+        "TestChange", consumer="test-changes", batch_size=2, settle_seconds=0
+    ):
+        assert batch.doc_type == "TestChange"
+        seen.extend([doc["id"] for doc in batch])
+    assert sorted(seen) == [str(i) for i in range(5)]
+
+    # everything was consumed, so resuming the consumer yields nothing new
+    resumed = context.changes("TestChange", consumer="test-changes", settle_seconds=0)
+    assert list(resumed) == []
+
+    context.update(dict(doc_type="TestChange", id="5", value=5), barrier=True)
+    resumed = [
+        doc["id"]
+        for batch in context.changes(
+            "TestChange", consumer="test-changes", settle_seconds=0
+        )
+        for doc in batch
+    ]
+    assert resumed == ["5"]
+    context.delete_index("TestChange")
@@ -0,0 +1,150 @@
+import os
+
+import pytest
+
+from yaada.core.analytic.context import make_analytic_context
+from yaada.core.infrastructure.checkpoint import checkpoint_path
+
+context = make_analytic_context("test", "test")
+context.wait_for_ready()
+
+DOC_TYPE = "TestMigration"
+
+
+def reset(count=10):
+    if DOC_TYPE in context.document_counts():
+        context.delete_index(DOC_TYPE)
+    docs = [
+        dict(
+            doc_type=DOC_TYPE,
+            id=str(i),
+            value=i,
+            published="2020-01-01T00:00:00Z",
+            nested=dict(tags=["a", str(i)]),
+        )
+        for i in range(count)
+    ]
+    if docs:
+        context.update(docs, barrier=True)
+    return docs
+
+
+def stored(ids):
+    return {id: context.get(DOC_TYPE, id) for id in ids}
+
+
+def assert_restored(docs):
+    restored = stored([doc["id"] for doc in docs])
+    for doc in docs:
+        assert restored[doc["id"]] is not None
+        for k in ["value", "published", "nested"]:
+            assert restored[doc["id"]][k] == doc[k]
+
+
+def test_parquet_roundtrip(tmp_path):
+    pytest.importorskip("pyarrow")
+    docs = reset(5)
+    destination = str(tmp_path / "parquet")
+    counts = context.migration.save_parquet(destination, doc_type=DOC_TYPE)
+    assert counts == {DOC_TYPE: len(docs)}
+
+    read = sorted(
+        context.migration.read_parquet(destination, doc_type=DOC_TYPE),
+        key=lambda doc: doc["value"],
+    )
+    assert [doc["published"] for doc in read] == [doc["published"] for doc in docs]
+
+    projected = context.migration.read_parquet(
+        destination, columns=["value"], doc_type=DOC_TYPE
+    )
+    assert all(set(doc) == {"doc_type", "id", "value"} for doc in projected)
+
+    context.delete_index(DOC_TYPE)
+    context.migration.load_parquet(destination, doc_type=DOC_TYPE, process=False)
+    assert_restored(docs)
+
+
+@pytest.mark.parametrize("extension", ["ldjson", "ldjson.gz", "ldjson.zst"])
+def test_ldjson_checkpoint_resume(tmp_path, monkeypatch, extension):
+    docs = reset(10)
+    destination = str(tmp_path / f"export.{extension}")
+
+    export_pages = context.migration.export_pages
+
+    def interrupted(*args, **kwargs):
+        for i, page in enumerate(export_pages(*args, **kwargs)):
+            if i == 3:
+                raise RuntimeError("interrupted")
+            yield page
+
+    monkeypatch.setattr(context.migration, "export_pages", interrupted)
+    with pytest.raises(RuntimeError):
+        context.migration.save_ldjson_to_file(
+            destination, doc_type=DOC_TYPE, scroll_size=2, checkpoint_every=2
+        )
+    assert os.path.exists(checkpoint_path(destination))
+
+    monkeypatch.setattr(context.migration, "export_pages", export_pages)
+    context.migration.save_ldjson_to_file(
+        destination, doc_type=DOC_TYPE, scroll_size=2, resume=True, checkpoint_every=2
+    )
+    assert not os.path.exists(checkpoint_path(destination))
+
+    context.delete_index(DOC_TYPE)
+    context.migration.load_ldjson_from_file(destination, process=False)
+    assert_restored(docs)
+
+
+@pytest.mark.parametrize("sync", [True, False])
+def test_delta_roundtrip(tmp_path, sync):
+    docs = reset(5)
+    state = str(tmp_path / "delta-state.json")
+    first = str(tmp_path / "delta-1.ldjson")
+    counts = context.migration.save_ldjson_delta(
+        first, state=state, doc_types=[DOC_TYPE], settle_seconds=0
+    )
+    assert counts == {DOC_TYPE: len(docs)}
+
+    # nothing changed since the first delta
+    empty = str(tmp_path / "delta-empty.ldjson")
+    counts = context.migration.save_ldjson_delta(
+        empty, state=state, doc_types=[DOC_TYPE], settle_seconds=0
+    )
+    assert counts == {}
+
+    context.update(dict(doc_type=DOC_TYPE, id="1", value=100), barrier=True)
+    context.update(dict(doc_type=DOC_TYPE, id="5", value=5), barrier=True)
+    second = str(tmp_path / "delta-2.ldjson.gz")
+    counts = context.migration.save_ldjson_delta(
+        second,
+        state=state,
+        doc_types=[DOC_TYPE],
+        deleted=[(DOC_TYPE, "2"), (DOC_TYPE, "missing")],
+        settle_seconds=0,
+    )
+    assert counts == {DOC_TYPE: 4}
+
+    # apply both deltas to an empty index, deletes of missing documents included
+    context.delete_index(DOC_TYPE)
+    context.migration.load_ldjson_delta(first)
+    updated, deleted = context.migration.load_ldjson_delta(second, sync=sync)
+    assert (updated, deleted) == (2, 2)
+
+    # the updates ahead of the tombstones were applied before them, also when async
+    restored = stored(["0", "1", "2", "5"])
+    assert restored["0"]["value"] == 0
+    assert restored["1"]["value"] == 100
+    assert restored["2"] is None
+    assert restored["5"]["value"] == 5
+
+
+@pytest.mark.parametrize("extension", ["tar", "tgz", "tar.zst"])
+def test_tar_roundtrip(tmp_path, extension):
+    docs = reset(5)
+    destination = str(tmp_path / f"archive.{extension}")
+    context.migration.save_archive_to_tar(destination, doc_type=DOC_TYPE)
+    assert not os.path.exists(f"{destination}.partial")
+
+    context.delete_index(DOC_TYPE)
+    context.migration.load_archive_from_tar(destination)
+    assert_restored(docs)
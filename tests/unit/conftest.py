@@ -0,0 +1,76 @@
+import io
+from datetime import datetime, timezone
+
+import botocore
+import pytest
+
+from yaada.core.config import YAADAConfig
+from yaada.core.infrastructure.artifactcache import ArtifactCache
+from yaada.core.infrastructure.providers.objectstorage import ObjectStorageProvider
+
+
+class MemoryS3:
+    # just enough of the boto3 s3 client for ObjectStorageProvider
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def put(self, key, data, last_modified=None):
+        self.objects[key] = dict(
+            data=data,
+            etag=f"{key}-{len(data)}-{hash(data)}",
+            last_modified=last_modified or datetime.now(timezone.utc),
+        )
+
+    def put_object(self, Bucket, Key, Body):
+        self.put(Key, Body)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None):
+        self.put(Key, Fileobj.read())
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "404"}}, "HeadObject"
+            )
+        ob = self.objects[Key]
+        return dict(ETag=f'"{ob["etag"]}"', ContentLength=len(ob["data"]))
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        self.downloads += 1
+        with open(Filename, "wb") as f:
+            f.write(self.objects[Key]["data"])
+
+    def get_object(self, Bucket, Key, Range=None):
+        return dict(Body=io.BytesIO(self.objects[Key]["data"]))
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield dict(
+            Contents=[
+                dict(Key=key, LastModified=ob["last_modified"])
+                for key, ob in sorted(self.objects.items())
+                if key.startswith(Prefix)
+            ]
+        )
+
+
+@pytest.fixture
+def s3():
+    return MemoryS3()
+
+
+@pytest.fixture
+def object_storage(tmp_path, s3):
+    provider = ObjectStorageProvider(
+        YAADAConfig(), dict(enabled=False, tenant="test", bucket="test")
+    )
+    provider.enabled = True
+    provider.client = s3
+    provider._artifact_cache = ArtifactCache(str(tmp_path / "cache"), 10 * 1024**2)
+    return provider
@@ -0,0 +1,142 @@
+import os
+import threading
+
+from yaada.core.infrastructure.artifactcache import ArtifactCache
+
+
+class MemoryStore:
+    # object store with ETags, counting the downloads
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def put(self, key, data):
+        self.objects[key] = (data, f"etag-{key}-{len(data)}-{data[:4].hex()}")
+
+    def head(self, key):
+        data, etag = self.objects[key]
+        return dict(etag=etag, size=len(data))
+
+    def download(self, key, local_path):
+        self.downloads += 1
+        with open(local_path, "wb") as f:
+            f.write(self.objects[key][0])
+
+
+def fetch(cache, store, key):
+    return cache.fetch(key, key, store.head, store.download)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_fetch_downloads_once_and_revalidates(tmp_path):
+    store = MemoryStore()
+    store.put("a", b"first")
+    cache = ArtifactCache(str(tmp_path), max_bytes=1000)
+
+    assert read(fetch(cache, store, "a")) == b"first"
+    assert read(fetch(cache, store, "a")) == b"first"
+    assert store.downloads == 1
+
+    store.put("a", b"second version")
+    assert read(fetch(cache, store, "a")) == b"second version"
+    assert store.downloads == 2
+    assert cache.size() == len(b"second version")
+
+
+def test_partial_download_is_never_served(tmp_path):
+    store = MemoryStore()
+    store.put("a", b"0123456789")
+    cache = ArtifactCache(str(tmp_path), max_bytes=1000)
+
+    def truncated(key, local_path):
+        with open(local_path, "wb") as f:
+            f.write(b"01234")
+
+    try:
+        cache.fetch("a", "a", store.head, truncated)
+    except IOError:
+        pass
+    else:
+        raise AssertionError("incomplete download was accepted")
+    assert not os.path.exists(cache.local_path("a"))
+    assert read(fetch(cache, store, "a")) == b"0123456789"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = MemoryStore()
+    for key in "abcd":
+        store.put(key, key.encode() * 40)
+    cache = ArtifactCache(str(tmp_path), max_bytes=100)
+
+    fetch(cache, store, "a")
+    os.utime(cache._meta_path("a"), (1, 1))
+    fetch(cache, store, "b")
+    os.utime(cache._meta_path("b"), (2, 2))
+    fetch(cache, store, "a")  # a is used again, b is now the oldest
+    fetch(cache, store, "c")
+
+    assert os.path.exists(cache.local_path("a"))
+    assert not os.path.exists(cache.local_path("b"))
+    assert os.path.exists(cache.local_path("c"))
+    assert cache.size() <= 100
+    assert cache._read_size() == cache.size()
+
+
+def test_eviction_removes_lock_files(tmp_path):
+    store = MemoryStore()
+    cache = ArtifactCache(str(tmp_path), max_bytes=100)
+    for i in range(20):
+        store.put(str(i), b"x" * 40)
+        fetch(cache, store, str(i))
+    locks = [name for name in os.listdir(cache.lock_dir) if len(name) > 20]
+    assert len(locks) <= 3
+
+
+def test_eviction_only_walks_when_over_budget(tmp_path, monkeypatch):
+    store = MemoryStore()
+    cache = ArtifactCache(str(tmp_path), max_bytes=1000)
+    walks = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries", lambda: walks.append(1) or entries())
+
+    for i in range(10):
+        store.put(str(i), b"x" * 10)
+        fetch(cache, store, str(i))
+        fetch(cache, store, str(i))
+    assert len(walks) == 1  # recomputing the missing size file on the first fetch
+
+
+def test_linked_files_survive_eviction(tmp_path):
+    store = MemoryStore()
+    store.put("a", b"a" * 80)
+    store.put("b", b"b" * 80)
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=100)
+    destination = str(tmp_path / "a")
+
+    fetch(cache, store, "a")
+    assert cache.link("a", destination)
+    fetch(cache, store, "b")
+    assert not os.path.exists(cache.local_path("a"))
+    assert read(destination) == b"a" * 80
+    assert not cache.link("a", destination)
+
+
+def test_concurrent_fetches_download_once(tmp_path):
+    store = MemoryStore()
+    store.put("a", b"a" * 1000)
+    cache = ArtifactCache(str(tmp_path), max_bytes=10000)
+    paths = []
+    threads = [
+        threading.Thread(target=lambda: paths.append(fetch(cache, store, "a")))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.downloads == 1
+    assert all(read(path) == b"a" * 1000 for path in paths)
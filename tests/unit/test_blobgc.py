@@ -0,0 +1,74 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture
+def object_storage(object_storage):
+    object_storage.content_addressed = True
+    return object_storage
+
+
+def age(s3, prefix, seconds):
+    then = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    for key, ob in s3.objects.items():
+        if key.startswith(prefix):
+            ob["last_modified"] = then
+
+
+def save(object_storage, _id, data):
+    doc = dict(doc_type="Test", _id=_id)
+    object_storage.save_artifact(doc, "raw", "a.txt", io.BytesIO(data))
+    return doc
+
+
+def test_identical_content_is_stored_once(object_storage, s3):
+    first = save(object_storage, "1", b"shared")
+    second = save(object_storage, "2", b"shared")
+    digest = first["artifacts"]["raw"][0]["sha256"]
+    assert second["artifacts"]["raw"][0]["sha256"] == digest
+    assert len([k for k in s3.objects if "/blobs/" in k]) == 1
+    refs = sorted(ref["_id"] for ref in object_storage.blob_refs(digest))
+    assert refs == ["1", "2"]
+
+
+def test_unreferenced_blobs_are_collected(object_storage, s3):
+    live = save(object_storage, "1", b"live")
+    save(object_storage, "2", b"dead")
+    age(s3, "test/", 7200)
+
+    counts = object_storage.collect_blob_garbage(
+        lambda ref, digest: ref["_id"] == "1", min_age_seconds=3600
+    )
+    assert counts == dict(blobs=2, deleted=1, stale_refs=1)
+    digest = live["artifacts"]["raw"][0]["sha256"]
+    assert [k for k in s3.objects if "/blobs/" in k] == [
+        object_storage.create_content_path(digest)
+    ]
+
+
+def test_dry_run_deletes_nothing(object_storage, s3):
+    save(object_storage, "1", b"dead")
+    age(s3, "test/", 7200)
+    before = dict(s3.objects)
+    counts = object_storage.collect_blob_garbage(
+        lambda ref, digest: False, min_age_seconds=3600, dry_run=True
+    )
+    assert counts == dict(blobs=1, deleted=1, stale_refs=1)
+    assert s3.objects == before
+
+
+def test_new_reference_to_an_old_blob_is_kept(object_storage, s3):
+    # the document of the new reference isn't searchable yet, so it isn't live
+    save(object_storage, "1", b"shared")
+    age(s3, "test/", 7200)
+    doc = save(object_storage, "2", b"shared")
+
+    counts = object_storage.collect_blob_garbage(
+        lambda ref, digest: False, min_age_seconds=3600
+    )
+    assert counts == dict(blobs=1, deleted=0, stale_refs=1)
+    digest = doc["artifacts"]["raw"][0]["sha256"]
+    assert object_storage.exists(object_storage.create_content_path(digest))
+    assert [ref["_id"] for ref in object_storage.blob_refs(digest)] == ["2"]
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from yaada.core.infrastructure import changefeed
+
+
+class MemoryDocService:
+    # just enough of the document service for changefeed.changes, documents are
+    # (@updated millis, id) pairs sorted like CHANGE_SORT
+    def __init__(self):
+        self.keys = []
+        self.offsets = {}
+
+    def search_after_page(self, doc_type, query, sort, search_after, page_size):
+        keys = sorted(self.keys)
+        if search_after is not None:
+            keys = [k for k in keys if list(k) > list(search_after)]
+        return [(dict(doc_type=doc_type, id=k[1]), list(k)) for k in keys[:page_size]]
+
+    def read_changefeed_offsets(self, consumer):
+        return self.offsets.get(consumer, {})
+
+    def write_changefeed_offsets(self, consumer, offsets):
+        self.offsets[consumer] = dict(offsets)
+
+
+def read(doc_service, **kwargs):
+    return [
+        doc["id"]
+        for batch in changefeed.changes(
+            doc_service, "Test", consumer="test", until=datetime.utcnow(), **kwargs
+        )
+        for doc in batch
+    ]
+
+
+def test_resume_without_overlap_skips_late_documents():
+    doc_service = MemoryDocService()
+    doc_service.keys = [(1000, "a"), (2000, "b")]
+    assert read(doc_service, batch_size=1) == ["a", "b"]
+    doc_service.keys += [(1500, "late"), (3000, "c")]
+    assert read(doc_service, batch_size=1) == ["c"]
+
+
+def test_resume_with_overlap_picks_up_late_documents_once():
+    doc_service = MemoryDocService()
+    doc_service.keys = [(1000, "a"), (2000, "b")]
+    assert read(doc_service, batch_size=1, overlap_seconds=5) == ["a", "b"]
+    doc_service.keys += [(1500, "late"), (3000, "c")]
+    assert read(doc_service, batch_size=1, overlap_seconds=5) == ["late", "c"]
+    assert read(doc_service, batch_size=1, overlap_seconds=5) == []
+    assert doc_service.offsets["test"]["Test"] == [3000, "c"]
+
+
+def test_delivered_keys_outside_the_overlap_are_forgotten():
+    doc_service = MemoryDocService()
+    doc_service.keys = [(1000, "a"), (60000, "b")]
+    read(doc_service, overlap_seconds=5)
+    seen = doc_service.offsets["test"][changefeed.SEEN_KEY]["Test"]
+    assert seen == [[60000, "b"]]
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from yaada.core.infrastructure.checkpoint import Checkpoint, checkpoint_path
+
+
+def test_save_load_remove(tmp_path):
+    destination = str(tmp_path / "export.ldjson")
+    job = dict(doc_type="Test", query={"query": {"match_all": {}}})
+
+    cp = Checkpoint(destination, job)
+    assert cp.load() is None
+    cp.save(count=10, search_after=[1577836800000, "a"])
+    assert os.path.exists(checkpoint_path(destination))
+
+    resumed = Checkpoint(destination, job)
+    assert resumed.load() == dict(count=10, search_after=[1577836800000, "a"])
+
+    resumed.remove()
+    assert not os.path.exists(checkpoint_path(destination))
+    resumed.remove()
+
+
+def test_refuses_a_different_job(tmp_path):
+    destination = str(tmp_path / "export.ldjson")
+    Checkpoint(destination, dict(doc_type="Test")).save(count=1)
+    with pytest.raises(ValueError):
+        Checkpoint(destination, dict(doc_type="Other")).load()
@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from yaada.core.infrastructure import columnar  # noqa: E402
+
+document_schema = {
+    "properties": {
+        "doc_type": {"type": "string"},
+        "id": {"type": "string"},
+        "count": {"type": "integer"},
+        "score": {"type": "number"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "author": {"type": "object"},
+        "published": {"type": "string", "format": "date-time"},
+    }
+}
+
+
+def roundtrip(docs, tmp_path, columns=None, fields=None):
+    schema = columnar.arrow_schema(document_schema)
+    path = str(tmp_path / "docs.parquet")
+    pq.write_table(columnar.docs_to_table(docs, schema), path)
+    table = pq.read_table(path, columns=columns)
+    return list(columnar.rows_to_docs(table.to_pylist(), pq.read_schema(path), fields))
+
+
+def test_arrow_schema_types():
+    schema = columnar.arrow_schema(document_schema)
+    assert schema.field("count").type == pa.int64()
+    assert schema.field("score").type == pa.float64()
+    assert schema.field("tags").type == pa.list_(pa.string())
+    assert schema.field("author").type == pa.string()
+    assert pa.types.is_timestamp(schema.field("published").type)
+    assert schema.field(columnar.EXTRA_COLUMN).type == pa.string()
+    assert columnar.schema_columns(schema, columnar.JSON_COLUMNS_METADATA) == [
+        "author"
+    ]
+
+
+def test_documents_roundtrip(tmp_path):
+    docs = [
+        dict(
+            doc_type="Test",
+            id="1",
+            count=3,
+            score=0.5,
+            tags=["a", "b"],
+            author=dict(name="x", refs=[1, 2]),
+            published="2020-01-01T00:00:00+00:00",
+            unknown=dict(nested=True),
+        ),
+        dict(doc_type="Test", id="2", count="not a number"),
+    ]
+    assert roundtrip(docs, tmp_path) == docs
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2020-01-01T00:00:00Z",
+        "2020-01-01T00:00:00",
+        "2020-01-01T05:00:00+05:00",
+        "2020-01-01T00:00:00.123456789Z",
+        "2020-01-01T00:00:00.123000",
+        "not a date",
+    ],
+)
+def test_date_time_strings_are_preserved(tmp_path, value):
+    docs = [dict(doc_type="Test", id="1", published=value)]
+    assert roundtrip(docs, tmp_path) == docs
+
+
+def test_naive_datetime_is_utc(tmp_path):
+    docs = [dict(doc_type="Test", id="1", published=datetime.datetime(2020, 1, 1))]
+    table = columnar.docs_to_table(docs, columnar.arrow_schema(document_schema))
+    stored = table.column("published").to_pylist()[0]
+    assert stored == datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    assert roundtrip(docs, tmp_path)[0]["published"] == "2020-01-01T00:00:00"
+
+
+def test_projection_only_returns_projected_fields(tmp_path):
+    docs = [
+        dict(
+            doc_type="Test",
+            id="1",
+            count=1,
+            published="2020-01-01T00:00:00Z",
+            unknown="x",
+        )
+    ]
+    projected = roundtrip(
+        docs,
+        tmp_path,
+        columns=["doc_type", "id", "published", columnar.EXTRA_COLUMN],
+        fields={"doc_type", "id", "published"},
+    )
+    assert projected == [
+        dict(doc_type="Test", id="1", published="2020-01-01T00:00:00Z")
+    ]
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from yaada.core.infrastructure.compression import (
+    compress_block,
+    compression_for_filename,
+    decompress_block,
+    open_compressed_reader,
+    open_compressed_writer,
+)
+
+compressions = [None, "gzip"]
+try:
+    import zstandard  # noqa: F401
+
+    compressions.append("zstd")
+except ImportError:
+    pass
+
+
+def test_compression_for_filename():
+    assert compression_for_filename("export.ldjson") is None
+    assert compression_for_filename("export.ldjson.gz") == "gzip"
+    assert compression_for_filename("archive.tgz") == "gzip"
+    assert compression_for_filename("export.ldjson.zst") == "zstd"
+    assert compression_for_filename("archive.tzst") == "zstd"
+
+
+@pytest.mark.parametrize("compression", compressions[1:])
+def test_concatenated_blocks(compression):
+    blocks = [compress_block(b"a\n" * i, compression) for i in range(1, 4)]
+    assert decompress_block(blocks[1], compression) == b"a\na\n"
+    with open_compressed_reader(io.BytesIO(b"".join(blocks)), compression) as r:
+        assert r.read() == b"a\n" * 6
+
+
+@pytest.mark.parametrize("compression", compressions)
+def test_stream_roundtrip_leaves_file_open(compression):
+    data = b"".join(b'{"id": "%d"}\n' % i for i in range(1000))
+    f = io.BytesIO()
+    with open_compressed_writer(f, compression, level=1) as w:
+        w.write(data)
+    assert not f.closed
+    f.seek(0)
+    with open_compressed_reader(f, compression) as r:
+        assert io.BufferedReader(r).read() == data
+    assert not f.closed
+
+
+def test_unsupported_compression():
+    with pytest.raises(ValueError):
+        compress_block(b"", "lz4")
+    with pytest.raises(ValueError):
+        open_compressed_writer(io.BytesIO(), "lz4")
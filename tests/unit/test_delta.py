@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from yaada.core.infrastructure.migration import TOMBSTONE_FIELD, MigrationContextPlugin
+
+
+class RecordingContext:
+    # records what load_ldjson_delta sends, in order
+    def __init__(self):
+        self.calls = []
+
+    def update(self, docs, **kwargs):
+        self.calls.append(
+            ("update", [(d["id"], d.get("_ingest_sentinel")) for d in docs])
+        )
+
+    def ingest_barrier(self, doc_type, id, timeout, sentinel_key, sentinel_value):
+        self.calls.append(("wait", (id, sentinel_value)))
+
+    def delete(self, doc_type, id, missing_ok=False):
+        self.calls.append(("delete", id))
+
+
+def write_delta(path, entries):
+    with open(path, "w") as f:
+        for entry in entries:
+            if entry.startswith("-"):
+                doc = {"doc_type": "Test", "id": entry[1:], TOMBSTONE_FIELD: True}
+            else:
+                doc = {"doc_type": "Test", "id": entry}
+            f.write(json.dumps(doc) + "\n")
+
+
+def load(tmp_path, entries, **kwargs):
+    path = str(tmp_path / "delta.ldjson")
+    write_delta(path, entries)
+    context = RecordingContext()
+    migration = MigrationContextPlugin()
+    migration.register(context)
+    result = migration.load_ldjson_delta(path, **kwargs)
+    return result, context.calls
+
+
+def test_sync_applies_in_file_order(tmp_path):
+    result, calls = load(tmp_path, ["1", "2", "-1", "3"], batch_size=10)
+    assert result == (3, 1)
+    assert calls == [
+        ("update", [("1", None), ("2", None)]),
+        ("delete", "1"),
+        ("update", [("3", None)]),
+    ]
+
+
+def test_async_tombstone_waits_for_its_update_in_an_earlier_batch(tmp_path):
+    result, calls = load(
+        tmp_path, ["1", "2", "3", "4", "5", "-2", "-9"], sync=False, batch_size=2
+    )
+    assert result == (5, 2)
+    sent = {id: sentinel for op, arg in calls if op == "update" for id, sentinel in arg}
+    assert calls[-3:] == [
+        ("wait", ("2", sent["2"])),
+        ("delete", "2"),
+        ("delete", "9"),
+    ]
+    # only the deleted document is waited on
+    assert [arg for op, arg in calls if op == "wait"] == [("2", sent["2"])]
+
+
+@pytest.mark.parametrize("batch_size", [1, 10])
+def test_async_repeated_update_waits_for_the_previous_one(tmp_path, batch_size):
+    _, calls = load(tmp_path, ["1", "2", "1"], sync=False, batch_size=batch_size)
+    first = calls[0][1][0][1]
+    wait = calls.index(("wait", ("1", first)))
+    last_update = max(i for i, (op, _) in enumerate(calls) if op == "update")
+    assert wait < last_update
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+from collections import Counter
+
+from genson import SchemaBuilder
+
+from yaada.core import utility
+from yaada.core.schema import inference
+
+
+def test_reservoir_keeps_a_uniform_sample():
+    rng = random.Random(0)
+    counts = Counter()
+    for _ in range(2000):
+        reservoir = inference.Reservoir(10, rng)
+        for i in range(100):
+            reservoir.add(i)
+        assert reservoir.seen == 100
+        assert len(reservoir.items) == len(set(reservoir.items)) == 10
+        counts.update(reservoir.items)
+    # each item is kept with probability 10/100, 200 times out of 2000 runs
+    assert min(counts.values()) > 140
+    assert max(counts.values()) < 260
+
+
+def test_stratified_sample_keeps_rare_doc_types():
+    docs = [dict(doc_type="Common", i=i) for i in range(1000)]
+    docs.insert(500, dict(doc_type="Rare", i=0))
+    sample = inference.sample_documents(docs, 5, stratify=True, seed=1)
+    assert Counter(d["doc_type"] for d in sample) == dict(Common=5, Rare=1)
+    assert inference.sample_documents(docs, 5, stratify=True, seed=1) == sample
+
+
+def test_sample_is_the_whole_stream_when_it_is_small():
+    assert inference.sample_documents(range(3), 5) == [0, 1, 2]
+
+
+def write_ldjson(path, n):
+    with open(path, "w") as f:
+        for i in range(n):
+            doc = dict(doc_type="A" if i % 10 else "B", id=str(i))
+            if i % 7 == 0:
+                doc["extra"] = i
+            if i == n - 1:
+                doc["last"] = True
+            f.write(json.dumps(doc) + "\n")
+
+
+def test_chunked_inference_matches_a_single_pass(tmp_path):
+    path = str(tmp_path / "docs.ldjson")
+    write_ldjson(path, 500)
+    expected = SchemaBuilder()
+    with open(path) as f:
+        for doc in inference.parse_ldjson_lines(f):
+            expected.add_object(doc)
+
+    for processes in [1, 2]:
+        builder = inference.infer_schema_from_ldjson(
+            path, processes=processes, chunk_size=1024
+        )
+        assert builder.to_schema() == expected.to_schema()
+
+
+def test_sampled_inference_spreads_the_sample_over_chunks(tmp_path):
+    path = str(tmp_path / "docs.ldjson")
+    write_ldjson(path, 500)
+    total = os.path.getsize(path)
+    sizes = [
+        inference.chunk_sample_size(50, start, end, total)
+        for start, end in utility.line_aligned_byte_ranges(path, 1024)
+    ]
+    assert len(sizes) > 1 and all(size >= 1 for size in sizes)
+    assert 50 <= sum(sizes) < 50 + len(sizes)
+
+    schema = inference.infer_schema_from_ldjson(
+        path, sample_size=50, stratify=True, processes=1, chunk_size=1024, seed=0
+    ).to_schema()
+    assert set(schema["properties"]) >= {"doc_type", "id"}
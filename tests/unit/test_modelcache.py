@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from yaada.core.infrastructure.modelcache import (
+    CacheFullError,
+    ModelCache,
+    ModelDiskCache,
+)
+
+
+def test_byte_budget_evicts_least_recently_used():
+    evicted = []
+    cache = ModelCache(10, callback=lambda k, v: evicted.append(k), max_bytes=100)
+    cache.put("a", "A", nbytes=40)
+    cache.put("b", "B", nbytes=40)
+    assert cache.lookup("a") == "A"
+    cache.put("c", "C", nbytes=40)
+
+    assert evicted == ["b"]
+    assert sorted(cache.keys()) == ["a", "c"]
+    assert cache.total_bytes == 80
+
+
+def test_unevictable_models_are_kept_over_budget():
+    cache = ModelCache(10, max_bytes=100)
+    cache.put("a", "A", nbytes=80)
+    cache.mark_unevictable("a")
+    cache.put("b", "B", nbytes=80)
+
+    # the new model is never the one dropped to make room
+    assert sorted(cache.keys()) == ["a", "b"]
+    assert cache.total_bytes == 160
+    cache.put("c", "C", nbytes=10)
+    assert sorted(cache.keys()) == ["a", "c"]
+
+
+def test_entry_count_still_bounds_the_cache():
+    cache = ModelCache(2)
+    cache.put("a", "A", nbytes=10)
+    cache.mark_unevictable("a")
+    cache.put("b", "B", nbytes=10)
+    cache.put("c", "C", nbytes=10)
+    assert sorted(cache.keys()) == ["a", "c"]
+    assert cache.total_bytes == 20
+
+    cache.mark_unevictable("c")
+    with pytest.raises(CacheFullError):
+        cache.put("d", "D")
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = ModelCache(10, max_bytes=100)
+    cache.put("a", "A", nbytes=60)
+    cache.put("a", "A2", nbytes=30)
+    assert cache.nbytes("a") == 30
+    assert cache.total_bytes == 30
+    del cache["a"]
+    assert cache.total_bytes == 0
+
+
+def test_stats():
+    cache = ModelCache(3, max_bytes=100)
+    cache.put("a", "A", nbytes=60)
+    cache.put("b", "B", nbytes=10)
+    cache.mark_unevictable("b")
+    cache.lookup("a")
+    cache.lookup("missing")
+    cache.put("c", "C", nbytes=60)
+    assert cache.stats() == dict(
+        entries=2,
+        size=3,
+        bytes=70,
+        max_bytes=100,
+        hits=1,
+        misses=1,
+        evictions=1,
+        unevictable=["b"],
+    )
+
+
+def populate_with(nbytes, calls=None):
+    def populate(entry):
+        if calls is not None:
+            calls.append(entry)
+        os.makedirs(entry, exist_ok=True)
+        with open(os.path.join(entry, "model.bin"), "wb") as f:
+            f.write(b"x" * nbytes)
+
+    return populate
+
+
+def lock_files(disk_cache):
+    return set(os.listdir(disk_cache.lock_dir))
+
+
+def test_disk_tier_populates_once(tmp_path):
+    disk_cache = ModelDiskCache(str(tmp_path))
+    calls = []
+    with disk_cache.use("Model/a", "v1", populate_with(10, calls)) as entry:
+        assert os.path.getsize(os.path.join(entry, "model.bin")) == 10
+    with disk_cache.use("Model/a", "v1", populate_with(10, calls)) as again:
+        assert again == entry
+    assert calls == [entry]
+    assert (disk_cache.hits, disk_cache.misses) == (1, 1)
+    assert disk_cache.stats()["bytes"] == 10
+
+
+def test_disk_tier_drops_stale_versions(tmp_path):
+    disk_cache = ModelDiskCache(str(tmp_path))
+    old = disk_cache.fill("Model/a", "v1", populate_with(10))
+    new = disk_cache.fill("Model/a", "v2", populate_with(10))
+    assert not os.path.exists(old)
+    assert [e for e, _, _ in disk_cache.entries()] == [new]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    disk_cache = ModelDiskCache(str(tmp_path), max_bytes=25)
+    a = disk_cache.fill("Model/a", "v1", populate_with(10))
+    os.utime(os.path.join(a, ModelDiskCache.COMPLETE), (1, 1))
+    b = disk_cache.fill("Model/b", "v1", populate_with(10))
+    c = disk_cache.fill("Model/c", "v1", populate_with(10))
+
+    assert not os.path.exists(a)
+    assert os.path.exists(b) and os.path.exists(c)
+    assert disk_cache.evictions == 1
+    # the evicted entry's lock file goes with it
+    assert os.path.basename(disk_cache._lock_path(a)) not in lock_files(disk_cache)
+
+
+def test_disk_tier_keeps_an_entry_in_use(tmp_path):
+    disk_cache = ModelDiskCache(str(tmp_path), max_bytes=15)
+    with disk_cache.use("Model/a", "v1", populate_with(10)) as a:
+        os.utime(os.path.join(a, ModelDiskCache.COMPLETE), (1, 1))
+        b = disk_cache.fill("Model/b", "v1", populate_with(10))
+        # a model is loading from a, so it stays until the load is done
+        assert os.path.isfile(os.path.join(a, "model.bin"))
+        assert os.path.exists(b)
+        assert disk_cache.evictions == 0
+    disk_cache.evict()
+    assert not os.path.exists(a)
+    assert os.path.exists(b)
@@ -0,0 +1,149 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from yaada.core.analytic.model import ModelBase
+from yaada.core.infrastructure.modelmanager import ModelManager
+
+
+class Model:
+    pass
+
+
+class TextModel(ModelBase):
+    def __init__(self, instance_id, text=""):
+        super().__init__(instance_id)
+        self.text = text
+
+    def save_artifacts(self, path):
+        text_dir = self.make_artifact_dir(path, "text")
+        with open(os.path.join(text_dir, "t.txt"), "w") as f:
+            f.write(self.text)
+
+    def load_artifacts(self, path):
+        with open(os.path.join(self.get_artifact_dir(path, "text"), "t.txt")) as f:
+            self.text = f.read()
+
+
+def make_config(tmp_path):
+    return SimpleNamespace(
+        yaada_model_cache_size=10,
+        yaada_model_cache_max_bytes=None,
+        yaada_models_archive_format="tar",
+        yaada_models_directory=str(tmp_path / "models"),
+        yaada_models_mmap=False,
+        yaada_models_max_bytes=None,
+        yaada_models_reload_on_update=False,
+    )
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ModelManager(make_config(tmp_path), None)
+
+
+class BlockingLoad:
+    # stands in for _load_model_instance, each load waits until released
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, model_clazz, model_instance_id, local_path, archive):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return Model(), 10
+
+
+def test_concurrent_loads_of_a_model_share_one_load(manager):
+    load = manager._load_model_instance = BlockingLoad()
+    with ThreadPoolExecutor(4) as pool:
+        futures = [
+            pool.submit(manager.load_model_instance, Model, "1") for _ in range(4)
+        ]
+        assert load.started.wait(5)
+        load.release.set()
+        models = [f.result(5) for f in futures]
+
+    assert load.calls == 1
+    assert all(model is models[0] for model in models)
+    assert manager.loading == {}
+    assert manager.load_model_instance(Model, "1") is models[0]
+    assert load.calls == 1
+
+
+def test_invalidation_during_a_load_discards_its_result(manager):
+    load = manager._load_model_instance = BlockingLoad()
+    with ThreadPoolExecutor(1) as pool:
+        future = pool.submit(manager.load_model_instance, Model, "1")
+        assert load.started.wait(5)
+        manager.invalidate_model_instance(Model, "1")
+        load.release.set()
+        stale = future.result(5)
+
+    # the caller still gets the stale model, but it isn't cached
+    assert isinstance(stale, Model)
+    assert "Model/1" not in manager.cache
+    assert manager.load_model_instance(Model, "1") is not stale
+    assert load.calls == 2
+
+
+def test_a_failed_load_reaches_every_waiter(manager):
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing_load(*args):
+        started.set()
+        assert release.wait(5)
+        raise IOError("object storage is down")
+
+    manager._load_model_instance = failing_load
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(manager.load_model_instance, Model, "1")
+        assert started.wait(5)
+        second = pool.submit(manager.load_model_instance, Model, "1")
+        release.set()
+        for future in [first, second]:
+            with pytest.raises(IOError):
+                future.result(5)
+    assert manager.loading == {}
+
+
+class RecordingContext:
+    # keeps the documents it's given and records writes and events in order
+    def __init__(self, ob_service):
+        self.ob_service = ob_service
+        self.msg_service = self
+        self.subscriptions = None
+        self.docs = {}
+        self.calls = []
+
+    def update(self, doc, process=False, barrier=False):
+        self.docs[(doc["doc_type"], doc["_id"])] = doc
+        self.calls.append(("update", barrier))
+
+    def get(self, doc_type, id):
+        return self.docs.get((doc_type, id))
+
+    def publish_event(self, topic, data, qos=0):
+        self.calls.append(("publish", topic))
+
+
+def test_model_updates_are_published_once_the_document_is_searchable(
+    object_storage, tmp_path
+):
+    context = RecordingContext(object_storage)
+    manager = ModelManager(make_config(tmp_path / "a"), context)
+    manager.save_model_instance(TextModel("1", "hello"))
+    assert context.calls == [
+        ("update", True),
+        ("publish", "model/updated/TextModel/1"),
+    ]
+
+    # a receiver reloads the model from the saved document
+    receiver = ModelManager(make_config(tmp_path / "b"), context)
+    assert receiver.load_model_instance(TextModel, "1").text == "hello"
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+from yaada.core.infrastructure.providers.mqtt import MQTTProvider
+
+DOCS = [
+    {"doc_type": "A", "_id": "1"},
+    {"doc_type": "B", "_id": "2"},
+    {"doc_type": "A", "_id": "3"},
+]
+
+
+@pytest.fixture
+def provider():
+    sent = []
+    received = []
+    provider = SimpleNamespace(
+        _config=SimpleNamespace(mqtt_sinklog_batches=False),
+        _sinklog_topic="yaada/default/sinklog",
+        _send_msg=lambda msg, **kwargs: sent.append(msg),
+        subscriptions=SimpleNamespace(put=received.append),
+        sent=sent,
+        received=received,
+    )
+    provider.sinklog_topic = lambda doc: MQTTProvider.sinklog_topic(provider, doc)
+    provider.publish_sinklog = lambda doc: MQTTProvider.publish_sinklog(provider, doc)
+    return provider
+
+
+def test_sinklog_documents_are_published_one_by_one_by_default(provider):
+    MQTTProvider.publish_sinklog_batch(provider, DOCS)
+    assert [msg.key for msg in provider.sent] == [
+        "yaada/default/sinklog/A/1",
+        "yaada/default/sinklog/B/2",
+        "yaada/default/sinklog/A/3",
+    ]
+    assert [msg.jsondata for msg in provider.sent] == DOCS
+
+
+def test_batches_are_published_per_doc_type(provider):
+    provider._config.mqtt_sinklog_batches = True
+    MQTTProvider.publish_sinklog_batch(provider, DOCS)
+    assert [msg.key for msg in provider.sent] == [
+        "yaada/default/sinklog/A/_batch",
+        "yaada/default/sinklog/B/_batch",
+    ]
+
+    for msg in provider.sent:
+        MQTTProvider._incoming_message(provider, msg)
+    assert sorted(doc["_topic"] for doc in provider.received) == [
+        "yaada/default/sinklog/A/1",
+        "yaada/default/sinklog/A/3",
+        "yaada/default/sinklog/B/2",
+    ]
@@ -0,0 +1,50 @@
+import io
+import os
+
+
+def saved_doc(object_storage, files):
+    doc = dict(doc_type="Test", _id="1")
+    for filename, data in files.items():
+        object_storage.save_artifact(doc, "model", filename, io.BytesIO(data))
+    return doc
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_fetch_artifact_to_directory_refreshes_stale_files(object_storage, tmp_path):
+    doc = saved_doc(object_storage, {"a.txt": b"first"})
+    cache_dir = str(tmp_path / "artifacts")
+
+    local_path = object_storage.fetch_artifact_to_directory(doc, "model", cache_dir)
+    assert local_path == os.path.join(cache_dir, "Test", "1", "model")
+    assert read(os.path.join(local_path, "a.txt")) == b"first"
+
+    object_storage.save_artifact(doc, "model", "a.txt", io.BytesIO(b"second"))
+    object_storage.fetch_artifact_to_directory(doc, "model", cache_dir)
+    assert read(os.path.join(local_path, "a.txt")) == b"second"
+
+
+def test_fetch_artifacts_to_directory_returns_each_directory(object_storage, tmp_path):
+    doc = saved_doc(object_storage, {"a.txt": b"a"})
+    object_storage.save_artifact(doc, "raw", "b.txt", io.BytesIO(b"b"))
+    cache_dir = str(tmp_path / "artifacts")
+
+    paths = object_storage.fetch_artifacts_to_directory(doc, cache_dir)
+    assert sorted(paths) == ["model", "raw"]
+    assert read(os.path.join(paths["raw"], "b.txt")) == b"b"
+
+
+def test_artifact_directory_is_removed_on_exit(object_storage, s3):
+    doc = saved_doc(object_storage, {"a.txt": b"a", "b.txt": b"b"})
+
+    with object_storage.artifact_directory(doc, "model") as local_path:
+        assert sorted(os.listdir(local_path)) == ["a.txt", "b.txt"]
+        object_storage.artifact_cache.clear()
+        assert read(os.path.join(local_path, "a.txt")) == b"a"
+    assert not os.path.exists(local_path)
+
+    with object_storage.artifact_directory(doc, "missing") as local_path:
+        assert local_path is None
@@ -0,0 +1,47 @@
+import os
+
+from yaada.core.analytic.context import AnalyticContext
+from yaada.core.analytic.preload import preload
+from yaada.core.config import YAADAConfig
+
+
+class WritingPipeline:
+    # a pipeline whose processor writes through the context
+    document_pipelines = {"Test": []}
+
+    def __init__(self, context, ready_file):
+        self.context = context
+        self.ready_file = ready_file
+        self.ready_during_warmup = []
+
+    def process_document(self, doc):
+        self.ready_during_warmup.append(os.path.exists(self.ready_file))
+        self.context.set_analytic_name("WritingProcessor")
+        # there are no services to write to, so these fail unless dropped
+        self.context.update(dict(doc_type="Other", id="1"))
+        self.context.delete("Test", doc["id"])
+        return doc
+
+
+def test_preload_warms_up_without_writing(tmp_path):
+    ready_file = str(tmp_path / "ready")
+    with open(ready_file, "w") as f:
+        f.write("left over from a previous run\n")
+
+    config = YAADAConfig()
+    config.yaada_models_preload_models = []
+    config.yaada_models_preload_spacy = []
+    config.yaada_models_warmup = True
+    config.yaada_models_ready_file = ready_file
+    context = AnalyticContext("test", "0", {}, config=config, connect_to_services=False)
+    pipeline = WritingPipeline(context, ready_file)
+    context._document_pipeline = pipeline
+    context.get_model_manager = lambda: None
+
+    preload(context)
+
+    assert pipeline.ready_during_warmup == [False]
+    assert os.path.exists(ready_file)
+    assert context.ready.is_set()
+    assert not context.warming_up
+    assert context.analytic_name == "test"
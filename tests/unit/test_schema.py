@@ -0,0 +1,87 @@
+import pytest
+from jsonschema.exceptions import ValidationError
+
+from yaada.core.config import YAADAConfig
+from yaada.core.schema.schema import FastValidator, SchemaManager
+
+SCHEMA = dict(
+    type="object",
+    properties=dict(
+        name=dict(type="string", minLength=1),
+        count=dict(type="integer", minimum=0, nullable=True),
+        tags=dict(type="array", items=dict(type="string")),
+    ),
+    required=["name"],
+)
+
+
+def make_manager(tmp_path, fast_validation=False):
+    config = YAADAConfig()
+    config.schema_directory = str(tmp_path)
+    config.schema_fast_validation = fast_validation
+    manager = SchemaManager(config)
+    manager.update_doc_type_schema("Test", schema=SCHEMA)
+    return manager
+
+
+def test_validators_are_compiled_once_per_schema(tmp_path):
+    manager = make_manager(tmp_path)
+    validator = manager.get_validator("Test")
+    manager.validate_document(dict(doc_type="Test", name="a"))
+    assert manager.get_validator("Test") is validator
+
+    manager.update_doc_type_schema("Test", schema=dict(required=["tags"]))
+    assert manager.get_validator("Test") is not validator
+    with pytest.raises(ValidationError, match="'tags' is a required property"):
+        manager.validate_document(dict(doc_type="Test", name="a"))
+
+
+def test_validate_documents_aligns_errors_with_documents(tmp_path):
+    manager = make_manager(tmp_path)
+    errors = manager.validate_documents(
+        [
+            dict(doc_type="Test", name="a"),
+            dict(doc_type="Test", name=""),
+            dict(doc_type="Test", name="b", count=-1),
+        ]
+    )
+    assert errors[0] is None
+    assert list(errors[1].path) == ["name"]
+    assert list(errors[2].path) == ["count"]
+
+
+DOCS = [
+    dict(doc_type="Test", name="a"),
+    dict(doc_type="Test", name="a", count=None, tags=["x"]),
+    dict(doc_type="Test"),
+    dict(doc_type="Test", name=""),
+    dict(doc_type="Test", name="a", count=-1),
+    dict(doc_type="Test", name="a", count="1"),
+    dict(doc_type="Test", name="a", tags=["x", 1]),
+    dict(doc_type="Test", name=None),
+]
+
+
+def describe(error):
+    return None if error is None else (error.message, list(error.path))
+
+
+def test_fast_validation_reports_the_same_errors(tmp_path):
+    pytest.importorskip("fastjsonschema")
+    manager = make_manager(tmp_path)
+    fast_manager = make_manager(tmp_path, fast_validation=True)
+    assert isinstance(fast_manager.get_validator("Test"), FastValidator)
+
+    expected = [describe(e) for e in manager.validate_documents(DOCS)]
+    assert [describe(e) for e in fast_manager.validate_documents(DOCS)] == expected
+    assert [e is None for e in expected] == [True, True] + [False] * 6
+
+
+def test_openapi_only_keywords_keep_the_openapi_validator(tmp_path):
+    pytest.importorskip("fastjsonschema")
+    manager = make_manager(tmp_path, fast_validation=True)
+    manager.update_doc_type_schema(
+        "Test", schema=dict(properties=dict(name=dict(type="string", readOnly=True)))
+    )
+    assert not isinstance(manager.get_validator("Test"), FastValidator)
+    manager.validate_document(dict(doc_type="Test", name="a"))
@@ -0,0 +1,46 @@
+import pytest
+
+from yaada.core.infrastructure import sinklog
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_write_and_replay(tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    writer = sinklog.SinklogWriter(
+        str(tmp_path), compression=compression, flush_bytes=200
+    )
+    for i in range(20):
+        writer.append(
+            {
+                "doc_type": "A" if i % 2 else "B",
+                "_id": str(i),
+                "@timestamp": f"2020-01-01T00:00:{i:02d}",
+            }
+        )
+    writer.close()
+
+    segments = sinklog.list_segments(str(tmp_path))
+    assert len(segments) == 1
+    index = list(sinklog.read_index(str(tmp_path), segments[0]))
+    assert len(index) == 20
+    assert len(set(e["offset"] for e in index)) > 1
+
+    ids = [d["_id"] for d in sinklog.replay(str(tmp_path))]
+    assert ids == [str(i) for i in range(20)]
+
+    replayed = sinklog.replay(
+        str(tmp_path),
+        start="2020-01-01T00:00:05Z",
+        end="2020-01-01T00:00:10",
+        doc_types=["A"],
+    )
+    assert [d["_id"] for d in replayed] == ["5", "7", "9"]
+
+
+def test_new_writer_starts_a_new_segment(tmp_path):
+    for _ in range(2):
+        writer = sinklog.SinklogWriter(str(tmp_path))
+        writer.append({"doc_type": "A", "_id": "1"})
+        writer.close()
+    assert len(sinklog.list_segments(str(tmp_path))) == 2
@@ -0,0 +1,36 @@
+import pytest
+
+from yaada.core.utility import line_aligned_byte_ranges
+from yaada.core.utility import read_byte_range_lines as read_lines
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 50, 10000])
+def test_line_aligned_byte_ranges(tmp_path, chunk_size):
+    path = str(tmp_path / "docs.ldjson")
+    lines = [f'{{"id": "{i}", "text": "{"x" * i}"}}\n'.encode() for i in range(40)]
+    with open(path, "wb") as f:
+        f.write(b"".join(lines))
+
+    ranges = line_aligned_byte_ranges(path, chunk_size)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == sum(len(line) for line in lines)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+
+    read = [line for start, end in ranges for line in read_lines(path, start, end)]
+    assert read == lines
+
+
+def test_last_line_without_newline(tmp_path):
+    path = str(tmp_path / "docs.ldjson")
+    with open(path, "wb") as f:
+        f.write(b"a\nbb\nccc")
+    ranges = line_aligned_byte_ranges(path, 3)
+    read = [line for start, end in ranges for line in read_lines(path, start, end)]
+    assert read == [b"a\n", b"bb\n", b"ccc"]
+
+
+def test_empty_file(tmp_path):
+    path = str(tmp_path / "empty.ldjson")
+    open(path, "wb").close()
+    assert line_aligned_byte_ranges(path, 10) == []